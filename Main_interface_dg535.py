@@ -1,13 +1,55 @@
+import os
+import sys
 import tkinter as tk
-import subprocess
 from tkinter import messagebox
 
+# The interfaces live in utils/ and import each other as top level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "utils"))
+import dg535_session
+from dg535_startup import timed_import
+
+# The views are built once, hidden, then only shown again: switching takes milliseconds
+views = {}
+
+
 def run_script_a():
-    subprocess.run(["python", "utils/Interfacedg535.py"])
+    """
+    Show the simplified interface, hosted in this process on the shared session.
+    """
+    if "simplified" not in views:
+        # the module builds its window when imported
+        views["simplified"] = timed_import("Interfacedg535")
+    views["simplified"].show()
 
 
 def run_script_b():
-    subprocess.run(["python", "utils/prova_dg535_interfaccia.py"])
+    """
+    Show the fine-tuning interface (the Tk one of dg535_TKinter_new.py), hosted on the shared session.
+    """
+    if "fine-tuning" not in views:
+        dg535_TKinter_new = timed_import("dg535_TKinter_new")
+        toplevel = tk.Toplevel(window)
+        toplevel.title("DG535 Working Interface")
+        toplevel.geometry("400x600")
+        toplevel.protocol("WM_DELETE_WINDOW", toplevel.withdraw)
+        dg535_TKinter_new.WorkingInterface(toplevel, session=session).pack(fill='both', expand=True)
+        views["fine-tuning"] = toplevel
+    views["fine-tuning"].deiconify()
+    views["fine-tuning"].lift()
+
+
+def update_connection_status(dg535):
+    if dg535:
+        connection_status_label.config(text=f"Connected to {dg535.address}", bg="green", fg="white")
+    else:
+        connection_status_label.config(text="Not Connected", bg="red", fg="white")
+
+
+def warm_up():
+    """
+    Import the plotting stack while the hub is idle, so the first view opens without waiting for it.
+    """
+    timed_import("dg535_plot")
 
 
 
@@ -21,6 +63,7 @@ def show_help():
 
         "Choose the first interface for a simpler workflow\n"
         "Choose the fine tune interface in case a more detailed control of the pulse generator is needed\n"
+        "Both interfaces run in this window's process and share its connection to the DG535.\n"
     )
     messagebox.showinfo("Help", help_message)
 
@@ -54,6 +97,15 @@ button_a.pack(pady=20)
 button_b = tk.Button(window, text="Run fine-tuning interface", command=run_script_b)
 button_b.pack(pady=20)
 
+connection_status_label = tk.Label(window, text="Checking connection...", bg="gray", fg="white", width=30, height=2)
+connection_status_label.pack(pady=20)
+
+# One I/O worker, hence one VISA session, for every view; connected once the hub is drawn
+session = dg535_session.start(window)
+session.listeners.append(update_connection_status)
+window.after_idle(session.connect)
+window.after(500, warm_up)
+
 # Start the Tkinter event loop
 window.mainloop()
 
@@ -0,0 +1,44 @@
+"""
+The tests run against the simulated DG535 (utils/dg535_simulator.py), no GPIB card needed:
+
+    python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+# the modules of utils import each other as top-level modules
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "utils"))
+
+from dg535_driver import DG535, DG535State
+from dg535_simulator import SimulatedResourceManager
+
+
+def setting(trigger_mode=1, trigger_rate=1000.0, trigger_slope=0, **delays):
+    """A DG535State with A, B, C, D referred to T0 at 1, 2, 3, 4 us unless given as (reference, delay)."""
+    state = DG535State()
+    state.trigger_mode, state.trigger_rate, state.trigger_slope = trigger_mode, trigger_rate, trigger_slope
+    state.delays = {2: (1, 1e-6), 3: (1, 2e-6), 5: (1, 3e-6), 6: (1, 4e-6)}
+    state.delays.update({{"A": 2, "B": 3, "C": 5, "D": 6}[name]: value for name, value in delays.items()})
+    return state
+
+
+@pytest.fixture
+def rm():
+    return SimulatedResourceManager()
+
+
+@pytest.fixture
+def dg535(rm):
+    """A driver connected to a simulated DG535 in its default settings, already read."""
+    dg535 = DG535(rm=rm).connect()
+    dg535.refresh()
+    yield dg535
+    dg535.close()
+
+
+@pytest.fixture
+def device(dg535):
+    """The simulated instrument behind the dg535 fixture, to check what it really holds."""
+    return dg535.resource
@@ -0,0 +1,38 @@
+import asyncio
+import threading
+
+import pytest
+
+from dg535_async import AsyncDG535
+
+
+def test_calls_run_on_the_worker(rm):
+    async def main():
+        async with await AsyncDG535.open(rm=rm, timeout=5) as dg:
+            assert await dg.set_delay(3, 5e-6)
+            state = await dg.refresh()
+            replies = await dg.batch(lambda dg535, batch: batch.query("TM"))
+            return state, replies
+    state, replies = asyncio.run(main())
+    assert state.delays[3] == (1, 5e-6)
+    assert len(replies) == 1
+    assert rm.instruments["GPIB0::15::INSTR"].closed
+
+
+def test_timeout_leaves_the_running_call_alone(dg535):
+    release = threading.Event()
+
+    def slow(dg535):
+        release.wait(5)
+        return "done"
+
+    async def main():
+        dg = AsyncDG535(dg535, timeout=0.05)
+        with pytest.raises(asyncio.TimeoutError):
+            await dg.run(slow, dg535)
+        release.set()
+        # the worker finished the slow call, the next one runs normally
+        result = await dg.run(slow, dg535, timeout=5)
+        dg._executor.shutdown(wait=True)
+        return result
+    assert asyncio.run(main()) == "done"
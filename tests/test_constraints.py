@@ -0,0 +1,56 @@
+import pytest
+
+from conftest import setting
+from dg535_constraints import DelayGraph
+from dg535_driver import DG535Error
+
+
+def graph(trigger_rate=1000.0, **delays):
+    """The delays of setting() as a DelayGraph."""
+    return DelayGraph(setting(**delays).delays, trigger_rate)
+
+
+def test_absolute_times_follow_the_references():
+    delays = graph(B=(2, 1.5e-6), D=(5, 0.5e-6))
+    assert delays.absolute_time(3) == pytest.approx(2.5e-6)
+    assert delays.absolute_time(6) == pytest.approx(3.5e-6)
+    assert delays.violations() == []
+
+
+def test_loop_is_rejected():
+    with pytest.raises(DG535Error):
+        graph(A=(3, 1e-6), B=(2, 1e-6))
+    trial, problems = graph(B=(2, 1e-6)).what_if({2: (3, 1e-6)})
+    assert trial is None
+    assert "loop" in problems[0]
+
+
+def test_referred_channels_move_with_their_reference():
+    delays = graph(B=(2, 1e-6))
+    trial, problems = delays.what_if({2: (1, 2.5e-6)})
+    assert trial.absolute_time(3) == pytest.approx(3.5e-6)
+    assert problems == ["Channel B delay is more than channel C delay"]
+    _, problems = delays.what_if({2: (1, 2.5e-6)}, ordered=False)
+    assert problems == []
+
+
+def test_changes_are_judged_together():
+    # B referred to A becomes the reference of A: invalid one at a time, valid together
+    delays = graph(B=(2, 1e-6))
+    trial, problems = delays.what_if({2: (3, -1e-6), 3: (1, 2.5e-6)})
+    assert problems == []
+    assert trial.absolute_time(2) == pytest.approx(1.5e-6)
+
+
+def test_before_t0_and_out_of_range():
+    _, problems = graph().what_if({2: (1, -1e-6)}, ordered=False)
+    assert problems == ["Channel A would fire 1e-06 s before T0"]
+    _, problems = graph().what_if({6: (1, 1000.0)}, ordered=False)
+    assert "out of the range" in problems[0]
+
+
+def test_trigger_rate_checks_every_channel():
+    trial, problems = graph().what_if(trigger_rate=600e3)
+    assert trial.period_violations() == problems
+    assert [problem.split()[1] for problem in problems] == ["B", "C", "D"]
+    assert graph(trigger_rate=None).period_violations() == []
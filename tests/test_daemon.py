@@ -0,0 +1,70 @@
+import queue
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from dg535_daemon import MAX_BACKLOG, DG535Client, DG535Daemon, _Handler
+from dg535_driver import DG535Error
+
+
+@pytest.fixture
+def daemon(dg535):
+    """A daemon serving the dg535 fixture on a free TCP port."""
+    daemon = DG535Daemon(dg535)
+    thread = threading.Thread(target=daemon.serve, kwargs={"port": 0}, daemon=True)
+    thread.start()
+    while daemon.server is None:
+        thread.join(0.01)
+    yield daemon
+    daemon.shutdown()
+    thread.join(5)
+
+
+@pytest.fixture
+def client(daemon):
+    with DG535Client(port=daemon.server.server_address[1], timeout=5) as client:
+        yield client
+
+
+def test_requests_are_run_on_the_instrument(client, device):
+    assert client.set_delay(3, 5e-6)
+    assert device.delays[3] == (1, 5e-6)
+    assert client.state().delays[3] == (1, 5e-6)
+    assert client.refresh().complete
+
+
+def test_errors_are_replied(client):
+    with pytest.raises(DG535Error, match="Unknown operation"):
+        client.call("format_disk")
+    with pytest.raises(DG535Error):
+        client.set_delay(4, 1e-6)
+    # the connection is still usable
+    assert client.state().complete
+
+
+def test_subscribers_are_told_of_the_changes(daemon, client):
+    states = queue.Queue()
+    assert client.subscribe(states.put).complete
+    with DG535Client(port=daemon.server.server_address[1], timeout=5) as other:
+        other.set_trigger_rate(20)
+    assert states.get(timeout=5).trigger_rate == 20
+
+
+def test_client_that_does_not_read_is_dropped(dg535):
+    daemon = DG535Daemon(dg535)
+    shutdowns = []
+    handler = _Handler.__new__(_Handler)
+    handler.server = SimpleNamespace(daemon=daemon)
+    handler.connection = SimpleNamespace(shutdown=shutdowns.append)
+    handler.client_address = ("127.0.0.1", 0)
+    # no writer thread: the events pile up as for a client that stopped reading
+    handler.outbox = queue.Queue()
+    daemon.subscribe(handler)
+    for _ in range(MAX_BACKLOG):
+        handler.notify(b"{}\n")
+    assert not shutdowns
+    handler.notify(b"{}\n")
+    assert len(shutdowns) == 1
+    assert handler not in daemon._subscribers
+    daemon._executor.shutdown()
@@ -0,0 +1,88 @@
+import pytest
+
+from dg535_driver import DG535, DG535Error, parse_delay_setting
+
+
+def test_refresh_reads_every_setting(dg535, device):
+    state = dg535.state
+    assert state.complete
+    assert (state.trigger_mode, state.trigger_rate, state.trigger_slope) == (0, 10000.0, 1)
+    assert state.delays == device.delays
+
+
+def test_connect_without_address_takes_the_gpib_device(rm):
+    dg535 = DG535(rm=rm).connect()
+    assert dg535.address == "GPIB0::15::INSTR"
+    with pytest.raises(DG535Error):
+        DG535(rm=rm.__class__(addresses=())).connect()
+
+
+def test_set_delay_is_written_and_cached(dg535, device):
+    assert dg535.set_delay(2, 250e-6)
+    assert dg535.set_delay(3, 5e-6, reference=2)
+    assert device.delays[2] == (1, 250e-6)
+    assert device.delays[3] == (2, 5e-6)
+    assert dg535.state.delays[3] == (2, 5e-6)
+    assert dg535.state.absolute_time(3) == pytest.approx(255e-6)
+
+
+def test_unchanged_setting_is_not_sent(dg535, device):
+    device.reset_statistics()
+    assert not dg535.set_delay(2, 0.0)
+    assert not dg535.set_trigger_rate(10000.0)
+    assert not dg535.set_trigger_mode(0)
+    assert device.transactions == 0
+    assert dg535.set_delay(2, 0.0, force=True)
+    assert device.transactions == 1
+
+
+@pytest.mark.parametrize("channel, reference", [(1, 1), (4, 1), (2, 2), (2, 0), (2, 4), (2, 7), (5, 9)])
+def test_set_delay_rejects_invalid_channels(dg535, device, channel, reference):
+    device.reset_statistics()
+    with pytest.raises(DG535Error):
+        dg535.set_delay(channel, 1e-6, reference)
+    assert device.transactions == 0
+
+
+def test_batch_sends_one_message(dg535, device):
+    device.reset_statistics()
+    with dg535.batch() as batch:
+        dg535.set_delay(2, 1e-6)
+        dg535.set_delay(5, 2e-6)
+        dg535.set_trigger_rate(500)
+        batch.query("TM")
+    assert device.transactions == 2  # the message and its reply
+    assert batch.replies[0].value == 0
+    assert device.delays[5] == (1, 2e-6)
+    assert device.trigger_rate == 500
+
+
+def test_failed_batch_forgets_the_cached_state(dg535, device):
+    device.close()
+    with pytest.raises(Exception):
+        with dg535.batch():
+            dg535.set_delay(2, 1e-6)
+    assert dg535.state.delays[2] is None
+    assert dg535.health.consecutive_failures == 1
+
+
+def test_failed_read_keeps_the_cached_state(dg535, device):
+    device.close()
+    with pytest.raises(Exception):
+        dg535.refresh()
+    assert dg535.state.complete
+
+
+def test_store_and_recall(dg535, device):
+    dg535.set_delay(6, 3e-6)
+    dg535.store(4)
+    dg535.set_delay(6, 0.0)
+    assert dg535.recall(4).delays[6] == (1, 3e-6)
+    assert device.delays[6] == (1, 3e-6)
+
+
+def test_parse_delay_setting():
+    assert parse_delay_setting("2,5e-6") == (2, 5e-6)
+    assert parse_delay_setting(" 1e-6 ") == (1, 1e-6)
+    with pytest.raises(ValueError):
+        parse_delay_setting("1,2,3")
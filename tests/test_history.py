@@ -0,0 +1,72 @@
+import math
+
+import numpy as np
+
+from conftest import setting
+from dg535_history import UNKNOWN, StateHistory
+
+
+def history(tmp_path, **kwargs):
+    return StateHistory(str(tmp_path / "history"), chunk=4, **kwargs)
+
+
+def test_state_in_force_at_a_time(tmp_path):
+    states = history(tmp_path)
+    assert states.append(setting(), when=10.0)
+    assert states.append(setting(B=(2, 1e-6)), when=20.0)
+    assert states.state_at(5.0) is None
+    assert states.state_at(15.0).delays[3] == (1, 2e-6)
+    assert states.state_at(20.0).delays[3] == (2, 1e-6)
+    values = states.states_at([5.0, 15.0, 25.0], columns=["B", "B_reference"])
+    assert math.isnan(values["B"][0]) and list(values["B"][1:]) == [2e-6, 1e-6]
+    assert list(values["B_reference"]) == [UNKNOWN, 1, 2]
+    states.close()
+
+
+def test_unchanged_settings_are_not_appended(tmp_path):
+    states = history(tmp_path)
+    assert states.append(setting(), when=10.0)
+    assert not states.append(setting(), when=11.0)
+    assert len(states) == 1
+    states.close()
+
+
+def test_between_starts_with_the_row_in_force(tmp_path):
+    states = history(tmp_path)
+    for i in range(10):
+        states.append(setting(trigger_rate=100.0 + i), when=10.0 * i)
+    assert len(states) == 10
+    rows = states.between(25.0, 50.0)
+    assert list(rows["time"]) == [20.0, 30.0, 40.0]
+    assert list(rows["trigger_rate"]) == [102.0, 103.0, 104.0]
+    states.close()
+
+
+def test_reader_sees_the_rows_of_the_writer(tmp_path):
+    states = history(tmp_path)
+    states.append(setting(), when=10.0)
+    reader = history(tmp_path, readonly=True)
+    assert len(reader) == 1
+    for i in range(5):
+        states.append(setting(trigger_rate=200.0 + i), when=20.0 + i)
+    states.flush()
+    assert len(reader) == 6
+    assert reader.state_at(30.0).trigger_rate == 204.0
+    reader.close()
+    states.close()
+
+
+def test_second_writer_becomes_a_reader(tmp_path):
+    first = history(tmp_path)
+    first.append(setting(), when=10.0)
+    second = history(tmp_path)
+    assert not second.append(setting(trigger_rate=5.0), when=20.0)
+    assert second.readonly
+    assert len(second) == 1
+    second.close()
+    # once the writer is gone the directory can be written again
+    first.close()
+    third = history(tmp_path)
+    assert third.append(setting(trigger_rate=5.0), when=20.0)
+    assert np.array_equal(third.column("trigger_rate"), [1000.0, 5.0])
+    third.close()
@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+from dg535_journal import CommandJournal, delay_changes, journal_action, read_journal
+
+
+def journal(tmp_path, capacity=4):
+    return CommandJournal(str(tmp_path / "journal.bin"), capacity=capacity, sync_interval=0.01)
+
+
+def test_ring_keeps_the_latest_records(tmp_path):
+    commands = journal(tmp_path)
+    for i in range(6):
+        commands.record("write", f"DT 2,1,{i}E-6", 0.001)
+    commands.close()
+    records = read_journal(commands.path)
+    assert list(records["sequence"]) == [3, 4, 5, 6]
+    assert [message.decode() for message in records["message"]] == [f"DT 2,1,{i}E-6" for i in range(2, 6)]
+
+
+def test_reopened_journal_continues_the_sequence(tmp_path):
+    commands = journal(tmp_path)
+    commands.record("query", "TM", 0.001, reply="1")
+    commands.close()
+    commands = journal(tmp_path)
+    commands.record("write", "TM 0", 0.001)
+    commands.close()
+    records = read_journal(commands.path)
+    assert list(records["sequence"]) == [1, 2]
+    assert records["reply"][0].decode() == "1"
+
+
+def test_delay_changes(tmp_path):
+    commands = journal(tmp_path, capacity=16)
+    with journal_action("Set delay"):
+        commands.record("write", "TM 1;DT 5,3,2.5E-6", 0.001)
+    commands.record("write", "DT 6,1,1E-6", 0.001, error="timeout")
+    commands.record("query", "DT 2", 0.001, reply="1,1E-6")
+    commands.close()
+    changes = delay_changes(read_journal(commands.path))
+    assert [change[2:] for change in changes] == [(5, 3, 2.5e-6, "Set delay")]
+
+
+def test_other_files_are_refused_and_left_untouched(tmp_path):
+    path = tmp_path / "journal.bin"
+    path.write_bytes(b"not a journal")
+    with pytest.raises(ValueError):
+        CommandJournal(str(path))
+    assert path.read_bytes() == b"not a journal"
+
+
+def test_second_writer_only_counts_its_commands(tmp_path):
+    first = journal(tmp_path)
+    second = journal(tmp_path)
+    assert first.writing and not second.writing
+    second.record("write", "TM 0", 0.001)
+    second.close()
+    first.close()
+    assert second.dropped == 1
+    assert len(read_journal(first.path)) == 0
+
+
+def test_without_pread(tmp_path, monkeypatch):
+    # Windows has no os.pread and os.pwrite
+    monkeypatch.delattr(os, "pread")
+    monkeypatch.delattr(os, "pwrite")
+    commands = journal(tmp_path)
+    commands.record("write", "TM 0", 0.001)
+    commands.close()
+    commands = journal(tmp_path)
+    commands.record("write", "TM 1", 0.001)
+    commands.close()
+    assert list(read_journal(commands.path)["sequence"]) == [1, 2]
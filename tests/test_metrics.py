@@ -0,0 +1,46 @@
+import json
+
+import pyvisa
+
+from dg535_metrics import BusMetrics, command_mnemonic, is_timeout
+
+
+def test_command_mnemonic():
+    assert command_mnemonic("dt 2,1,1E-6") == "DT"
+    assert command_mnemonic("TM 1;DT 2,1,1E-6;") == "batch"
+    assert command_mnemonic(" ; ") == "?"
+
+
+def test_is_timeout():
+    assert is_timeout(pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_timeout))
+    assert is_timeout(TimeoutError())
+    assert not is_timeout(pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_resource_not_found))
+
+
+def test_record_and_totals():
+    metrics = BusMetrics()
+    metrics.record("query", "TM", 0.002, reply="1")
+    metrics.record("write", "TM 1;DT 2,1,1E-6", 0.004)
+    metrics.record("query", "TM", 0.5, error=TimeoutError())
+    metrics.record("read", None, 0.001, reply="1")
+    assert {name: stats.count for name, stats in metrics.transactions.items()} == {"TM": 2, "batch": 1, "read": 1}
+    assert metrics.commands == {"TM": 3, "DT": 1}
+    totals = metrics.totals()
+    assert totals.count == 4 and totals.errors == 1 and totals.timeouts == 1
+    assert totals.max_time == 0.5
+    assert totals.bytes_out == 2 + 16 + 2 and totals.bytes_in == 2
+
+
+def test_timed_sections_and_dump(tmp_path):
+    metrics = BusMetrics()
+    with metrics.timed("plot"):
+        pass
+    metrics.record("query", "TM", 0.002, reply="1")
+    assert metrics.sections["plot"].count == 1
+    assert "TOTAL" in metrics.report()
+    path = tmp_path / "metrics.json"
+    metrics.dump(str(path))
+    values = json.loads(path.read_text())
+    assert values["totals"]["count"] == 1 and "plot" in values["sections"]
+    metrics.reset()
+    assert metrics.totals().count == 0
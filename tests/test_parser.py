@@ -0,0 +1,41 @@
+import pytest
+
+from dg535_parser import DelayReply, RateReply, RegisterReply, ReplyError, parse_replies, parse_reply
+
+
+def test_delay_reply():
+    assert parse_reply("DT 2", "1,+0.000250000000") == DelayReply(2, 1, 250e-6)
+    assert parse_reply("DT? 5", "3,+2.5E-04\r\n") == DelayReply(5, 3, 250e-6)
+    assert parse_reply("DT 2", "1,+2.5E-04").value == (1, 250e-6)
+
+
+def test_rate_and_register_replies():
+    assert parse_reply("TR 0", "10000.000") == RateReply(0, 10000.0)
+    assert parse_reply("TR", "1.0E+04") == RateReply(0, 10000.0)
+    assert parse_reply("TM", "2") == RegisterReply("TM", 2)
+    assert parse_reply("ES", "32").bit(32)
+
+
+def test_reply_without_record_type_is_left_as_text():
+    assert parse_reply("ID", " DG535 \r\n") == "DG535"
+
+
+def test_invalid_reply():
+    with pytest.raises(ReplyError):
+        parse_reply("DT 2", "0.00025")
+    with pytest.raises(ReplyError):
+        parse_reply("TM", "INT")
+
+
+def test_batch_of_replies():
+    commands = ["TR 0", "TM", "DT 2"]
+    expected = [RateReply(0, 1000.0), RegisterReply("TM", 0), DelayReply(2, 1, 1e-6)]
+    assert parse_replies(commands, "1000.0;0;1,1E-06") == expected
+    assert parse_replies(commands, ["1000.0", "0;1,1E-06"]) == expected
+
+
+def test_batch_count_mismatch():
+    with pytest.raises(ReplyError):
+        parse_replies(["TM"], "0;1")
+    with pytest.raises(ReplyError):
+        parse_replies(["TM", "TS"], "0")
@@ -0,0 +1,77 @@
+import pytest
+
+from conftest import setting
+from dg535_health import ConnectionHealth
+from dg535_poller import BUSY_TIME, POLLED, PROBE, PollScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def poller(clock):
+    return PollScheduler(ConnectionHealth(clock=clock), clock=clock)
+
+
+def poll_mode(poller, clock, state):
+    """Wait until the trigger mode is due, poll it with what is due with it, returns its interval."""
+    clock.now = poller.settings["trigger_mode"].next_poll
+    names = poller.due(state)
+    assert "trigger_mode" in names
+    poller.polled(names, state)
+    return poller.settings["trigger_mode"].interval
+
+
+def test_interval_doubles_up_to_slow(poller, clock):
+    state = setting()
+    assert poller.due(state) == []
+    fast, slow = POLLED["trigger_mode"][1]
+    intervals = [poll_mode(poller, clock, state) for _ in range(7)]
+    assert intervals == [2 * fast, 4 * fast, 8 * fast, 16 * fast, slow, slow, slow]
+
+
+def test_change_polls_fast_again(poller, clock):
+    state = setting()
+    poller.due(state)
+    for _ in range(4):
+        poll_mode(poller, clock, state)
+    state.trigger_mode = 0
+    poller.due(state)
+    assert poller.settings["trigger_mode"].interval == POLLED["trigger_mode"][1][0]
+
+
+def test_only_the_probe_while_the_link_is_down(poller, clock):
+    state = setting()
+    poller.due(state)
+    poller.health.failure(TimeoutError())
+    assert poller.due(state) == [PROBE]
+    assert poller.due(state) == []
+    clock.now += POLLED[PROBE][1][0]
+    assert poller.due(state) == [PROBE]
+    # the probe answers: every setting is read again
+    poller.health.polling = True
+    poller.health.success()
+    poller.health.polling = False
+    assert sorted(poller.due(state)) == sorted(POLLED)
+
+
+def test_no_poll_while_the_host_uses_the_bus(poller, clock):
+    state = setting()
+    poller.due(state)
+    clock.now = 10.0
+    poller.health.success()
+    clock.now += BUSY_TIME / 2
+    assert poller.due(state) == []
+    assert poller.skipped == 1
+    clock.now += BUSY_TIME
+    assert poller.due(state)
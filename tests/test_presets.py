@@ -0,0 +1,55 @@
+import pytest
+
+from conftest import setting
+from dg535_driver import DG535Error, DG535State
+from dg535_presets import PresetLibrary, apply_preset, apply_state, order_delays
+
+
+def test_library_round_trip(tmp_path):
+    path = tmp_path / "presets.json"
+    library = PresetLibrary(str(path))
+    library.save("run12", setting(B=(2, 1e-6)))
+    reloaded = PresetLibrary(str(path))
+    assert reloaded.names == ["run12"]
+    assert reloaded.get("run12").delays[3] == (2, 1e-6)
+    reloaded.delete("run12")
+    assert PresetLibrary(str(path)).names == []
+    with pytest.raises(DG535Error):
+        reloaded.get("run12")
+
+
+def test_incomplete_state_is_not_saved(tmp_path):
+    with pytest.raises(DG535Error):
+        PresetLibrary(str(tmp_path / "presets.json")).save("empty", DG535State())
+
+
+def test_apply_state_in_one_message(dg535, device):
+    device.reset_statistics()
+    written = apply_state(dg535, setting(B=(2, 1e-6)))
+    assert device.transactions == 1
+    assert written == {"trigger_mode": True, "trigger_rate": True, "trigger_slope": True,
+                       "A": True, "B": True, "C": True, "D": True}
+    assert device.delays[3] == (2, 1e-6)
+    assert (device.trigger_mode, device.trigger_rate, device.trigger_slope) == (1, 1000.0, 0)
+    # the device already holds it: nothing is sent again
+    device.reset_statistics()
+    assert apply_preset(dg535, setting(B=(2, 1e-6))) == 0
+    assert device.transactions == 0
+
+
+def test_delays_are_ordered_without_loops(dg535, device):
+    apply_state(dg535, setting(B=(2, 1e-6)))
+    target = setting(A=(3, -1e-6), B=(1, 2e-6))
+    assert [channel for channel, _, _ in order_delays(dg535.state, target)] == [3, 2]
+    apply_state(dg535, target)
+    assert device.delays[2] == (3, -1e-6)
+    assert device.error_status == 0
+
+
+def test_invalid_preset_is_not_sent(dg535, device):
+    device.reset_statistics()
+    with pytest.raises(DG535Error):
+        apply_state(dg535, setting(A=(3, 1e-6), B=(2, 1e-6)))
+    with pytest.raises(DG535Error):
+        apply_state(dg535, DG535State())
+    assert device.transactions == 0
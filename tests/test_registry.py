@@ -0,0 +1,46 @@
+import pytest
+
+from dg535_driver import DG535Error
+from dg535_registry import DG535Registry
+from dg535_simulator import SimulatedResourceManager
+
+
+LASER, GATE = "GPIB0::15::INSTR", "GPIB1::15::INSTR"
+
+
+@pytest.fixture
+def registry():
+    registry = DG535Registry({"laser": LASER}, rm=SimulatedResourceManager((LASER, GATE)), timeout=5)
+    yield registry
+    registry.close()
+
+
+def test_units_by_name_or_address(registry):
+    assert registry.address("laser") == LASER
+    assert registry.address(LASER) == LASER
+    with pytest.raises(DG535Error):
+        registry.address("gate")
+    with pytest.raises(DG535Error):
+        registry.add("laser", GATE)
+    assert registry.discover() == ["laser", GATE]
+
+
+def test_submit_connects_the_unit(registry):
+    assert registry.submit("laser", lambda dg535, t: dg535.set_delay(3, t), 5e-6).result()
+    assert registry.dg535("laser").address == LASER
+    assert registry.rm.instruments[LASER].delays[3] == (1, 5e-6)
+
+
+def test_fleet_snapshot_reports_the_units_that_fail(registry):
+    registry.add("missing", "GPIB2::15::INSTR")
+    registry.discover()
+    states = registry.fleet_snapshot()
+    assert states["laser"].complete and states[GATE].complete
+    assert isinstance(states["missing"], Exception)
+
+
+def test_close_closes_every_session(registry):
+    registry.discover()
+    registry.fleet_snapshot()
+    registry.close()
+    assert all(instrument.closed for instrument in registry.rm.instruments.values())
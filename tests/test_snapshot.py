@@ -0,0 +1,43 @@
+from conftest import setting
+from dg535_driver import DG535State
+from dg535_snapshot import StateSnapshot, differences
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "state" / "last_state.json")
+    StateSnapshot(path).save(setting(B=(2, 1e-6)), "GPIB0::15::INSTR")
+    snapshot = StateSnapshot(path)
+    state = snapshot.load()
+    assert state.as_dict() == setting(B=(2, 1e-6)).as_dict()
+    assert snapshot.address == "GPIB0::15::INSTR"
+    assert snapshot.saved_at is not None
+
+
+def test_missing_or_broken_file(tmp_path):
+    path = tmp_path / "last_state.json"
+    assert StateSnapshot(str(path)).load() is None
+    path.write_text("{")
+    assert StateSnapshot(str(path)).load() is None
+
+
+def test_update_writes_only_the_changes(tmp_path, dg535):
+    snapshot = StateSnapshot(str(tmp_path / "last_state.json"))
+    assert snapshot.update(dg535)
+    assert not snapshot.update(dg535)
+    dg535.set_delay(3, 5e-6)
+    assert snapshot.update(dg535)
+    assert StateSnapshot(snapshot.path).load().delays[3] == (1, 5e-6)
+
+
+def test_update_skips_a_partial_state(tmp_path, dg535):
+    dg535.state = DG535State()
+    assert not StateSnapshot(str(tmp_path / "last_state.json")).update(dg535)
+
+
+def test_differences():
+    expected = setting(B=(2, 1e-6))
+    assert differences(expected, setting(B=(2, 1e-6 + 1e-15))) == []
+    actual = setting(trigger_rate=500.0, B=(1, 1e-6))
+    assert differences(expected, actual) == [("trigger rate", 1000.0, 500.0), ("delay B", (2, 1e-6), (1, 1e-6))]
+    actual.delays[6] = None
+    assert differences(expected, actual)[-1] == ("delay D", (1, 4e-6), None)
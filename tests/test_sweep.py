@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from dg535_driver import DG535Error, DG535State
+from dg535_sweep import SweepPlan, run_sweep
+
+
+@pytest.fixture
+def spaced(dg535):
+    """A to D at 1, 2, 3, 4 us from T0, internal trigger at 50 Hz."""
+    with dg535.batch():
+        for channel, delay in zip((2, 3, 5, 6), (1e-6, 2e-6, 3e-6, 4e-6)):
+            dg535.set_delay(channel, delay)
+        dg535.set_trigger_rate(50)
+    return dg535
+
+
+def test_plan_shapes():
+    plan = SweepPlan.grid(delays={"C": [1e-6, 2e-6, 3e-6]}, rates=[10, 20])
+    assert plan.steps == 6
+    assert list(plan.rates) == [10, 20] * 3
+    assert SweepPlan(delays={5: [1e-6, 2e-6]}, rates=50).steps == 2
+    with pytest.raises(DG535Error):
+        SweepPlan(delays={5: [1e-6, 2e-6]}, rates=[10, 20, 30])
+    with pytest.raises(DG535Error):
+        SweepPlan(delays={"AB": [1e-6]})
+
+
+def test_validate_names_the_first_bad_step(spaced):
+    SweepPlan(delays={"C": np.linspace(2e-6, 4e-6, 5)}).validate(spaced.state)
+    with pytest.raises(DG535Error, match="Step 3: Channel C delay is more than channel D delay"):
+        SweepPlan(delays={"C": np.linspace(2e-6, 5e-6, 5)}).validate(spaced.state)
+    with pytest.raises(DG535Error, match="Step 1: rate"):
+        SweepPlan(delays={"A": 1e-6}, rates=[10, 1e3]).validate(spaced.state)
+    with pytest.raises(DG535Error, match="Step 0"):
+        SweepPlan(delays={"D": 30e-3}).validate(spaced.state, ordered=False)
+
+
+def test_validate_follows_the_references(spaced):
+    # B is 1 us after A: moving A past C drags B along
+    spaced.set_delay(3, 1e-6, reference=2)
+    with pytest.raises(DG535Error, match="Step 1: Channel B delay is more than channel C delay"):
+        SweepPlan(delays={"A": [1e-6, 2.5e-6]}).validate(spaced.state)
+    # D referred to C moves with it and stays in order
+    spaced.set_delay(6, 1e-6, reference=5)
+    SweepPlan(delays={"C": [3e-6, 100e-6]}).validate(spaced.state)
+
+
+def test_validate_needs_the_settings():
+    with pytest.raises(DG535Error):
+        SweepPlan(delays={"A": [1e-6]}).validate(DG535State())
+
+
+def test_run_sweep_one_message_per_step(spaced, device):
+    plan = SweepPlan(delays={"C": [3e-6, 3.5e-6, 3.5e-6]}, rates=[50, 50, 20])
+    device.reset_statistics()
+    log = run_sweep(spaced, plan, dwell=0)
+    assert list(log["commands"]) == [0, 1, 1]
+    assert device.transactions == 2
+    assert device.delays[5] == (1, 3.5e-6)
+    assert device.trigger_rate == 20
@@ -0,0 +1,86 @@
+import os
+import time
+
+import pytest
+
+from dg535_driver import DG535Error
+from dg535_simulator import _timeout_error
+from dg535_worker import DG535Worker
+
+
+def finish(worker):
+    """Let the worker run what is queued, then deliver the results as poll() would."""
+    worker.stop()
+    worker.join(5)
+    while not worker.results.empty():
+        callback, result = worker.results.get()
+        worker.in_flight -= 1
+        if callback is not None:
+            callback(result)
+
+
+def dead_read():
+    raise _timeout_error()
+
+
+def test_connect_reads_the_settings(rm):
+    worker = DG535Worker(rm=rm)
+    worker.start()
+    results = []
+    worker.connect(on_done=results.append)
+    finish(worker)
+    devices, dg535 = results[0]
+    assert devices == ("GPIB0::15::INSTR",)
+    assert worker.dg535 is dg535 and dg535.state.complete
+    assert not worker.busy
+
+
+def test_failed_refresh_leaves_the_worker_disconnected(rm):
+    rm.instruments["GPIB0::15::INSTR"].read = dead_read
+    worker = DG535Worker(rm=rm)
+    worker.start()
+    errors = []
+    worker.connect(on_error=errors.append)
+    finish(worker)
+    assert len(errors) == 1
+    assert worker.dg535 is None
+    assert rm.instruments["GPIB0::15::INSTR"].closed
+
+
+def test_reconnect_closes_the_old_session(rm, dg535):
+    worker = DG535Worker(dg535=dg535, rm=rm)
+    worker.start()
+    worker.connect()
+    finish(worker)
+    assert worker.dg535 is not dg535
+    assert not dg535.connected
+
+
+def test_errors_are_delivered(dg535):
+    worker = DG535Worker(dg535=dg535)
+    worker.start()
+    errors = []
+    worker.submit(lambda dg535: dg535.set_delay(4, 1e-6), on_error=errors.append)
+    assert worker.busy
+    finish(worker)
+    assert isinstance(errors[0], DG535Error)
+    assert not worker.busy
+
+
+def test_qt_worker_delivers_on_the_gui_thread(rm):
+    QtCore = pytest.importorskip("PyQt6.QtCore")
+    from dg535_qt_worker import DG535QtWorker
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    app = QtCore.QCoreApplication.instance() or QtCore.QCoreApplication([])
+    worker = DG535QtWorker(rm=rm)
+    results, errors = [], []
+    worker.connect(on_done=results.append)
+    worker.submit(lambda dg535: dg535.set_delay(4, 1e-6), on_error=errors.append)
+    assert worker.busy
+    deadline = time.monotonic() + 5
+    while worker.busy and time.monotonic() < deadline:
+        app.processEvents()
+    worker.stop()
+    assert worker.dg535 is results[0][1] and worker.dg535.state.complete
+    assert isinstance(errors[0], DG535Error)
+    worker.dg535.close()
@@ -1,13 +1,26 @@
-import pyvisa
+# Imported first, it marks the start of the interface for the startup timings
+from dg535_startup import milestone, report as startup_report, timed_import
 import tkinter as tk
 from tkinter import messagebox
+from tkinter import filedialog
 from tkinter import ttk
-from loguru import logger
-from matplotlib import pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import numpy as np
-import ttkbootstrap as ttkb
-from threading import Thread
+from dg535_constraints import DelayGraph
+from dg535_driver import CHANNEL_NAMES, DG535, DG535Error, MAX_RATE, parse_delay_setting, resource_manager
+from dg535_history import StateHistory
+from dg535_journal import CommandJournal
+from dg535_poller import POLL_TICK, PollScheduler, poll_settings
+from dg535_snapshot import StateSnapshot, differences
+from dg535_worker import DG535Worker
+import dg535_actions
+import dg535_session
+# matplotlib (dg535_plot), pyvisa and loguru are imported on first use, so the window shows up straight away
+
+
+def log():
+    """The loguru logger, imported the first time something is logged."""
+    return timed_import("loguru").logger
+
+
 def show_help_delay_channels():
     messagebox.showinfo("Help - Delay Channels", "This section allows you to set the delay for different channels (A, B, C, D).")
 
@@ -32,7 +45,7 @@ def show_help_start():
                         "Channel D: 251 microseconds\n"
                         "If no frequency is specified, then a default value of 10 Hz is settled.\n"  
                         "Please fine tune the delays in case those values must be changed.\n"    
-                        "Do not attempt to increase the frequency over 100 Hz, bad things might happen (i will not allow you... )"
+                        f"Do not attempt to increase the frequency over {MAX_RATE:g} Hz, bad things might happen (i will not allow you... )"
                             )
     messagebox.showinfo("Help - Start and Stop Section" , help_message
                             )
@@ -49,8 +62,13 @@ def update_connection_status():
     """
     global dg535
     global connection_status_label
-    if dg535:
+    if dg535 and dg535.connected and dg535.health.consecutive_failures:
+        connection_status_label.config(text="Not responding", bg="orange", fg="white")
+    elif dg535 and dg535.connected:
         connection_status_label.config(text="Connected", bg="green", fg="white")
+    elif dg535:
+        # settings of the last run, shown while the connection is opened
+        connection_status_label.config(text="Last known settings, connecting...", bg="gray", fg="white")
     else:
         connection_status_label.config(text="Not Connected", bg="red", fg="white")
 
@@ -66,96 +84,184 @@ def update_mode_status():
         trigger_label.config(text="Trigger Status: Not available", bg="black", fg="white")
         return -1
 
-    status = dg535.query("TM")
-    if status[0] == "0": #Check
+    if dg535.state.trigger_mode == 0: #Check
         trigger_label.config(text = "Trigger Status: Internal Trigger On", bg = "green", fg = "white")
     else:
         trigger_label.config(text = "Trigger Status: Internal Trigger Off", bg = "red", fg = "white")
     
         
     
+def device_error(e):
+    """
+    Called on the Tk thread when a request sent to the I/O worker failed.
+    """
+    global dg535
+    messagebox.showwarning("Error","Connection could have been lost with the device: please check the physical connection. Use the third party driver to re-establish connnection.")
+    dg535 = None
+    update_connection_status()
+    update_mode_status()
+
+
+def run_on_device(function, *args, on_done=None):
+    """
+    Run function(dg535, *args) on the I/O worker thread, so the window is never blocked by the bus.
+    on_done(result) is then called on the Tk thread.
+    """
+    worker.submit(function, *args, on_done=on_done, on_error=device_error)
+
+
 def check_connection():
+    """
+    Cheap connection check: the outcome of the recent traffic is enough when the link is busy,
+    otherwise a minimal probe is queued on the I/O worker. The bus is enumerated only by Retry Connection.
+    """
     global dg535
-    global rm
-    devices = rm.list_resources()
-    # Check if any GPIB devices are connected
-    gpib_devices = [device for device in devices if "GPIB" in device]
-    if not gpib_devices:
-        messagebox.showwarning("Warning", "There are no GPIB devices connected! Please check the connection again!")
-    try:
-        dg535.query("TM")
-    except:
-        messagebox.showwarning("Error","Connection could have been lost with the device: please check the physical connection. Use the third party driver to re-establish connnection.")
-        dg535 = None
-        update_connection_status()
-        update_mode_status()
+    if not dg535 or not dg535.connected:
+        return
+    if not dg535.health.needs_probe():
+        return
+    if worker.busy:
+        # a request is on the bus, its outcome tells whether the link is alive
+        return
+    run_on_device(dg535_actions.check_connection)
     
     
-def loop_check():
-    global dg535
-    global rm
-    
-    check_connection()
-    window.after(10000, loop_check())
+def poll_device():
+    """
+    Tick of the adaptive polling, every POLL_TICK ms: the settings that are due (see dg535_poller.py)
+    are read in one message, nothing is sent while the bus is busy or nothing is due.
+    """
+    global poller
+    if dg535 and dg535.connected and not worker.busy:
+        if poller is None or poller.health is not dg535.health:
+            poller = PollScheduler(dg535.health)
+        names = poller.due(dg535.state)
+        if names:
+            device = dg535
+            worker.submit(poll_settings, names, on_done=lambda changed: polled(device, names, changed),
+                          on_error=lambda e: polled(device, names, []))
+    window.after(POLL_TICK, poll_device)
+
+
+def polled(device, names, changed):
+    """
+    Called on the Tk thread with the settings a poll found changed (from the front panel).
+    """
+    if device is not dg535:
+        return
+    poller.polled(names, device.state)
+    update_connection_status()
+    if changed:
+        update_mode_status()
+        update_values(device)
+
+def report_differences(state):
+    """
+    Warn about the settings of the instrument that differ from the ones saved at the last run, once.
+    """
+    global saved_state
+    if saved_state is None:
+        return
+    changed = differences(saved_state, state)
+    saved_state = None
+    if changed:
+        lines = "\n".join(f"{name}: {old} -> {new}" for name, old, new in changed)
+        log().warning("DG535 settings changed since the last run\n{}", lines)
+        messagebox.showwarning("Settings changed", f"The settings of the DG535 differ from the last known ones:\n{lines}")
+
+
+def show_bus_statistics():
+    """
+    Dump the statistics of the bus traffic to the log and show them.
+    """
+    if not dg535:
+        messagebox.showwarning("Error", "There is no GPIB device, please check the connection.")
+        return -1
+    report = dg535.metrics.report()
+    log().info("DG535 bus statistics\n{}", report)
+    messagebox.showinfo("Bus statistics", report)
+
+
+def save_bus_statistics():
+    """
+    Save the statistics of the bus traffic as JSON.
+    """
+    if not dg535:
+        messagebox.showwarning("Error", "There is no GPIB device, please check the connection.")
+        return -1
+    path = filedialog.asksaveasfilename(title="Save bus statistics", defaultextension=".json",
+                                        initialfile="dg535_bus_statistics.json")
+    if path:
+        dg535.metrics.dump(path)
+        log().info("DG535 bus statistics saved to {}", path)
+
 
 def list_devices():
-    devices = pyvisa.ResourceManager().list_resources()
-    messagebox.showinfo("Devices", f"Available devices: {devices}")
+    worker.submit(lambda dg535: resource_manager().list_resources(),
+                  on_done=lambda devices: messagebox.showinfo("Devices", f"Available devices: {devices}"),
+                  on_error=lambda e: messagebox.showwarning("Devices", f"Could not list the devices: {e}"))
         
 
-def connect_to_dg535():
+def connect_to_dg535(on_done=None):
     """
     This function connects the computer to the dg535 device, 
     in case there is more than one device connected please specify the right item from the list that will be returned in this case
+    The connection is opened by the I/O worker, on_done(dg535) is called once it succeeded or failed (dg535 is None).
     """
-    # Initialize VISA resource manager
-    global rm
-    global dg535
-
-    rm = pyvisa.ResourceManager()
-    # List all available devices
-    devices = rm.list_resources()
-    messagebox.showinfo("Devices", f"Available devices: {devices}")
-    # Check if any GPIB devices are connected
-    gpib_devices = [device for device in devices if "GPIB" in device]
-    if not gpib_devices:
-        messagebox.showwarning("Warning", "There are no GPIB devices connected!")
-        return None  # Return None to indicate connection failure
-    dg535_address = gpib_devices[0]        
-    # Connect to the DG535
-    try:
-        dg535 = rm.open_resource(dg535_address)
-    except:
-        messagebox.showwarning("Error","Connection could have been lost with the device: please check the physical connection. Use the third party driver to re-establish connnection.")
+    def connected(result):
+        global dg535
+        devices, dg535 = result
+        messagebox.showinfo("Devices", f"Available devices: {devices}")
+        report_differences(dg535.state)
+        finish()
+
+    def failed(e):
+        global dg535
         dg535 = None
-    #update_values_fasullo(dg535)
-    #update_values(dg535)
-    #update_mode_status()
-    return dg535
+        if isinstance(e, DG535Error):
+            messagebox.showwarning("Warning", str(e))
+        else:
+            messagebox.showwarning("Error","Connection could have been lost with the device: please check the physical connection. Use the third party driver to re-establish connnection.")
+        finish()
+
+    def finish():
+        update_connection_status()
+        update_mode_status()
+        update_values(dg535)
+        if on_done:
+            on_done(dg535)
+
+    # Connect to the DG535 and read its settings once, the interface then works on the cached state
+    if session is not None:
+        # through the hub, so that its other views use the new session too
+        session.connect(on_done=connected, on_error=failed)
+    else:
+        worker.connect(on_done=connected, on_error=failed)
+
 
 
 
+def known(value):
+    """The cached value (the delay of a (reference, delay) pair), "unknown" if it is None."""
+    if value is None:
+        return "unknown"
+    return value[1] if isinstance(value, tuple) else value
+
 
 def update_values(dg535):
     """
-    Function to update internal tigger frequency and C Channel delay values.
+    Function to update internal tigger frequency and channel delay values.
+    The values are taken from the state cached by the driver, no query is sent to the device.
     """
     check_connection()
     if not dg535:
         return -1
-    f = dg535.query("TR 0")
-    f = float(f[:len(f)-2])
-    
-    t_A = dg535.query("DT 2")
-    t_A = float(t_A[2:len(t_A)-2])
-    t_B = dg535.query("DT 3")
-    t_B = float(t_B[2:len(t_B)-2])
-
-    t_C = dg535.query("DT 5")
-    t_C = float(t_C[2:len(t_C)-2])
-
-    t_D = dg535.query("DT 6")
-    t_D = float(t_D[2:len(t_D)-2])
+    # a setting not read yet (or forgotten after a failed write) is shown as unknown
+    f = known(dg535.state.trigger_rate)
+    t_A = known(dg535.state.delays[2])
+    t_B = known(dg535.state.delays[3])
+    t_C = known(dg535.state.delays[5])
+    t_D = known(dg535.state.delays[6])
 
     
     global frequency_var
@@ -186,64 +292,66 @@ def retry_connection():
     Function to retry connection to the DG535 device.
     """
     connection_status_label.config(text="Checking connection...", bg="gray", fg="white")
-    global dg535
-    dg535 = connect_to_dg535()
-    if dg535:
-        messagebox.showinfo("Connection", "Successfully connected to the DG535!")
-        
-    else:
-        messagebox.showwarning("Connection Failed", "Retry connection failed. Please check the device and try again.")
-    update_connection_status()
-    update_mode_status()
-    update_graph()
+    def connected(dg535):
+        if dg535:
+            messagebox.showinfo("Connection", "Successfully connected to the DG535!")
+        else:
+            messagebox.showwarning("Connection Failed", "Retry connection failed. Please check the device and try again.")
+        update_graph()
+    connect_to_dg535(on_done=connected)
 
 
-def stop(dg535):
+def stop(dg535, on_done=None):
     
     """
     @params dg535 : the device 
+    @params on_done : called on the Tk thread once the device has been stopped
     This function switches the device from internal trigger to single shot mode, hence stopping the pulse generator.
     """ 
+    def stopped(result):
+        update_mode_status()
+        if on_done:
+            on_done()
     # set trigger to single shot, this stops execution.
-    dg535.write('TM 2')
-    update_mode_status()
+    run_on_device(dg535_actions.stop_pulses, on_done=stopped)
 
 
-def change_frequency(dg535, f):
+def change_frequency(dg535, f, on_done=None):
     
     """
     @params dg535 : the device
     @params f : the new frequency in Hz
+    @params on_done : called on the Tk thread once the frequency has been changed
     This function changes the internal trigger frequency of the device. 
     """
     check_connection()
     messagebox.showwarning("Warning", f"The frequency of the internal trigger is being changed to {f} Hz, you may need to change the delays to the channels if needed. ")
-    commandstring = f'TR 0,{f}'
-    dg535.write(commandstring)
-    update_values(dg535)
+    def changed(result):
+        # the driver of the worker, a reconnection meanwhile may have replaced the one given
+        global dg535
+        update_values(dg535)
+        if on_done:
+            on_done()
+    run_on_device(dg535_actions.change_frequency, f, on_done=changed)
 
 
-def start(dg535, f):
+def start(dg535, f, on_done=None):
     """
     @params dg535 : the device
     @params f : the frequency to set, to be specified in Hz
+    @params on_done : called on the Tk thread once the pulse generator has been started
     """
     messagebox.showinfo("Starting the pulse generator", "Attempting to start the pulse generator...\n channel A delay channel is set to default 100 [ns], channel B delay is set to  default of 200 [ns]\n channel C delay is set to default of 250 microseconds \n channel D delay is set to default of 251 microseconds.")
 
-    # delay A from T0 of 100 ns
-    dg535.write('DT 2,1,0.0')
-    # delay B from A 100 ns
-    dg535.write('DT 3,1,5E-6')
-    # delay C 250 microseconds compared to T0
-    dg535.write('DT 5,1,200E-6')
-    #delay D 251 microseconds compared to T0
-    dg535.write('DT 6,1,251E-6')
-    # change frequency and set trigger to internal
-    change_frequency(dg535, f)
-    dg535.write('TM 0')
-    update_values(dg535)
-    update_mode_status()
-    messagebox.showwarning("Warning","The delays have been settled to a common point of reference T0 in time, the given default values have been settled, if needed one can change those values manually in the delay section.")
+    def started(result):
+        global dg535
+        update_values(dg535)
+        update_mode_status()
+        messagebox.showwarning("Warning","The delays have been settled to a common point of reference T0 in time, the given default values have been settled, if needed one can change those values manually in the delay section.")
+        if on_done:
+            on_done()
+    # default delays, frequency and internal trigger, packed in a single message
+    run_on_device(dg535_actions.start_pulses, f, on_done=started)
 
 
 
@@ -251,58 +359,42 @@ def start(dg535, f):
 
 
 
-def check_delay(t, Channel):
-    global current_delay_var_A
-    global current_delay_var_B
-    global current_delay_var_C
-    global current_delay_var_D
+def check_delay(t, Channel, reference=1):
+    """
+    Warn and return -1 if the new delay breaks a constraint: order A->B->C->D, no channel before T0
+    or after the next trigger, no reference loop (see dg535_constraints.py).
+    It is evaluated on the cached settings, nothing is sent to the device.
+    """
+    try:
+        graph = DelayGraph.from_state(dg535.state)
+    except DG535Error as e:
+        messagebox.showwarning("Warning", str(e))
+        return -1
+    _, problems = graph.what_if({Channel: (reference, t)})
+    if problems:
+        messagebox.showwarning("Warning", "\n".join(problems) + "\n Remember that the delays are ordered in A->B->C->D")
+        return -1
 
-    
-    dict_var = {2:float(current_delay_var_A.get()),
-                3:float(current_delay_var_B.get()),
-                5:float(current_delay_var_C.get()),
-                6:float(current_delay_var_D.get())
-           }
-           
-    dict_check_backward = {3:2,
-                           5:3,
-                           6:5
-                           }
-    dict_name = {2:"A",
-                 3:"B",
-                 5:"C",
-                 6:"D"
-                }
-    dict_check_forward ={2:3,
-                         3:5,
-                         5:6
-                        
-                        }
-    if (Channel != 2):
-        if  t < dict_var[dict_check_backward[Channel]]:
-            messagebox.showwarning("Warning", f"Channel {dict_name[Channel]} delay is less than channel {dict_name[dict_check_backward[Channel]]} delay.\n Remember that the delays are ordered in A->B->C->D")
-            return -1
-    if (Channel != 6):
-        if  t > dict_var[dict_check_forward[Channel]]:
-            messagebox.showwarning("Warning", f"Channel {dict_name[Channel]} delay is more than channel {dict_name[dict_check_forward[Channel]]} delay.\n Remember that the delays are ordered in A->B->C->D")
-            return -1
 
 
-def delay(dg535,Channel,  t):
+def delay(dg535,Channel,  t, reference=1, on_done=None):
     """
-    This function delays the current channel compared to a common internal reference T0
+    This function delays the current channel compared to a reference channel, the common internal reference T0 by default
     @params dg535 : the device
     @params Channel. the channel which is being delayed
     @params t : the delay, to be specified in seconds.
+    @params reference : the channel the delay is referred to
+    @params on_done : called on the Tk thread once the delay has been set
     """
-    flag = check_delay(t, Channel)
+    flag = check_delay(t, Channel, reference)
     if flag == -1:
         return -1
-    command = f'DT {Channel},1,{t}'
-    
-    dg535.write(command)
-    update_values(dg535)
-    update_graph()
+    def settled(result):
+        global dg535
+        update_values(dg535)
+        if on_done:
+            on_done()
+    run_on_device(dg535_actions.set_delay, Channel, t, reference, on_done=settled)
 
 
 
@@ -350,13 +442,12 @@ def set_trigger_frequency():
         if frequency <= 0:
             messagebox.showwarning("Error", "Please insert a non-negative value")
             return -1
-        if frequency >100:
-            messagebox.showerror("Bruh", " Y burn transstor_? <100 Hz pls")
+        if frequency > MAX_RATE:
+            messagebox.showerror("Bruh", f" Y burn transstor_? <{MAX_RATE:g} Hz pls")
             return -1
         if frequency:
-            change_frequency(dg535, frequency)
-            update_graph()
-            messagebox.showinfo("Impostato", f"Internal Trigger frequency set to: {frequency} Hz")
+            change_frequency(dg535, frequency,
+                             on_done=lambda: messagebox.showinfo("Impostato", f"Internal Trigger frequency set to: {frequency} Hz"))
         else:
             messagebox.showwarning("Warning", "Please insert a valid frequency!")
             return -1
@@ -381,11 +472,11 @@ def start_action():
         except:
             messagebox.showwarning("Error", "Please insert a valid value")
             return -1
-        start(dg535, initial_frequency)
-        messagebox.showinfo("Starting", f"Internal trigger frequency set to: {initial_frequency} Hz")
+        start(dg535, initial_frequency,
+              on_done=lambda: messagebox.showinfo("Starting", f"Internal trigger frequency set to: {initial_frequency} Hz"))
     else:
-        start(dg535, 10)
-        messagebox.showinfo("Starting", f"Internal trigger frequency set to a default value of 10 Hz since no value was specified")
+        start(dg535, 10,
+              on_done=lambda: messagebox.showinfo("Starting", f"Internal trigger frequency set to a default value of 10 Hz since no value was specified"))
 
 # stop function
 def stop_action():
@@ -397,69 +488,27 @@ def stop_action():
     if not dg535:
         messagebox.showwarning("Error", "There is no GPIB device, please check the connection.")
         return -1
-    stop(dg535)
-    messagebox.showwarning("Stop", "The pulse generator has been switched to single shot mode: continuous pulse generation with internal trigger frequency has been stopped!")
+    stop(dg535, on_done=lambda: messagebox.showwarning("Stop", "The pulse generator has been switched to single shot mode: continuous pulse generation with internal trigger frequency has been stopped!"))
 
 # set delay functon
 def set_delay(Channel, t):
     """
     Function that activates when the set delay button is pressed
+    The value is a delay in seconds from T0, or "i,t" for a delay t from channel i (e.g. "2,5e-6": 5 us after A)
     """
     check_connection()
     if not dg535:
         messagebox.showwarning("Error", "There is no GPIB device, please check the connection.")
         return -1   
-    global current_delay_var_A
-    global current_delay_var_B
-
-    global current_delay_var_C
-    global current_delay_var_D
-
-    dict_var = {2:float(current_delay_var_A.get()),
-                3:float(current_delay_var_B.get()),
-
-                5:float(current_delay_var_C.get()),
-                6:float(current_delay_var_D.get()) 
-           }
-           
-    dict_check_backward = {3:2,
-                           5:3,
-                           6:5
-                           }
-    dict_name = {2:"A",
-                 3:"B",
-                 5:"C",
-                 6:"D"
-                }
-    dict_check_forward ={2:3,
-                         3:5,
-                         5:6
-                        }
-    
-    if not dg535:
-        messagebox.showwarning("Error", "There is no GPIB device, please check the connection.")
-        return -1
     
     if t:
         try:
-            t = float(t)
+            reference, t = parse_delay_setting(t)
         except:
             messagebox.showwarning("Error", "Please insert a valid value")
             return -1
-        if  t < 0:
-            messagebox.showwarning("Error", "Please insert a non-negative value")
-            return -1
-        else:
-            if (Channel!=2):
-                if  t < dict_var[dict_check_backward[Channel]]:
-                    messagebox.showwarning("Warning", f"Channel {dict_name[Channel]} delay is less than channel {dict_name[dict_check_backward[Channel]]} delay.\n Remember that the delays must be ordered such that A<B<C<D")
-                    return -1
-            if (Channel !=6):
-                if  t > dict_var[dict_check_forward[Channel]]:
-                    messagebox.showwarning("Warning", f"Channel {dict_name[Channel]} delay is more than channel {dict_name[dict_check_forward[Channel]]} delay.\n Remember that the delays must be ordered such that A<B<C<D")
-                    return -1
-            delay(dg535,Channel,t)
-            messagebox.showinfo("Delay settled", f"Delay settled to: {t} seconds for channel {dict_name[Channel]}")
+        delay(dg535,Channel,t, reference,
+              on_done=lambda: messagebox.showinfo("Delay settled", f"Delay settled to: {t} seconds for channel {CHANNEL_NAMES[Channel]}"))
     else:
         messagebox.showwarning("Error", "No value was inserted")
 
@@ -468,84 +517,37 @@ def set_delay(Channel, t):
 
 
 
-def update_graph(scale_type="linear"):
-    
+def update_graph(scale_type=None):
+    """
+    Redraw the timing diagram, the time spent is recorded in the bus metrics as "plot".
+    Without scale_type the current scale (linear or log) is kept.
+    """
     check_connection()
     if not dg535:
         return -1
-    
-    delays = {
-        'T0 time reference' : 0, 
-        'Channel A': float(current_delay_var_A.get()) or 0,
-        'Channel B': float(current_delay_var_B.get()) or 0,
-        'Channel C': float(current_delay_var_C.get()) or 0,
-        'Channel D': float(current_delay_var_D.get()) or 0,
-
-    }
-    
-    
-    
-    
-    
-    
-    # Prepare time values for plotting
-    channels = list(delays.keys())
-    time_delays = list(delays.values())
-
-    # Create the plot
-    fig, ax = plt.subplots(2 ,1, figsize=(6, 3), layout = "constrained", sharex = True)  # Adjust the figure size
-    colors = ['red', 'blue', 'green', 'orange', 'purple']
-
-
-    ax[0].scatter(time_delays, channels, color=colors, edgecolor='black', s=100)  # s is the size of points
-    ax[0].set_title('Channels\' starting point')
-    ax[0].set_xlabel('Time [s]', fontsize=10)    
-    # Set scale type (linear or logarithmic)
-    ax[0].set_xscale(scale_type)
-    ax[0].set_facecolor("#cccccc")
-
-    fig.patch.set_facecolor("#cccccc")
-    # Add gridlines
-    ax[0].grid(True, which='both', linestyle='--', linewidth=0.5)
-    # Add ticks and labels
-    ax[0].xaxis.set_major_formatter(plt.ScalarFormatter())
-    ax[0].xaxis.set_minor_formatter(plt.NullFormatter())
-    
-    
-    AB_pulse_start = delays['Channel A']
-    AB_pulse_end = delays['Channel B']
-    CD_pulse_start = delays['Channel C']
-    CD_pulse_end = delays['Channel D'] #check whether this is true
-    pulse_channels = ['Channel AB', 'Channel CD']
-
-    end_pos = [AB_pulse_end-AB_pulse_start, CD_pulse_end-CD_pulse_start]
-    start_pos = [AB_pulse_start, CD_pulse_start]
-    
-    
-    colors_pulses = ['cyan', 'purple']
-    # Horizontal bar plot for the second subplot
-    bars = ax[1].barh(pulse_channels, end_pos, color=colors_pulses, edgecolor='black', left=start_pos)
-    ax[1].set_xlabel('Time (s)')
-    ax[1].set_ylabel('Channels')
-    ax[1].set_facecolor("#cccccc")
-    ax[1].set_title('Channel AB and CD pulses duration')
-    ax[1].set_xscale(scale_type)
-    ax[1].grid(True, which='both', linestyle='--', linewidth=0.5)
-    
-
-    
-    
-    
-    
-    
-    # Clear the old canvas and redraw the new one
-    for widget in frame_plot.winfo_children():
-        widget.destroy()
+    with dg535.metrics.timed("plot"):
+        draw_graph(scale_type)
 
-    canvas = FigureCanvasTkAgg(fig, master=frame_plot)
 
-    canvas.get_tk_widget().pack(fill=tk.BOTH, expand=False)
-    canvas.draw()
+def draw_graph(scale_type):
+    """
+    Update the timing diagram in place, it is created the first time only
+    (matplotlib is imported then).
+    """
+    global timing_diagram
+    # the channels can be referred to each other, the diagram shows their times from T0
+    try:
+        times = DelayGraph.from_state(dg535.state).times
+    except DG535Error:
+        return
+    delays = [0, times[2], times[3], times[5], times[6]]
+    first_plot = timing_diagram is None
+    if first_plot:
+        timing_diagram = timed_import("dg535_plot").TimingDiagram(frame_plot)
+    timing_diagram.update(delays, scale_type)
+    if first_plot:
+        milestone("first plot")
+        log().info("Startup times\n{}", startup_report())
 
 
 
@@ -553,8 +555,15 @@ def update_graph(scale_type="linear"):
 
 
 
-# Main window
-window = tk.Tk()
+# Main window: a Toplevel of the hub when it hosts this interface, shown by show()
+session = dg535_session.current()
+if session is None:
+    window = tk.Tk()
+else:
+    window = tk.Toplevel(session.root)
+    window.withdraw()
+    # closing only hides the window, the hub shows it again in no time
+    window.protocol("WM_DELETE_WINDOW", window.withdraw)
 window.title("Interface to pilot Pulse generator DG535")
 
 # Set width and height of window to half the screen 
@@ -576,6 +585,8 @@ help_menu = tk.Menu(menu_bar, tearoff=0)
 menu_bar.add_cascade(label="Menu&Help", menu=help_menu)
 help_menu.add_command(label="Help", command=show_help)
 help_menu.add_command(label = "Devices", command = list_devices)
+help_menu.add_command(label = "Bus statistics", command = show_bus_statistics)
+help_menu.add_command(label = "Save bus statistics", command = save_bus_statistics)
 
 
 # Background color and other options
@@ -782,9 +793,10 @@ label_delay_D.grid(row=1, column = 11, padx = 10, pady = 5, sticky="e")
 
 
 
-# Frame to hold the plot
+# Frame to hold the plot, the timing diagram is created on the first update
 frame_plot = tk.Frame(window)
 frame_plot.pack(fill=tk.BOTH, expand="yes", pady = 10, padx = 10)
+timing_diagram = None
 
 
 
@@ -816,23 +828,64 @@ button_help_plot.grid(row=0, column=2, padx=5, pady=5 , sticky = 'w')
 
 
 
-# First connection to device.
-dg535 = connect_to_dg535()
-update_connection_status()
-update_mode_status()
-update_values(dg535)
+def session_connected(device):
+    """
+    Called by the hub when the shared session has been (re)connected.
+    """
+    global dg535
+    dg535 = device
+    update_connection_status()
+    update_mode_status()
+    update_values(dg535)
 
-# Initial plot
-update_graph()
 
-"""
-thread1 = Thread(target =loop_check())
+def show():
+    """
+    Show the window when hosted by the hub, the settings are those already cached by the shared session.
+    """
+    session_connected(session.dg535)
+    window.deiconify()
+    window.lift()
+
+
+def window_shown():
+    log().info("Window shown {:.0f} ms after start", milestone("window shown") * 1e3)
+    # First connection to device, done in background once the window is drawn
+    connect_to_dg535()
+    # meanwhile the last known settings are shown, they are checked once the instrument has been read
+    update_connection_status()
+    update_mode_status()
+    update_values(dg535)
+
 
-# Interface loop
-thread2 = Thread(target = window.mainloop())
-thread1.start()
-thread2.start()
-thread1.join()
-"""
-window.mainloop()
+saved_state = None
+# adaptive polling of the settings, created for the connected driver by poll_device()
+poller = None
+if session is None:
+    # Settings saved at the last run: the window is usable before the first transaction
+    snapshot = StateSnapshot()
+    saved_state = snapshot.load()
+    dg535 = None
+    if saved_state is not None:
+        dg535 = DG535()
+        dg535.state = saved_state.copy()
+        dg535.address = snapshot.address
+
+    # The I/O worker owns the device, its results are delivered to the window every 50 ms;
+    # every command it sends is kept in the journal and every setting it observes in the history
+    worker = DG535Worker(snapshot=snapshot, journal=CommandJournal(), history=StateHistory())
+    worker.start()
+    worker.poll(window)
+    window.after(POLL_TICK, poll_device)
+
+    milestone("imports done")
+    window.after_idle(window_shown)
+
+    window.mainloop()
+else:
+    # The hub owns the worker, the session and the main loop
+    dg535 = session.dg535
+    worker = session.worker
+    session.listeners.append(session_connected)
+    window.after(POLL_TICK, poll_device)
 
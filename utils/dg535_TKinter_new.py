@@ -1,6 +1,8 @@
 import tkinter as tk
+from tkinter import messagebox
 from tkinter import ttk
-import pyvisa
+from dg535_driver import (DG535, DG535Error, MAX_RATE, MIN_RATE, REFERENCE_CHANNELS, TRIGGER_MODES, TRIGGER_SLOPES,
+                          parse_delay_setting, resource_manager)
 
 class MainWindow(tk.Tk):
     def __init__(self):
@@ -14,17 +16,65 @@ class MainWindow(tk.Tk):
         self.connect_to_dg535()
 
         # Set up the UI
-        self.setup_ui()
+        WorkingInterface(self, dg535=self.dg535).pack(fill='both', expand=True)
 
     def connect_to_dg535(self):
         """Initialize the VISA resource manager and connect to DG535."""
-        self.rm = pyvisa.ResourceManager()
+        self.rm = resource_manager()
         devices = self.rm.list_resources()
         print(f"Available devices: {devices}")
 
         # Assuming the DG535 is the only GPIB device connected
-        self.dg535_address = [device for device in devices if "GPIB" in device][0]
-        self.dg535 = self.rm.open_resource(self.dg535_address)
+        self.dg535 = DG535(rm=self.rm).connect()
+        self.dg535_address = self.dg535.address
+
+
+class WorkingInterface(ttk.Frame):
+    """
+    The settings form, in MainWindow or in a Toplevel of the hub.
+    @params dg535 : the connected driver, used directly when the interface runs on its own
+    @params session : the shared session of the hub (dg535_session.py), the writes then go through its I/O worker
+    """
+
+    def __init__(self, master, dg535=None, session=None):
+        super().__init__(master)
+        self.dg535 = dg535
+        self.session = session
+        self.setup_ui()
+        if session is not None:
+            session.listeners.append(self.show_connection)
+        self.show_connection(session.dg535 if session is not None else dg535)
+
+    def run(self, function, *args):
+        """
+        Run function(dg535, *args), on the I/O worker of the shared session if there is one.
+        The errors are shown in the same dialog in both cases.
+        """
+        if self.session is None:
+            try:
+                return function(self.dg535, *args)
+            except Exception as e:
+                self.show_error(e)
+                return None
+        self.session.worker.submit(function, *args, on_error=self.show_error)
+
+    def apply(self, read_values, function):
+        """Read the values entered, then write them with function(dg535, *values); invalid values are reported."""
+        try:
+            values = read_values()
+        except (ValueError, DG535Error) as e:
+            self.show_error(e)
+            return
+        self.run(function, *values)
+
+    def show_error(self, e):
+        messagebox.showwarning("DG535", f"The setting could not be written: {e}", parent=self)
+
+    def show_connection(self, dg535):
+        if dg535 is None:
+            self.connection_label.config(text="...Not connected...")
+        else:
+            self.connection_label.config(text=f"...Connected to {dg535.address}...")
 
     def setup_ui(self):
         # Main layout setup
@@ -32,15 +82,14 @@ class MainWindow(tk.Tk):
         general_frame.pack(fill='both', expand=True, padx=10, pady=10)
 
         # Connection info
-        connection_label = ttk.Label(general_frame, text=f"...Connected to {self.dg535_address}...")
-        connection_label.pack(pady=5)
+        self.connection_label = ttk.Label(general_frame)
+        self.connection_label.pack(pady=5)
 
         # Create frames for settings input
         settings_frame = ttk.Frame(general_frame)
         settings_frame.pack(pady=10)
 
-        # Delay inputs (T0, A, B, C, D)
-        self.create_delay_input(settings_frame, "T0")
+        # Delay inputs (A, B, C, D; T0 is the reference of the others, its delay cannot be set)
         self.create_delay_input(settings_frame, "A")
         self.create_delay_input(settings_frame, "B")
         self.create_delay_input(settings_frame, "C")
@@ -68,9 +117,6 @@ class MainWindow(tk.Tk):
         delay_button_frame = ttk.Frame(general_frame)
         delay_button_frame.pack(pady=10)
 
-        set_delay_t0_button = ttk.Button(delay_button_frame, text="Set Delay T0", command=lambda: self.write_on_dg535_delay('t0'))
-        set_delay_t0_button.pack(side=tk.LEFT, padx=5)
-
         set_delay_a_button = ttk.Button(delay_button_frame, text="Set Delay A", command=lambda: self.write_on_dg535_delay('a'))
         set_delay_a_button.pack(side=tk.LEFT, padx=5)
 
@@ -112,23 +158,45 @@ class MainWindow(tk.Tk):
 
     # Methods to write to the DG535 device based on user input
     def write_on_dg535_tm(self):
-        trigger_mode_line = self.trigger_mode_entry.get()  # Get trigger mode input
-        self.dg535.write(f"TM {trigger_mode_line}")
-        if trigger_mode_line == '2':  # Single shot mode
-            self.dg535.write(f"SS")  # Trigger once after changing trigger mode
+        def read_values():
+            mode = int(self.trigger_mode_entry.get())  # Get trigger mode input
+            if mode not in TRIGGER_MODES:
+                raise DG535Error(f"Invalid trigger mode: {mode}")
+            return (mode,)
+
+        def write(dg535, mode):
+            dg535.set_trigger_mode(mode)
+            if mode == 2:  # Single shot mode
+                dg535.single_shot()  # Trigger once after changing trigger mode
+        self.apply(read_values, write)
 
     def write_on_dg535_tr(self):
-        trigger_rate_line = self.trigger_rate_entry.get()  # Get trigger rate input
-        self.dg535.write(f"TR {trigger_rate_line}")
+        def read_values():
+            rate = float(self.trigger_rate_entry.get())  # Get trigger rate input
+            if not MIN_RATE <= rate <= MAX_RATE:
+                raise DG535Error(f"Invalid trigger rate: {rate} (from {MIN_RATE:g} to {MAX_RATE:g} Hz)")
+            return (rate,)
+        self.apply(read_values, DG535.set_trigger_rate)
 
     def write_on_dg535_ts(self):
-        trigger_slope_line = self.trigger_slope_entry.get()  # Get trigger slope input
-        self.dg535.write(f"TS {trigger_slope_line}")
+        def read_values():
+            slope = int(self.trigger_slope_entry.get())  # Get trigger slope input
+            if slope not in TRIGGER_SLOPES:
+                raise DG535Error(f"Invalid trigger slope: {slope}")
+            return (slope,)
+        self.apply(read_values, DG535.set_trigger_slope)
 
     def write_on_dg535_delay(self, delay_type):
-        delay_value = getattr(self, f"delay_{delay_type}_entry").get()  # Get delay input
-        delay_map = {"t0": 1, "a": 2, "b": 3, "c": 5, "d": 6}
-        self.dg535.write(f"DT {delay_map[delay_type]},{delay_value}")
+        delay_map = {"a": 2, "b": 3, "c": 5, "d": 6}
+        channel = delay_map[delay_type]
+
+        def read_values():
+            delay_value = getattr(self, f"delay_{delay_type}_entry").get()  # Get delay input
+            reference, t = parse_delay_setting(delay_value)  # Either "i,t" or just "t" referred to T0
+            if reference not in REFERENCE_CHANNELS or reference == channel:
+                raise DG535Error(f"Channel {delay_type.upper()} cannot be referred to channel {reference}")
+            return channel, t, reference
+        self.apply(read_values, DG535.set_delay)
 
 # Main function equivalent to the QApplication loop in PyQt6
 def main():
@@ -0,0 +1,95 @@
+"""
+User-level operations on the DG535: what a button of the interfaces does on the bus.
+
+They are shared by the interfaces (which run them on the I/O worker) and by the
+benchmarks, so the numbers measured are those of the real code paths.
+"""
+from dg535_driver import CHANNELS, DG535Error
+from dg535_presets import apply_preset as _apply_preset, apply_state
+
+
+# Delays settled by Start, all referred to T0
+DEFAULT_START_DELAYS = {2: 0.0, 3: 5e-6, 5: 200e-6, 6: 251e-6}
+DEFAULT_FREQUENCY = 10
+
+
+def check_connection(dg535):
+    """Raise DG535Error if the DG535 does not answer, a probe is sent only if the link has been idle."""
+    if not dg535.check_connection():
+        raise DG535Error("The DG535 does not answer")
+
+
+def start_pulses(dg535, f=DEFAULT_FREQUENCY):
+    """
+    Default delays, frequency f in Hz and internal trigger, packed in a single message.
+    """
+    with dg535.batch():
+        for channel, t in DEFAULT_START_DELAYS.items():
+            dg535.set_delay(channel, t)
+        dg535.set_trigger_rate(f)
+        dg535.set_trigger_mode(0)
+
+
+def stop_pulses(dg535):
+    """Switch to single shot mode, which stops the internal trigger."""
+    dg535.set_trigger_mode(2)
+
+
+def set_delay(dg535, channel, t, reference=1):
+    dg535.set_delay(channel, t, reference)
+
+
+def change_frequency(dg535, f):
+    dg535.set_trigger_rate(f)
+
+
+def change_trigger_mode(dg535, mode):
+    """A switch to single shot mode also fires one shot."""
+    dg535.set_trigger_mode(mode)
+    if mode == 2:
+        dg535.single_shot()
+
+
+def change_trigger_slope(dg535, slope):
+    dg535.set_trigger_slope(slope)
+
+
+def full_refresh(dg535):
+    return dg535.refresh()
+
+
+def store_settings(dg535, slot):
+    dg535.store(slot)
+
+
+def recall_settings(dg535, slot):
+    return dg535.recall(slot)
+
+
+def apply_preset(dg535, state):
+    """Only the settings that differ from the cached ones are written, in one message."""
+    return _apply_preset(dg535, state)
+
+
+def apply_settings(dg535, settings, single_shot=False):
+    """
+    Several settings at once, in one message: settings is {"trigger_mode" / "trigger_rate" /
+    "trigger_slope": value, "A".."D": (reference, delay)}, the others keep their cached value.
+    Returns {setting: True if written}, see dg535_presets.apply_state().
+    """
+    # merged here, on the I/O thread, so that a value polled meanwhile is not written back
+    target = dg535.state.copy()
+    for name, value in settings.items():
+        if name in CHANNELS:
+            target.delays[CHANNELS[name]] = value
+        else:
+            setattr(target, name, value)
+    with dg535.batch():
+        written = apply_state(dg535, target)
+        if single_shot:
+            dg535.single_shot()
+    return written
+
+
+def reconnect(dg535):
+    return dg535.reconnect()
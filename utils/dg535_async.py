@@ -0,0 +1,114 @@
+"""
+asyncio client for the DG535.
+
+AsyncDG535 wraps the synchronous driver of dg535_driver.py: every call that touches
+the bus runs on a single worker thread dedicated to the instrument, so the commands
+are serialized in the order they are awaited and the event loop is never blocked
+while pyvisa waits on the GPIB bus.
+
+    dg = await AsyncDG535.open()
+    await dg.set_delay(5, 250e-6)
+    state = await dg.snapshot()
+
+Every method accepts a timeout in seconds (the default one is given to the constructor).
+A call that is cancelled or times out before reaching the worker is never sent;
+one already running on the bus is left to complete, so the instrument is not
+interrupted in the middle of a message.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+from dg535_driver import DG535
+
+
+class AsyncDG535:
+    """
+    @params dg535 : the synchronous driver, it must not be used by other threads at the same time
+    @params timeout : default timeout of every call in seconds, None to wait forever
+    """
+
+    def __init__(self, dg535, timeout=None):
+        self.dg535 = dg535
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dg535")
+
+    @classmethod
+    async def open(cls, address=None, rm=None, timeout=None):
+        """Connect to the DG535 (the first GPIB device if no address is given) and read its settings."""
+        client = cls(DG535(rm=rm), timeout)
+        await client.run(client.dg535.connect, address)
+        await client.refresh()
+        return client
+
+    async def close(self):
+        try:
+            await self.run(self.dg535.close)
+        finally:
+            self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def run(self, function, *args, timeout=None, **kwargs):
+        """Run function(*args, **kwargs) on the instrument worker thread."""
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._executor, partial(function, *args, **kwargs))
+        return await asyncio.wait_for(future, timeout if timeout is not None else self.timeout)
+
+    async def batch(self, function, timeout=None):
+        """
+        Run function(dg535, batch) inside a driver batch, so every setting it changes is sent
+        in one message. Returns the parsed replies of the queries queued with batch.query().
+        """
+        def run_batch():
+            with self.dg535.batch() as batch:
+                function(self.dg535, batch)
+            return batch.replies
+        return await self.run(run_batch, timeout=timeout)
+
+    # Cached state, no bus access
+
+    @property
+    def state(self):
+        return self.dg535.state
+
+    # Reading the settings
+
+    async def write(self, command, timeout=None):
+        return await self.run(self.dg535.write, command, timeout=timeout)
+
+    async def query(self, command, timeout=None):
+        return await self.run(self.dg535.query, command, timeout=timeout)
+
+    async def refresh(self, timeout=None):
+        return await self.run(lambda: self.dg535.refresh().copy(), timeout=timeout)
+
+    async def snapshot(self, timeout=None):
+        return await self.run(self.dg535.snapshot, timeout=timeout)
+
+    # Changing the settings
+
+    async def set_delay(self, channel, t, reference=1, force=False, timeout=None):
+        return await self.run(self.dg535.set_delay, channel, t, reference, force, timeout=timeout)
+
+    async def set_trigger_rate(self, rate, force=False, timeout=None):
+        return await self.run(self.dg535.set_trigger_rate, rate, force, timeout=timeout)
+
+    async def set_trigger_mode(self, mode, force=False, timeout=None):
+        return await self.run(self.dg535.set_trigger_mode, mode, force, timeout=timeout)
+
+    async def set_trigger_slope(self, slope, force=False, timeout=None):
+        return await self.run(self.dg535.set_trigger_slope, slope, force, timeout=timeout)
+
+    async def single_shot(self, timeout=None):
+        return await self.run(self.dg535.single_shot, timeout=timeout)
+
+    async def store(self, slot, timeout=None):
+        return await self.run(self.dg535.store, slot, timeout=timeout)
+
+    async def recall(self, slot, timeout=None):
+        return await self.run(lambda: self.dg535.recall(slot).copy(), timeout=timeout)
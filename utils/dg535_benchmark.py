@@ -0,0 +1,187 @@
+"""
+Round-trip benchmarks of the user-level operations against the simulated DG535.
+
+Every operation is run the way a button of the interfaces runs it (connection check
+followed by the action of dg535_actions.py) and the bus traffic is measured on the
+simulated instrument: transactions, bytes, bus time (modelled by the LatencyModel)
+and the wall time spent on the host.
+
+    python utils/dg535_benchmark.py
+    python utils/dg535_benchmark.py --timings gpib --repeat 50 --json bench.json
+    python utils/dg535_benchmark.py --parser        # reply decoding throughput only
+
+The JSON output is meant to be kept across versions to spot regressions.
+"""
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+import dg535_actions
+from dg535_driver import DG535, DG535State
+from dg535_parser import parse_replies
+from dg535_simulator import GPIB_TIMINGS, NO_LATENCY, SimulatedResourceManager
+
+
+TIMINGS = {"none": NO_LATENCY, "gpib": GPIB_TIMINGS}
+
+
+def _shift_delays(dg535, i):
+    """Move the delays away from the start defaults, so that Start has something to write."""
+    with dg535.batch():
+        for channel, t in dg535_actions.DEFAULT_START_DELAYS.items():
+            dg535.set_delay(channel, t + (i + 1) * 1e-9)
+        dg535.set_trigger_mode(2)
+
+
+def _store_slot(dg535, i):
+    dg535_actions.store_settings(dg535, 1)
+
+
+def _preset(i):
+    """Alternates between two run configurations that differ in two delays and the rate."""
+    state = DG535State()
+    state.trigger_mode, state.trigger_slope = 0, 1
+    state.trigger_rate = 10 + i % 2
+    state.delays = dict(zip((2, 3, 5, 6), ((1, 0.0), (1, 5e-6), (1, 200e-6 + (i % 2) * 1e-6), (5, 51e-6 + (i % 2) * 1e-6))))
+    return state
+
+
+def _click(action, *args):
+    """What a button does: check the connection, then run the action."""
+    def run(dg535, i):
+        dg535_actions.check_connection(dg535)
+        return action(dg535, *[arg(i) if callable(arg) else arg for arg in args])
+    return run
+
+
+# name -> (setup, operation), both called with (dg535, iteration); only the operation is measured.
+# The values change at every iteration, otherwise the driver would skip the writes.
+OPERATIONS = {
+    "start": (_shift_delays, _click(dg535_actions.start_pulses, lambda i: 10 + i % 2)),
+    "stop": (lambda dg535, i: dg535.set_trigger_mode(0), _click(dg535_actions.stop_pulses)),
+    "set_delay": (None, _click(dg535_actions.set_delay, 5, lambda i: 200e-6 + (i + 1) * 1e-9)),
+    "change_frequency": (None, _click(dg535_actions.change_frequency, lambda i: 20 + i % 2)),
+    "full_refresh": (None, _click(dg535_actions.full_refresh)),
+    "store": (None, _click(dg535_actions.store_settings, 1)),
+    "recall": (_store_slot, _click(dg535_actions.recall_settings, 1)),
+    "apply_preset": (None, _click(dg535_actions.apply_preset, _preset)),
+    "reconnect": (None, lambda dg535, i: dg535_actions.reconnect(dg535)),
+}
+
+
+def _summary(values):
+    return {
+        "mean": statistics.fmean(values),
+        "min": min(values),
+        "max": max(values),
+    }
+
+
+def run_benchmark(name, repeat=20, latency=NO_LATENCY, realtime=False):
+    """Run one operation repeat times on a fresh simulated DG535 and return its statistics."""
+    setup, operation = OPERATIONS[name]
+    rm = SimulatedResourceManager(latency=latency, realtime=realtime)
+    dg535 = DG535(rm=rm).connect()
+    dg535.refresh()
+    samples = {"transactions": [], "bytes": [], "bus_scans": [], "bus_time": [], "wall_time": []}
+    for i in range(repeat):
+        if setup is not None:
+            setup(dg535, i)
+        instrument = dg535.resource
+        instrument.reset_statistics()
+        scans, scan_time = rm.scans, rm.elapsed
+        start = time.perf_counter()
+        operation(dg535, i)
+        wall_time = time.perf_counter() - start
+        # reconnect may have opened the session again
+        instrument = dg535.resource
+        samples["transactions"].append(instrument.transactions)
+        samples["bytes"].append(instrument.bytes_written + instrument.bytes_read)
+        samples["bus_scans"].append(rm.scans - scans)
+        samples["bus_time"].append(instrument.elapsed + rm.elapsed - scan_time)
+        samples["wall_time"].append(wall_time)
+    return {key: _summary(values) for key, values in samples.items()}
+
+
+# The queries of a refresh and the line the DG535 sends back, in both number formats
+PARSER_QUERIES = ["TR 0", "TM", "TS", "DT 2", "DT 3", "DT 5", "DT 6"]
+PARSER_REPLIES = ["10.000;0;1;1,+0.000000000000;1,+0.000005000000;1,+0.000200000000;1,+0.000251000000",
+                  "1.0E+01;0;1;1,+0.0E+00;2,+5.00000000000E-06;1,+2.00000000000E-04;5,+5.10000000000E-05"]
+
+
+def run_parser_benchmark(count=20000):
+    """Decoding throughput of the replies of a refresh, with no bus involved."""
+    samples = []
+    for reply in PARSER_REPLIES:
+        start = time.perf_counter()
+        for _ in range(count):
+            parse_replies(PARSER_QUERIES, reply)
+        samples.append((time.perf_counter() - start) / (count * len(PARSER_QUERIES)))
+    reply_time = statistics.fmean(samples)
+    return {"replies": count * len(PARSER_QUERIES) * len(PARSER_REPLIES),
+            "time_per_reply": reply_time,
+            "replies_per_second": 1 / reply_time}
+
+
+def run_benchmarks(names=None, repeat=20, timings="gpib", realtime=False):
+    """Run the benchmarks and return the machine readable report."""
+    latency = TIMINGS[timings]
+    results = {name: run_benchmark(name, repeat, latency, realtime) for name in (names or OPERATIONS)}
+    return {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "timings": timings,
+        "realtime": realtime,
+        "repeat": repeat,
+        "results": results,
+    }
+
+
+def print_report(report, file=sys.stdout):
+    if "parser" in report:
+        result = report["parser"]
+        print(f"parser: {result['time_per_reply'] * 1e9:.0f} ns per reply, {result['replies_per_second']:.0f} replies/s", file=file)
+        return
+    print(f"{'operation':<18}{'transactions':>14}{'bytes':>8}{'scans':>7}{'bus time [ms]':>15}{'wall time [ms]':>16}", file=file)
+    for name, result in report["results"].items():
+        print(f"{name:<18}"
+              f"{result['transactions']['mean']:>14.1f}"
+              f"{result['bytes']['mean']:>8.0f}"
+              f"{result['bus_scans']['mean']:>7.1f}"
+              f"{result['bus_time']['mean'] * 1e3:>15.2f}"
+              f"{result['wall_time']['mean'] * 1e3:>16.3f}", file=file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the DG535 operations against the simulator")
+    parser.add_argument("operations", nargs="*", help=f"operations to run among {', '.join(OPERATIONS)} (default: all)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--timings", choices=TIMINGS, default="gpib", help="latency model of the simulated bus")
+    parser.add_argument("--realtime", action="store_true", help="really wait for the modelled bus time")
+    parser.add_argument("--json", metavar="PATH", help="write the report as JSON ('-' for stdout)")
+    parser.add_argument("--parser", action="store_true", help="measure the reply decoding throughput instead")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.operations if name not in OPERATIONS]
+    if unknown:
+        parser.error(f"unknown operations: {', '.join(unknown)}")
+
+    if args.parser:
+        report = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                  "parser": run_parser_benchmark()}
+    else:
+        report = run_benchmarks(args.operations, args.repeat, args.timings, args.realtime)
+    if args.json == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+        return
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
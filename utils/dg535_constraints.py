@@ -0,0 +1,164 @@
+"""
+Constraints on the delays of the DG535, evaluated on the host before anything is sent.
+
+Every delay channel is referred to another channel (T0, or A for "B = A + 5 us"...),
+the references form a tree rooted at T0. DelayGraph keeps that tree with the absolute
+time of every channel; when a delay changes only the channels below it are updated,
+and only they are checked:
+
+  - no reference loop (the DG535 rejects the command),
+  - no channel before T0 and none after the next trigger (1 / trigger rate),
+  - the delays ordered A <= B <= C <= D, as the interfaces require,
+  - the relative delay within the range of the instrument.
+
+what_if() evaluates one or several changes on a copy, without touching the device:
+
+    graph = DelayGraph.from_state(dg535.state)
+    graph, problems = graph.what_if({3: (2, 5e-6)})     # B 5 us after A
+"""
+from dg535_driver import CHANNEL_NAMES, CHANNELS, DELAY_CHANNELS, MAX_DELAY, DG535Error
+
+
+T0 = CHANNELS["T0"]
+# The order the interfaces keep: A <= B <= C <= D
+ORDER = (2, 3, 5, 6)
+
+
+class DelayGraph:
+    """
+    @params delays : {channel: (reference, delay)} for the four delay channels, as in DG535State.delays
+    @params trigger_rate : internal trigger frequency in Hz, None not to check the trigger period
+    """
+
+    def __init__(self, delays, trigger_rate=None):
+        self.delays = dict(delays)
+        self.trigger_rate = trigger_rate
+        self.children = {channel: set() for channel in (T0, *DELAY_CHANNELS)}
+        for channel, (reference, _) in self.delays.items():
+            self._check_reference(channel, reference)
+            self.children[reference].add(channel)
+        self.times = {T0: 0.0}
+        self._resolve(T0)
+        if len(self.times) != len(self.children):
+            raise DG535Error("The delay channels are referred to each other in a loop")
+
+    @classmethod
+    def from_state(cls, state):
+        if any(delay is None for delay in state.delays.values()):
+            raise DG535Error("Read the settings of the DG535 first")
+        return cls(state.delays, state.trigger_rate)
+
+    def copy(self):
+        graph = DelayGraph.__new__(DelayGraph)
+        graph.delays = dict(self.delays)
+        graph.trigger_rate = self.trigger_rate
+        graph.children = {channel: set(children) for channel, children in self.children.items()}
+        graph.times = dict(self.times)
+        return graph
+
+    @staticmethod
+    def _check_reference(channel, reference):
+        if channel not in DELAY_CHANNELS:
+            raise DG535Error(f"Channel {CHANNEL_NAMES.get(channel, channel)} has no programmable delay")
+        if reference == channel or (reference != T0 and reference not in DELAY_CHANNELS):
+            raise DG535Error(f"Channel {CHANNEL_NAMES[channel]} cannot be referred to channel {CHANNEL_NAMES.get(reference, reference)}")
+
+    def _resolve(self, channel):
+        """Recompute the absolute times below channel, returns the channels updated."""
+        updated = []
+        stack = [channel]
+        while stack:
+            parent = stack.pop()
+            for child in self.children[parent]:
+                self.times[child] = self.times[parent] + self.delays[child][1]
+                updated.append(child)
+                stack.append(child)
+        return updated
+
+    def absolute_time(self, channel):
+        return self.times[channel]
+
+    def creates_loop(self, channel, reference):
+        """True if referring channel to reference would close a loop."""
+        while reference != T0:
+            if reference == channel:
+                return True
+            reference = self.delays[reference][0]
+        return False
+
+    def set(self, channel, delay, reference=T0):
+        """Change one delay, returns the channels whose absolute time changed."""
+        self._check_reference(channel, reference)
+        if self.creates_loop(channel, reference):
+            raise DG535Error(f"Referring channel {CHANNEL_NAMES[channel]} to channel {CHANNEL_NAMES[reference]} would close a loop")
+        self.children[self.delays[channel][0]].discard(channel)
+        self.children[reference].add(channel)
+        self.delays[channel] = (reference, float(delay))
+        self.times[channel] = self.times[reference] + float(delay)
+        return [channel, *self._resolve(channel)]
+
+    def violations(self, channels=None, ordered=True):
+        """
+        Messages of the constraints broken by channels (all of them by default), in channel order.
+        ordered=False leaves out the A <= B <= C <= D order.
+        """
+        channels = DELAY_CHANNELS if channels is None else sorted(set(channels))
+        problems = []
+        for channel in channels:
+            name = CHANNEL_NAMES[channel]
+            reference, delay = self.delays[channel]
+            time = self.times[channel]
+            if abs(delay) > MAX_DELAY:
+                problems.append(f"Channel {name} delay {delay} s is out of the range of the DG535")
+            if time < 0:
+                problems.append(f"Channel {name} would fire {-time} s before T0")
+            problems.extend(self.period_violations([channel]))
+            if not ordered:
+                continue
+            position = ORDER.index(channel)
+            if position > 0 and time < self.times[ORDER[position - 1]]:
+                problems.append(f"Channel {name} delay is less than channel {CHANNEL_NAMES[ORDER[position - 1]]} delay")
+            if position < len(ORDER) - 1 and ORDER[position + 1] not in channels and time > self.times[ORDER[position + 1]]:
+                problems.append(f"Channel {name} delay is more than channel {CHANNEL_NAMES[ORDER[position + 1]]} delay")
+        return problems
+
+    def period_violations(self, channels=None):
+        """Messages of the channels (all of them by default) that would fire after the next trigger."""
+        if not self.trigger_rate:
+            return []
+        period = 1 / self.trigger_rate
+        return [f"Channel {CHANNEL_NAMES[channel]} would fire after the next trigger ({self.times[channel]} s, period {period} s)"
+                for channel in (DELAY_CHANNELS if channels is None else sorted(set(channels)))
+                if self.times[channel] >= period]
+
+    def what_if(self, changes=None, trigger_rate=None, ordered=True):
+        """
+        Evaluate changes {channel: (reference, delay)} and/or a new trigger rate on a copy.
+        ordered=False does not check the A <= B <= C <= D order.
+        Several changes are judged on the settings they lead to, whatever their order.
+        Returns (the changed copy, the messages of the broken constraints); the copy is None
+        if the changes are impossible (reference loop, invalid channel).
+        """
+        changes = changes or {}
+        try:
+            if len(changes) > 1:
+                # judged together: one change may only make sense once another is done
+                # (B referred to A, then A referred to B), so the final tree is built at once
+                for channel, (reference, _) in changes.items():
+                    self._check_reference(channel, reference)
+                graph = DelayGraph({**self.delays, **{channel: (reference, float(delay)) for channel, (reference, delay) in changes.items()}},
+                                   self.trigger_rate)
+                changed = [channel for channel in DELAY_CHANNELS
+                           if graph.times[channel] != self.times[channel] or graph.delays[channel] != self.delays[channel]]
+            else:
+                graph = self.copy()
+                changed = []
+                for channel, (reference, delay) in changes.items():
+                    changed.extend(graph.set(channel, delay, reference))
+        except DG535Error as e:
+            return None, [str(e)]
+        if trigger_rate is not None:
+            graph.trigger_rate = trigger_rate
+            # the period concerns every channel
+            changed = DELAY_CHANNELS
+        return graph, graph.violations(changed, ordered)
@@ -1,6 +1,16 @@
-import pyvisa
 import sys
-from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit
+from PyQt6.QtCore import QTimer
+from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QPushButton, QVBoxLayout, QHBoxLayout, QLabel, QLineEdit, QInputDialog, QMessageBox
+from dg535_constraints import DelayGraph
+from dg535_driver import (CHANNEL_NAMES, CHANNELS, DELAY_CHANNELS, DG535, DG535Error, MAX_RATE, MIN_RATE, REFERENCE_CHANNELS,
+                          TRIGGER_MODES, TRIGGER_SLOPES, parse_delay_setting)
+from dg535_history import StateHistory
+from dg535_journal import CommandJournal
+from dg535_poller import POLL_TICK, PollScheduler, poll_settings
+from dg535_presets import PresetLibrary
+from dg535_qt_worker import DG535QtWorker
+from dg535_snapshot import StateSnapshot, differences
+import dg535_actions
 """
 This code allows to create a GUI in order to communicate with DG535 Pulse Shaper/Delay Generator.
 It works mainly according to MuEDM 09/2024 beam test requirements.
@@ -14,6 +24,20 @@ You can also switch to Single Shot mode (for instance, to stop the trigger).
 For every trigger mode you can select the slope (Raising or Falling).
 """
 
+def delay_text(state, channel):
+    """"reference,delay" of a channel, "unknown" until it has been read (e.g. after a failed write)."""
+    if state.delays[channel] is None:
+        return "unknown"
+    return "{},{}".format(*state.delays[channel])
+
+
+def pulse_width_text(state, channel):
+    try:
+        return state.pulse_width(channel)
+    except (TypeError, DG535Error):
+        return "unknown"
+
+
 class MainWindow(QMainWindow): #RIcorda di riaggiungere l'eredità
     def __init__(self):
         super().__init__()
@@ -22,25 +46,76 @@ class MainWindow(QMainWindow): #RIcorda di riaggiungere l'eredità
         self.setWindowTitle("DG535 Working Interface")
         self.setGeometry(500, 100, 400, 500)
 
-        # Connect to the DG535 device
-        self.connect_to_dg535()
+        # Settings saved at the last run, shown until the DG535 has been read
+        self.snapshot = StateSnapshot()
+        saved_state = self.snapshot.load()
+        # The I/O thread owns the DG535, the window only gets the results (dg535_qt_worker.py);
+        # every command sent is kept in the journal, every setting observed in the history
+        self.worker = DG535QtWorker(snapshot=self.snapshot, journal=CommandJournal(), history=StateHistory())
+        self.dg535 = DG535()
+        self.dg535_address = self.snapshot.address
+        if saved_state is not None:
+            self.dg535.state = saved_state.copy()
 
         # Set up the UI
         self.setup_ui()
-
-        # Initialize dummy variables
-        self.refresh_settings()
-
-
-    def connect_to_dg535(self):
-        """Initialize the VISA resource manager and connect to DG535."""
-        self.rm = pyvisa.ResourceManager()
-        devices = self.rm.list_resources()
-        print(f"Available devices: {devices}")
-
-        # Assuming the DG535 is the only GPIB device connected
-        self.dg535_address = [device for device in devices if "GPIB" in device][0]
-        self.dg535 = self.rm.open_resource(dg535_address)
+        if saved_state is not None:
+            self.connection_label.setText(f"...Last known settings of {self.dg535_address}, connecting...")
+            self.show_settings()
+
+        # Connect to the DG535 device once the window is shown, then check the saved settings
+        QTimer.singleShot(0, lambda: self.verify_settings(saved_state))
+
+        # Auto-refresh: the settings due are polled (dg535_poller.py), never while a request is in flight
+        self.poller = None
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.auto_refresh)
+        self.refresh_timer.start(POLL_TICK)
+
+
+    def verify_settings(self, saved_state):
+        """Connect and read the settings on the I/O thread, then flag the ones that differ from the saved ones."""
+        def connected(result):
+            # Assuming the DG535 is the only GPIB device connected
+            devices, self.dg535 = result
+            print(f"Available devices: {devices}")
+            self.dg535_address = self.dg535.address
+            self.connection_label.setText(f"...Connected to {self.dg535_address}...")
+            self.show_settings()
+            changed = differences(saved_state, self.dg535.state) if saved_state is not None else []
+            if changed:
+                lines = "\n".join(f"{name}: {old} -> {new}" for name, old, new in changed)
+                QMessageBox.warning(self, "Settings changed", f"The settings of the DG535 differ from the last known ones:\n{lines}")
+
+        def failed(e):
+            self.connection_label.setText("...Not connected...")
+            QMessageBox.warning(self, "Connection", f"Could not read the DG535: {e}")
+
+        self.worker.connect(on_done=connected, on_error=failed)
+
+    def auto_refresh(self):
+        """Tick of the auto-refresh timer: the settings that are due are read in one message."""
+        if not self.dg535.connected or self.worker.busy:
+            return
+        if self.poller is None or self.poller.health is not self.dg535.health:
+            self.poller = PollScheduler(self.dg535.health)
+        names = self.poller.due(self.dg535.state)
+        if not names:
+            return
+        device = self.dg535
+
+        def polled(changed):
+            if device is not self.dg535:
+                return
+            self.poller.polled(names, device.state)
+            if device.health.consecutive_failures:
+                self.connection_label.setText(f"...{self.dg535_address} not responding...")
+            else:
+                self.connection_label.setText(f"...Connected to {self.dg535_address}...")
+            if changed:
+                self.show_settings()
+
+        self.worker.submit(poll_settings, names, on_done=polled, on_error=lambda e: polled([]))
 
     def setup_ui(self):
 
@@ -49,8 +124,8 @@ class MainWindow(QMainWindow): #RIcorda di riaggiungere l'eredità
 
         # Connection Layout
         connection_layout = QVBoxLayout()
-        connection_label = QLabel(f"...Connected to {self.dg535_address}...")
-        connection_layout.addWidget(connection_label)
+        self.connection_label = QLabel("...Connecting...")
+        connection_layout.addWidget(self.connection_label)
 
         # Settings Layout
         settings_layout = QVBoxLayout()
@@ -88,17 +163,23 @@ class MainWindow(QMainWindow): #RIcorda di riaggiungere l'eredità
         modify_button = QPushButton("Modify")
         store_button = QPushButton("Store")
         recall_button = QPushButton("Recall")
+        save_preset_button = QPushButton("Save preset")
+        apply_preset_button = QPushButton("Apply preset")
 
         # Connect button signals to their slots
         refresh_button.clicked.connect(self.refresh_settings)
         modify_button.clicked.connect(self.open_modify_window)
         store_button.clicked.connect(self.store_settings)
         recall_button.clicked.connect(self.recall_settings)
+        save_preset_button.clicked.connect(self.save_preset)
+        apply_preset_button.clicked.connect(self.apply_preset)
 
         pressable_layout.addWidget(refresh_button)
         pressable_layout.addWidget(modify_button)
         pressable_layout.addWidget(store_button)
         pressable_layout.addWidget(recall_button)
+        pressable_layout.addWidget(save_preset_button)
+        pressable_layout.addWidget(apply_preset_button)
 
         # General Layout Assembly
         general_layout.addLayout(connection_layout)
@@ -114,22 +195,28 @@ class MainWindow(QMainWindow): #RIcorda di riaggiungere l'eredità
 
     def open_modify_window(self):
         # Create an instance of the secondary window and show it
-        self.modify_window = SecondaryWindow()
+        self.modify_window = SecondaryWindow(self.worker, self.show_settings)
         self.modify_window.show()
 
     def refresh_settings(self):
         """Refresh the settings from the DG535 and update UI elements."""
-        # Query the DG535 for the latest settings
-        self.trigger_rate = self.dg535.query("TR?").strip()
-        self.trigger_mode = self.dg535.query("TM?").strip()
-        self.trigger_slope = self.dg535.query("TS?").strip()
-        self.delay_T0 = self.dg535.query("DT? 1").strip()
-        self.delay_A = self.dg535.query("DT? 2").strip()
-        self.delay_B = self.dg535.query("DT? 3").strip()
-        self.delay_AB = self.dg535.query("DT? 4").strip()
-        self.delay_C = self.dg535.query("DT? 5").strip()
-        self.delay_D = self.dg535.query("DT? 6").strip()
-        self.delay_CD = self.dg535.query("DT? 7").strip()
+        # Query the DG535 for the latest settings, on the I/O thread
+        self.worker.submit(dg535_actions.full_refresh, on_done=lambda state: self.show_settings(),
+                           on_error=lambda e: QMessageBox.critical(self, "Error", f"Failed to refresh the settings: {e}"))
+
+    def show_settings(self):
+        """Update the UI elements from the state cached by the driver, without touching the bus."""
+        state = self.dg535.state
+        self.trigger_rate = state.trigger_rate
+        self.trigger_mode = state.trigger_mode
+        self.trigger_slope = state.trigger_slope
+        self.delay_T0 = state.delay(1)
+        self.delay_A = delay_text(state, 2)  # reference channel, delay
+        self.delay_B = delay_text(state, 3)  # reference channel, delay
+        self.delay_AB = pulse_width_text(state, 4)
+        self.delay_C = delay_text(state, 5)  # reference channel, delay
+        self.delay_D = delay_text(state, 6)  # reference channel, delay
+        self.delay_CD = pulse_width_text(state, 7)
 
         # Update the UI elements
         self.trigger_label_1.setText(f"     - Trigger mode: {self.trigger_mode}.")
@@ -149,12 +236,10 @@ class MainWindow(QMainWindow): #RIcorda di riaggiungere l'eredità
         slot, ok = QInputDialog.getInt(self, "Store Settings", "Select a slot (1-9):", min=1, max=9, step=1)
 
         if ok:
-            try:
-                # Send store command to DG535
-                self.dg535.write(f"ST {slot}")
-                QMessageBox.information(self, "Success", f"Settings stored in slot {slot}.")
-            except pyvisa.VisaIOError as e:
-                QMessageBox.critical(self, "Error", f"Failed to store settings: {e}")
+            # Send store command to DG535
+            self.worker.submit(dg535_actions.store_settings, slot,
+                               on_done=lambda _: QMessageBox.information(self, "Success", f"Settings stored in slot {slot}."),
+                               on_error=lambda e: QMessageBox.critical(self, "Error", f"Failed to store settings: {e}"))
 
     def recall_settings(self):
         """Recall settings from a selected slot (1-9)."""
@@ -162,19 +247,53 @@ class MainWindow(QMainWindow): #RIcorda di riaggiungere l'eredità
         slot, ok = QInputDialog.getInt(self, "Recall Settings", "Select a slot (1-9):", min=1, max=9, step=1)
 
         if ok:
-            try:
-                # Send recall command to DG535
-                self.dg535.write(f"RC {slot}")
+            def recalled(state):
+                self.show_settings()
                 QMessageBox.information(self, "Success", f"Settings recalled from slot {slot}.")
-                self.refresh_settings()  # Refresh settings to update the UI
-            except pyvisa.VisaIOError as e:
-                QMessageBox.critical(self, "Error", f"Failed to recall settings: {e}")
+
+            # Send recall command to DG535, the driver reads the recalled settings back
+            self.worker.submit(dg535_actions.recall_settings, slot, on_done=recalled,
+                               on_error=lambda e: QMessageBox.critical(self, "Error", f"Failed to recall settings: {e}"))
+
+    def save_preset(self):
+        """Save the current settings as a named preset of the host library (no limit of slots)."""
+        name, ok = QInputDialog.getText(self, "Save preset", "Preset name:")
+        if ok and name:
+            try:
+                PresetLibrary().save(name, self.dg535.state)
+                QMessageBox.information(self, "Success", f"Settings saved as preset {name}.")
+            except (DG535Error, OSError) as e:
+                QMessageBox.critical(self, "Error", f"Failed to save the preset: {e}")
+
+    def apply_preset(self):
+        """Apply a preset of the host library, only the settings that differ are sent."""
+        try:
+            library = PresetLibrary()
+        except (OSError, ValueError) as e:
+            QMessageBox.critical(self, "Error", f"Failed to read the presets: {e}")
+            return
+        if not library.names:
+            QMessageBox.information(self, "Apply preset", "There are no presets yet.")
+            return
+        name, ok = QInputDialog.getItem(self, "Apply preset", "Preset:", library.names, editable=False)
+        if ok:
+            def applied(written):
+                self.show_settings()
+                QMessageBox.information(self, "Success", f"Preset {name} applied, {written} settings changed.")
+
+            def failed(e):
+                self.show_settings()
+                QMessageBox.critical(self, "Error", f"Failed to apply the preset: {e}")
+
+            self.worker.submit(dg535_actions.apply_preset, library.get(name), on_done=applied, on_error=failed)
 
 
 
 class SecondaryWindow(QWidget): #RIcorda di riaggiungere l'eredità
-    def __init__(self):
+    def __init__(self, worker, on_change=None):
         super().__init__()
+        self.worker = worker  # The settings are applied on its I/O thread
+        self.on_change = on_change  # Called after every applied setting, to update the main window
         self.setWindowTitle("Modify the settings")
         self.resize(600,100)
         self.setup_ui()
@@ -182,6 +301,8 @@ class SecondaryWindow(QWidget): #RIcorda di riaggiungere l'eredità
     def setup_ui(self):
         # Set up the layout for the secondary window
         modify_window_layout = QVBoxLayout()
+        # Result of the last Apply all, next to each field
+        self.status_labels = {}
 
         # Trigger mode layout
         trigger_mode_layout = QHBoxLayout()
@@ -193,6 +314,7 @@ class SecondaryWindow(QWidget): #RIcorda di riaggiungere l'eredità
         trigger_mode_layout.addWidget(trigger_mode_label)
         trigger_mode_layout.addWidget(self.trigger_mode_line)
         trigger_mode_layout.addWidget(trigger_mode_button)
+        self.add_status_label("trigger_mode", trigger_mode_layout)
 
         # Trigger rate layout
         trigger_rate_layout = QHBoxLayout()
@@ -204,6 +326,7 @@ class SecondaryWindow(QWidget): #RIcorda di riaggiungere l'eredità
         trigger_rate_layout.addWidget(trigger_rate_label)
         trigger_rate_layout.addWidget(self.trigger_rate_line)
         trigger_rate_layout.addWidget(trigger_rate_button)
+        self.add_status_label("trigger_rate", trigger_rate_layout)
 
         # Trigger slope layout
         trigger_slope_layout = QHBoxLayout()
@@ -215,6 +338,7 @@ class SecondaryWindow(QWidget): #RIcorda di riaggiungere l'eredità
         trigger_slope_layout.addWidget(trigger_slope_label)
         trigger_slope_layout.addWidget(self.trigger_slope_line)
         trigger_slope_layout.addWidget(trigger_slope_button)
+        self.add_status_label("trigger_slope", trigger_slope_layout)
 
         # Define all the layout for delays
         delay_t0_layout = QHBoxLayout()
@@ -235,28 +359,31 @@ class SecondaryWindow(QWidget): #RIcorda di riaggiungere l'eredità
         self.delay_t0_line = QLineEdit()
         self.delay_t0_line.setPlaceholderText("Enter T0 delay...")
         delay_t0_button = QPushButton("Enter")
-        delay_t0_button.clicked.connect(self.write_on_dg535_t0)
+        delay_t0_button.clicked.connect(self.write_on_dg535_dtt0)
         delay_t0_layout.addWidget(delay_t0_label)
         delay_t0_layout.addWidget(self.delay_t0_line)
         delay_t0_layout.addWidget(delay_t0_button)
+        self.add_status_label("T0", delay_t0_layout)
 
         delay_a_label = QLabel("A:")
         self.delay_a_line = QLineEdit()
         self.delay_a_line.setPlaceholderText("Enter A delay...")
         delay_a_button = QPushButton("Enter")
-        delay_a_button.clicked.connect(self.write_on_dg535_a)
+        delay_a_button.clicked.connect(self.write_on_dg535_dta)
         delay_a_layout.addWidget(delay_a_label)
         delay_a_layout.addWidget(self.delay_a_line)
         delay_a_layout.addWidget(delay_a_button)
+        self.add_status_label("A", delay_a_layout)
 
         delay_b_label = QLabel("B:")
         self.delay_b_line = QLineEdit()
         self.delay_b_line.setPlaceholderText("Enter B delay...")
         delay_b_button = QPushButton("Enter")
-        delay_b_button.clicked.connect(self.write_on_dg535_b)
+        delay_b_button.clicked.connect(self.write_on_dg535_dtb)
         delay_b_layout.addWidget(delay_b_label)
         delay_b_layout.addWidget(self.delay_b_line)
         delay_b_layout.addWidget(delay_b_button)
+        self.add_status_label("B", delay_b_layout)
 
         #delay_ab_label = QLabel("AB:")
         #self.delay_ab_line = QLineEdit()
@@ -271,19 +398,21 @@ class SecondaryWindow(QWidget): #RIcorda di riaggiungere l'eredità
         self.delay_c_line = QLineEdit()
         self.delay_c_line.setPlaceholderText("Enter C delay...")
         delay_c_button = QPushButton("Enter")
-        delay_c_button.clicked.connect(self.write_on_dg535_c)
+        delay_c_button.clicked.connect(self.write_on_dg535_dtc)
         delay_c_layout.addWidget(delay_c_label)
         delay_c_layout.addWidget(self.delay_c_line)
         delay_c_layout.addWidget(delay_c_button)
+        self.add_status_label("C", delay_c_layout)
 
         delay_d_label = QLabel("D:")
         self.delay_d_line = QLineEdit()
         self.delay_d_line.setPlaceholderText("Enter D delay...")
         delay_d_button = QPushButton("Enter")
-        delay_d_button.clicked.connect(self.write_on_dg535_d)
+        delay_d_button.clicked.connect(self.write_on_dg535_dtd)
         delay_d_layout.addWidget(delay_d_label)
         delay_d_layout.addWidget(self.delay_d_line)
         delay_d_layout.addWidget(delay_d_button)
+        self.add_status_label("D", delay_d_layout)
 
         #delay_cd_label = QLabel("CD:")
         #self.delay_cd_line = QLineEdit()
@@ -309,55 +438,212 @@ class SecondaryWindow(QWidget): #RIcorda di riaggiungere l'eredità
         modify_window_layout.addLayout(delay_d_layout)
         #modify_window_layout.addLayout(delay_cd_layout)
 
+        # Apply all: the filled fields are checked together and sent in a single message
+        apply_all_layout = QHBoxLayout()
+        apply_all_button = QPushButton("Apply all")
+        apply_all_button.clicked.connect(self.apply_all)
+        clear_button = QPushButton("Clear")
+        clear_button.clicked.connect(self.clear_fields)
+        self.apply_all_label = QLabel("Fill any fields, then Apply all")
+        apply_all_layout.addWidget(apply_all_button)
+        apply_all_layout.addWidget(clear_button)
+        apply_all_layout.addWidget(self.apply_all_label)
+        modify_window_layout.addLayout(apply_all_layout)
+
+        # Field name -> line edit, in the order they are shown
+        self.fields = {"trigger_mode": self.trigger_mode_line, "trigger_rate": self.trigger_rate_line,
+                       "trigger_slope": self.trigger_slope_line, "T0": self.delay_t0_line,
+                       "A": self.delay_a_line, "B": self.delay_b_line, "C": self.delay_c_line, "D": self.delay_d_line}
+
         # Assign the layout to the window
         self.setLayout(modify_window_layout)
 
+    def add_status_label(self, field, layout):
+        label = QLabel("")
+        self.status_labels[field] = label
+        layout.addWidget(label)
+
+    def apply_setting(self, read_values, action):
+        """
+        Read the values entered (on the GUI thread) and apply them with action(dg535, *values)
+        on the I/O thread: nothing is sent if the device already holds the value.
+        Invalid values are reported instead of raising inside the Qt slot.
+        """
+        try:
+            values = read_values()
+        except (ValueError, DG535Error) as e:
+            QMessageBox.warning(self, "Error", f"The setting could not be applied: {e}")
+            return
+        self.worker.submit(action, *values, on_done=lambda _: self.on_change and self.on_change(),
+                           on_error=lambda e: QMessageBox.warning(self, "Error", f"The setting could not be applied: {e}"))
+
     def write_on_dg535_tm(self):
-        # Write the code in the machine and execute it
-        self.dg535.write(f"TM {trigger_mode_line}")
-        if trigger_mode_line == 2:
-            self.dg535.write(f"SS") # Need this to trigger once after changing trigger mode
+        # Write the code in the machine and execute it, single shot mode also triggers once
+        self.apply_setting(lambda: (int(self.trigger_mode_line.text()),), dg535_actions.change_trigger_mode)
 
     def write_on_dg535_tr(self):
-        # Write the code in the machine and execute it
-        self.dg535.write(f"TR {trigger_rate_line}")
+        # Write the code in the machine and execute it, within the rates the interfaces allow
+        self.apply_setting(lambda: (parse_field("trigger_rate", self.trigger_rate_line.text()),), dg535_actions.change_frequency)
 
     def write_on_dg535_ts(self):
         # Write the code in the machine and execute it
-        self.dg535.write(f"TS {trigger_slope_line}")
+        self.apply_setting(lambda: (int(self.trigger_slope_line.text()),), dg535_actions.change_trigger_slope)
+
+    def write_on_dg535_delay(self, channel, line):
+        # Write the code in the machine and execute it, the delay is entered as "i,j"
+        def read_values():
+            reference, t = parse_delay_setting(line.text())
+            return channel, t, reference
+        self.apply_setting(read_values, dg535_actions.set_delay)
 
     def write_on_dg535_dtt0(self):
-        # Write the code in the machine and execute it
-        self.dg535.write(f"DT 1,{delay_t0_line}")
+        self.write_on_dg535_delay(1, self.delay_t0_line)
 
     def write_on_dg535_dta(self):
-        # Write the code in the machine and execute it
-        self.dg535.write(f"DT 2,{delay_a_line}")
+        self.write_on_dg535_delay(2, self.delay_a_line)
 
     def write_on_dg535_dtb(self):
-        # Write the code in the machine and execute it
-        self.dg535.write(f"DT 3,{delay_b_line}")
+        self.write_on_dg535_delay(3, self.delay_b_line)
 
     #def write_on_dg535_dtab(self):
-    #    # Write the code in the machine and execute it
-    #    self.dg535.write(f"DT 4,{delay_ab_line}")
+    #    self.write_on_dg535_delay(4, self.delay_ab_line)
 
     def write_on_dg535_dtc(self):
-        # Write the code in the machine and execute it
-        self.dg535.write(f"DT 5,{delay_c_line}")
+        self.write_on_dg535_delay(5, self.delay_c_line)
 
     def write_on_dg535_dtd(self):
-        # Write the code in the machine and execute it
-        self.dg535.write(f"DT 6,{delay_d_line}")
+        self.write_on_dg535_delay(6, self.delay_d_line)
 
     #def write_on_dg535_dtcd(self):
-    #    # Write the code in the machine and execute it
-    #    self.dg535.write(f"DT 7,{delay_cd_line}")
+    #    self.write_on_dg535_delay(7, self.delay_cd_line)
+
+    # Apply all
+
+    def staged_settings(self):
+        """
+        The values of the filled fields, checked together against the cached settings and the
+        constraints of the delays (dg535_constraints.py), nothing is sent.
+        Returns (values, errors): field -> value, field -> reason it cannot be applied ("" for the whole edit).
+        """
+        values = {}
+        errors = {}
+        for field, line in self.fields.items():
+            text = line.text().strip()
+            if text:
+                try:
+                    values[field] = parse_field(field, text)
+                except (ValueError, DG535Error) as e:
+                    errors[field] = str(e) or "invalid value"
+        if not values:
+            return values, errors
+        dg535 = self.worker.dg535
+        if dg535 is None:
+            errors[""] = "The DG535 is not connected"
+            return values, errors
+        try:
+            graph = DelayGraph.from_state(dg535.state)
+        except DG535Error as e:
+            errors[""] = str(e)
+            return values, errors
+        # the values that could be read are checked together, whatever the others
+        delays = {CHANNELS[field]: value for field, value in values.items() if field in DELAY_FIELDS}
+        trial, problems = graph.what_if(delays, values.get("trigger_rate"))
+        if trial is None:
+            # a reference loop between the delays entered
+            errors.update({field: problems[0] for field in values if field in DELAY_FIELDS})
+            return values, errors
+        # what was already wrong before the edit is not blamed on it
+        known = set(graph.violations())
+        placed = set()
+        for channel in delays:
+            messages = trial.violations([channel])
+            if messages:
+                errors[CHANNEL_NAMES[channel]] = "; ".join(messages)
+                placed.update(messages)
+        if "trigger_rate" in values:
+            late = [problem for problem in trial.period_violations([channel for channel in DELAY_CHANNELS if channel not in delays])
+                    if problem not in known]
+            if late:
+                errors["trigger_rate"] = "; ".join(late)
+                placed.update(late)
+        others = [problem for problem in problems if problem not in placed and problem not in known]
+        if others:
+            errors[""] = "; ".join(others)
+        return values, errors
+
+    def apply_all(self):
+        """Validate the filled fields together, then apply them in one transaction and show the result of each."""
+        for label in self.status_labels.values():
+            label.setText("")
+        values, errors = self.staged_settings()
+        if not values and not errors:
+            self.apply_all_label.setText("Nothing to apply, fill some fields first")
+            return
+        if errors:
+            for field, reason in errors.items():
+                if field:
+                    self.status_labels[field].setText(f"✗ {reason}")
+            self.apply_all_label.setText(errors.get("", "Nothing sent, please correct the fields marked ✗"))
+            return
+
+        def applied(written):
+            for field in values:
+                self.status_labels[field].setText("✓ set" if written[field] else "= already set")
+            self.apply_all_label.setText(f"{sum(written[field] for field in values)} of {len(values)} settings written in one message")
+            if self.on_change is not None:
+                self.on_change()
+
+        def failed(e):
+            # the driver reads the settings again, none of them is known to be applied
+            for field in values:
+                self.status_labels[field].setText("✗ not applied")
+            self.apply_all_label.setText(f"The settings could not be applied: {e}")
+
+        self.apply_all_label.setText("Applying...")
+        # single shot mode also triggers once, as with its Enter button
+        self.worker.submit(dg535_actions.apply_settings, values, values.get("trigger_mode") == 2,
+                           on_done=applied, on_error=failed)
+
+    def clear_fields(self):
+        for field, line in self.fields.items():
+            line.clear()
+            self.status_labels[field].setText("")
+        self.apply_all_label.setText("Fill any fields, then Apply all")
+
+
+# Fields of the delay channels, A to D (T0 is the reference of the others)
+DELAY_FIELDS = [CHANNEL_NAMES[channel] for channel in DELAY_CHANNELS]
+
+
+def parse_field(field, text):
+    """Value of a field of the modify window, ValueError or DG535Error if it is not valid."""
+    if field == "trigger_mode":
+        mode = int(text)
+        if mode not in TRIGGER_MODES:
+            raise DG535Error(f"Invalid trigger mode: {mode}")
+        return mode
+    if field == "trigger_rate":
+        rate = float(text)
+        if not MIN_RATE <= rate <= MAX_RATE:
+            raise DG535Error(f"Invalid trigger rate: {rate} (from {MIN_RATE:g} to {MAX_RATE:g} Hz)")
+        return rate
+    if field == "trigger_slope":
+        slope = int(text)
+        if slope not in TRIGGER_SLOPES:
+            raise DG535Error(f"Invalid trigger slope: {slope}")
+        return slope
+    if field not in DELAY_FIELDS:
+        raise DG535Error(f"Channel {field} has no programmable delay")
+    reference, t = parse_delay_setting(text)
+    if reference not in REFERENCE_CHANNELS or reference == CHANNELS[field]:
+        raise DG535Error(f"Channel {field} cannot be referred to channel {reference}")
+    return reference, t
 
 
 def main():
     app = QApplication(sys.argv)
     main_window = MainWindow()
+    app.aboutToQuit.connect(main_window.worker.stop)
     main_window.show()
     sys.exit(app.exec())
 
@@ -0,0 +1,354 @@
+"""
+Headless daemon that owns the DG535 session and serves it to local clients.
+
+Only the daemon talks to the instrument: the requests of every client are run one
+at a time on a single worker thread, the reads of the settings are answered from the
+cached state without touching the bus, and the clients that subscribed are told
+whenever the settings change. Every client has its own writer thread, a client that
+stops reading is disconnected instead of holding up the bus.
+
+    python utils/dg535_daemon.py                     # TCP on 127.0.0.1:5350
+    python utils/dg535_daemon.py --unix /tmp/dg535.sock
+
+The protocol is one JSON object per line:
+
+    request   {"id": 1, "op": "set_delay", "args": [5, 0.00025]}
+    reply     {"id": 1, "ok": true, "result": true}
+              {"id": 1, "ok": false, "error": "Channel 4 has no programmable delay"}
+    event     {"event": "state", "state": {...}}       (after {"op": "subscribe"})
+
+    client = DG535Client()
+    client.subscribe(lambda state: print(state.trigger_rate))
+    client.set_trigger_rate(20)
+"""
+import argparse
+import itertools
+import json
+import queue
+import socket
+import socketserver
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from loguru import logger
+
+from dg535_driver import DG535, DG535Error, DG535State, resource_manager
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 5350
+# Messages waiting for a client beyond which its events are not queued: the client is dropped
+MAX_BACKLOG = 64
+
+# Operations run on the bus worker, called as function(dg535, *args)
+BUS_OPERATIONS = {
+    "refresh": DG535.refresh,
+    "check_connection": DG535.check_connection,
+    "reconnect": DG535.reconnect,
+    "set_delay": DG535.set_delay,
+    "set_trigger_rate": DG535.set_trigger_rate,
+    "set_trigger_mode": DG535.set_trigger_mode,
+    "set_trigger_slope": DG535.set_trigger_slope,
+    "single_shot": DG535.single_shot,
+    "store": DG535.store,
+    "recall": DG535.recall,
+}
+
+
+def _jsonable(result):
+    if isinstance(result, DG535State):
+        return result.as_dict()
+    return result
+
+
+def _encode(message):
+    return (json.dumps(message, separators=(",", ":")) + "\n").encode()
+
+
+class DG535Daemon:
+    """
+    @params dg535 : the connected driver, owned by the daemon from now on
+    """
+
+    def __init__(self, dg535):
+        self.dg535 = dg535
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="dg535-bus")
+        self._lock = threading.Lock()
+        self._state = dg535.state.as_dict()
+        self._subscribers = set()
+        self.server = None
+
+    def state(self):
+        """The cached settings, no bus access."""
+        with self._lock:
+            return self._state
+
+    def execute(self, op, args=()):
+        """Run one request, the bus operations wait for their turn on the worker."""
+        if op == "state":
+            return self.state()
+        if op == "metrics":
+            return self._executor.submit(self.dg535.metrics.as_dict).result()
+        if op not in BUS_OPERATIONS:
+            raise DG535Error(f"Unknown operation: {op}")
+        return _jsonable(self._executor.submit(self._run, BUS_OPERATIONS[op], args).result())
+
+    def _run(self, function, args):
+        try:
+            return function(self.dg535, *args)
+        finally:
+            self._publish()
+
+    def _publish(self):
+        """Update the cached settings and notify the subscribers if they changed (on the bus worker)."""
+        state = self.dg535.state.as_dict()
+        with self._lock:
+            if state == self._state:
+                return
+            self._state = state
+            subscribers = list(self._subscribers)
+        message = _encode({"event": "state", "state": state})
+        # never blocks: each client has its own writer thread, a slow one only delays itself
+        for subscriber in subscribers:
+            subscriber.notify(message)
+
+    def subscribe(self, handler):
+        with self._lock:
+            self._subscribers.add(handler)
+
+    def unsubscribe(self, handler):
+        with self._lock:
+            self._subscribers.discard(handler)
+
+    def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix=None):
+        """Serve until shutdown() is called, on a Unix socket if a path is given."""
+        if unix is not None:
+            self.server = _UnixServer(unix, _Handler)
+        else:
+            self.server = _TCPServer((host, port), _Handler)
+        self.server.daemon = self
+        logger.info("DG535 daemon serving {} on {}", self.dg535.address, unix or f"{host}:{self.server.server_address[1]}")
+        self.server.serve_forever()
+
+    def shutdown(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        self._executor.shutdown(wait=True)
+        self.dg535.close()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """One client connection, its replies and events are written by its own writer thread."""
+
+    def setup(self):
+        super().setup()
+        self.outbox = queue.Queue()
+        self.writer = threading.Thread(target=self._write, name="dg535-client-writer", daemon=True)
+        self.writer.start()
+
+    def finish(self):
+        self.outbox.put(None)
+        self.writer.join()
+        super().finish()
+
+    def _write(self):
+        while True:
+            message = self.outbox.get()
+            if message is None:
+                return
+            try:
+                self.wfile.write(message)
+                self.wfile.flush()
+            except OSError:
+                self.server.daemon.unsubscribe(self)
+                return
+
+    def send(self, message):
+        """Queue a reply, written in order with the events."""
+        self.outbox.put(message)
+
+    def notify(self, message):
+        """Queue an event without waiting; a client that does not keep up is disconnected."""
+        if self.outbox.qsize() < MAX_BACKLOG:
+            self.outbox.put(message)
+            return
+        self.server.daemon.unsubscribe(self)
+        logger.warning("DG535 daemon: dropping the client {}, it does not read its events", self.client_address)
+        try:
+            # ends the read loop of handle(), the connection is then closed
+            self.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def handle(self):
+        daemon = self.server.daemon
+        try:
+            for line in self.rfile:
+                if line.strip():
+                    self.send(_encode(self.reply(daemon, line)))
+        finally:
+            daemon.unsubscribe(self)
+
+    def reply(self, daemon, line):
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            if request.get("op") == "subscribe":
+                daemon.subscribe(self)
+                result = daemon.state()
+            else:
+                result = daemon.execute(request.get("op"), request.get("args", ()))
+        except Exception as e:
+            return {"id": request_id, "ok": False, "error": str(e) or type(e).__name__}
+        return {"id": request_id, "ok": True, "result": result}
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+else:
+    _UnixServer = None
+
+
+class DG535Client:
+    """
+    Client of the daemon, its methods mirror those of the driver.
+    @params unix : path of the Unix socket, otherwise host and port are used
+    @params timeout : seconds to wait for a reply
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, unix=None, timeout=10.0):
+        if unix is not None:
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.settimeout(timeout)
+            self.sock.connect(unix)
+        else:
+            self.sock = socket.create_connection((host, port), timeout)
+        # the reader thread waits for the daemon as long as needed
+        self.sock.settimeout(None)
+        self.timeout = timeout
+        self._rfile = self.sock.makefile("rb")
+        self._wfile = self.sock.makefile("wb")
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._lock = threading.Lock()
+        # called with the new DG535State whenever the settings change, after subscribe()
+        self.listeners = []
+        threading.Thread(target=self._read, name="dg535-client", daemon=True).start()
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def call(self, op, *args):
+        """Send one request and wait for its reply, DG535Error if it failed."""
+        request_id = next(self._ids)
+        reply = queue.Queue(maxsize=1)
+        with self._lock:
+            self._pending[request_id] = reply
+            self._wfile.write(_encode({"id": request_id, "op": op, "args": args}))
+            self._wfile.flush()
+        try:
+            message = reply.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"The DG535 daemon did not answer to {op}") from None
+        finally:
+            with self._lock:
+                self._pending.pop(request_id, None)
+        if not message.get("ok"):
+            raise DG535Error(message.get("error"))
+        return message.get("result")
+
+    def _read(self):
+        try:
+            for line in self._rfile:
+                message = json.loads(line)
+                if "event" in message:
+                    state = DG535State.from_dict(message["state"])
+                    for listener in self.listeners:
+                        listener(state)
+                    continue
+                with self._lock:
+                    reply = self._pending.get(message.get("id"))
+                if reply is not None:
+                    reply.put(message)
+        except (OSError, ValueError):
+            pass
+        # connection closed: the calls still waiting fail at once
+        with self._lock:
+            for reply in self._pending.values():
+                reply.put({"ok": False, "error": "Connection to the DG535 daemon closed"})
+
+    def subscribe(self, listener=None):
+        """Be notified of every change of the settings, returns the current ones."""
+        if listener is not None:
+            self.listeners.append(listener)
+        return DG535State.from_dict(self.call("subscribe"))
+
+    def state(self):
+        """The settings cached by the daemon, no bus access."""
+        return DG535State.from_dict(self.call("state"))
+
+    def refresh(self):
+        return DG535State.from_dict(self.call("refresh"))
+
+    def set_delay(self, channel, t, reference=1):
+        return self.call("set_delay", channel, t, reference)
+
+    def set_trigger_rate(self, rate):
+        return self.call("set_trigger_rate", rate)
+
+    def set_trigger_mode(self, mode):
+        return self.call("set_trigger_mode", mode)
+
+    def set_trigger_slope(self, slope):
+        return self.call("set_trigger_slope", slope)
+
+    def single_shot(self):
+        return self.call("single_shot")
+
+    def store(self, slot):
+        return self.call("store", slot)
+
+    def recall(self, slot):
+        return DG535State.from_dict(self.call("recall", slot))
+
+    def metrics(self):
+        return self.call("metrics")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the DG535 to the local clients")
+    parser.add_argument("--address", help="GPIB address of the DG535 (default: the first GPIB device)")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", metavar="PATH", help="serve on a Unix socket instead of TCP")
+    args = parser.parse_args(argv)
+    if args.unix and _UnixServer is None:
+        parser.error("Unix sockets are not available on this platform")
+
+    dg535 = DG535(rm=resource_manager()).connect(args.address)
+    dg535.refresh()
+    daemon = DG535Daemon(dg535)
+    try:
+        daemon.serve(args.host, args.port, args.unix)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,504 @@
+"""
+Driver for the DG535 Pulse/Delay Generator.
+
+A DG535 object owns the VISA session and keeps an in-memory mirror of the
+instrument settings (trigger mode, rate, slope and the delay channels).
+The interfaces read the current settings from the mirror instead of querying
+the device every time a button is pressed: the mirror is filled once by
+refresh() and then kept up to date by every write that goes through the driver.
+"""
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from dg535_health import ConnectionHealth
+from dg535_metrics import BusMetrics
+from dg535_parser import parse_reply, parse_replies
+from dg535_startup import timed_import
+
+
+# Channel numbers used by the DG535 commands
+CHANNELS = {"Trig": 0, "T0": 1, "A": 2, "B": 3, "AB": 4, "C": 5, "D": 6, "CD": 7}
+CHANNEL_NAMES = {number: name for name, number in CHANNELS.items()}
+
+# The channels with a programmable delay, and the ones a delay can be referred to
+DELAY_CHANNELS = (2, 3, 5, 6)
+REFERENCE_CHANNELS = (1, *DELAY_CHANNELS)
+
+TRIGGER_MODES = {0: "INT", 1: "EXT", 2: "SS", 3: "BURST"}
+TRIGGER_SLOPES = {0: "NEGATIVE", 1: "POSITIVE"}
+
+# Size of the DG535 input buffer: commands separated by ";" are packed in messages up to this length
+MAX_MESSAGE_LENGTH = 256
+COMMAND_SEPARATOR = ";"
+
+# Resolution of the delays (5 ps) and relative resolution of the trigger rate (4 digits):
+# a requested value closer than half a step to the cached one would not change the device
+DELAY_RESOLUTION = 5e-12
+RATE_RESOLUTION = 1e-4
+# Range of the instrument: largest delay in seconds, lowest internal trigger rate in Hz
+MAX_DELAY = 999.999999999995
+MIN_RATE = 0.001
+# Highest internal trigger rate the interfaces allow, in Hz (the DG535 itself goes up to 1 MHz)
+MAX_RATE = 100.0
+
+
+class DG535Error(Exception):
+    """Raised when the DG535 cannot be reached or a setting is not valid."""
+
+
+def resource_manager():
+    """
+    The VISA resource manager. When the environment variable DG535_SIMULATE is set
+    a simulated DG535 is used instead of the GPIB bus (see dg535_simulator.py):
+    DG535_SIMULATE=1 gives realistic bus timings, DG535_SIMULATE=fast no latency at all.
+    pyvisa is imported here, on the first connection, not when the interfaces start.
+    """
+    simulate = os.environ.get("DG535_SIMULATE", "")
+    if not simulate or simulate == "0":
+        return timed_import("pyvisa").ResourceManager()
+    from dg535_simulator import GPIB_TIMINGS, NO_LATENCY, SimulatedResourceManager
+    if simulate == "fast":
+        return SimulatedResourceManager(latency=NO_LATENCY)
+    return SimulatedResourceManager(latency=GPIB_TIMINGS, realtime=True)
+
+
+def find_gpib_devices(rm):
+    """Return the addresses of the GPIB devices seen by the resource manager."""
+    return [device for device in rm.list_resources() if "GPIB" in device]
+
+
+def parse_delay_setting(text, reference=1):
+    """
+    Parse a delay entered as "i,t" (reference channel, seconds) or just "t".
+    Returns the tuple (reference, t).
+    """
+    fields = [field.strip() for field in text.split(",")]
+    if len(fields) == 1:
+        return reference, float(fields[0])
+    if len(fields) == 2:
+        return int(fields[0]), float(fields[1])
+    raise ValueError(f"Invalid delay setting: {text!r}")
+
+
+def same_delay(t1, t2):
+    """True if the two delays are the same once rounded to the DG535 resolution."""
+    return abs(t1 - t2) < DELAY_RESOLUTION / 2
+
+
+def same_rate(f1, f2):
+    """True if the two trigger rates are the same within the DG535 resolution."""
+    return abs(f1 - f2) <= RATE_RESOLUTION * max(abs(f1), abs(f2)) / 2
+
+
+class CommandBatch:
+    """
+    Sequence of commands sent to the DG535 packed in as few messages as its input buffer allows.
+    Queries can be mixed with writes, their replies are read back after the message that
+    contains them and returned decoded (see dg535_parser.py), in order, by send().
+    """
+
+    def __init__(self, dg535, max_length=MAX_MESSAGE_LENGTH):
+        self.dg535 = dg535
+        self.max_length = max_length
+        # list of (command, is_query, callback)
+        self.commands = []
+        self.replies = []
+
+    def __len__(self):
+        return len(self.commands)
+
+    def write(self, command):
+        self.commands.append((command, False, None))
+        return self
+
+    def query(self, command, callback=None):
+        """Queue a query, the callback (if any) is called with the reply record once it is read."""
+        self.commands.append((command, True, callback))
+        return self
+
+    def messages(self):
+        """Group the queued commands into messages no longer than max_length."""
+        messages = []
+        current = []
+        length = 0
+        for item in self.commands:
+            extra = len(item[0]) + (len(COMMAND_SEPARATOR) if current else 0)
+            if current and length + extra > self.max_length:
+                messages.append(current)
+                current = []
+                extra = len(item[0])
+                length = 0
+            current.append(item)
+            length += extra
+        if current:
+            messages.append(current)
+        return messages
+
+    def send(self):
+        """Send the queued commands and return the parsed replies of the queries, in order."""
+        replies = []
+        for message in self.messages():
+            self.dg535.send_message(COMMAND_SEPARATOR.join(command for command, _, _ in message))
+            queries = [(command, callback) for command, is_query, callback in message if is_query]
+            raw_replies = self.dg535.read_replies(len(queries))
+            with self.dg535.metrics.timed("parse"):
+                parsed = parse_replies([command for command, _ in queries], raw_replies)
+            for (_, callback), reply in zip(queries, parsed):
+                if callback is not None:
+                    callback(reply)
+                replies.append(reply)
+        self.commands = []
+        self.replies = replies
+        return replies
+
+
+class DG535State:
+    """In-memory mirror of the DG535 settings."""
+
+    def __init__(self):
+        self.trigger_mode = None
+        self.trigger_rate = None
+        self.trigger_slope = None
+        # channel -> (reference channel, delay in seconds)
+        self.delays = {channel: None for channel in DELAY_CHANNELS}
+
+    def delay(self, channel):
+        """Delay of the channel relative to its reference, in seconds."""
+        if channel == CHANNELS["T0"]:
+            return 0.0
+        return self.delays[channel][1]
+
+    def reference(self, channel):
+        """Channel the delay of the given channel is referred to."""
+        if channel == CHANNELS["T0"]:
+            return channel
+        return self.delays[channel][0]
+
+    def absolute_time(self, channel):
+        """Delay of the channel relative to T0, following the reference chain."""
+        time = 0.0
+        seen = set()
+        while channel != CHANNELS["T0"]:
+            if channel in seen or channel not in self.delays:
+                raise DG535Error(f"Invalid reference chain for channel {CHANNEL_NAMES.get(channel, channel)}")
+            seen.add(channel)
+            reference, delay = self.delays[channel]
+            time += delay
+            channel = reference
+        return time
+
+    def pulse_width(self, channel):
+        """Width of the AB or CD output pulse, in seconds."""
+        start, end = {CHANNELS["AB"]: (2, 3), CHANNELS["CD"]: (5, 6)}[channel]
+        return self.absolute_time(end) - self.absolute_time(start)
+
+    @property
+    def complete(self):
+        """True once every setting has been read from the device."""
+        values = [self.trigger_mode, self.trigger_rate, self.trigger_slope, *self.delays.values()]
+        return all(value is not None for value in values)
+
+    def copy(self):
+        state = DG535State()
+        state.trigger_mode = self.trigger_mode
+        state.trigger_rate = self.trigger_rate
+        state.trigger_slope = self.trigger_slope
+        state.delays = dict(self.delays)
+        return state
+
+    def as_dict(self):
+        """The settings as plain JSON-friendly values, the channels being strings."""
+        return {
+            "trigger_mode": self.trigger_mode,
+            "trigger_rate": self.trigger_rate,
+            "trigger_slope": self.trigger_slope,
+            "delays": {str(channel): list(delay) if delay is not None else None for channel, delay in self.delays.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, values):
+        state = cls()
+        state.trigger_mode = values["trigger_mode"]
+        state.trigger_rate = values["trigger_rate"]
+        state.trigger_slope = values["trigger_slope"]
+        for channel, delay in values["delays"].items():
+            state.delays[int(channel)] = tuple(delay) if delay is not None else None
+        return state
+
+
+class DG535:
+    """
+    Connection to a DG535 with a cached copy of its settings.
+
+    @params resource : an already opened VISA resource (optional)
+    @params rm : the VISA resource manager used to open the connection (optional)
+    """
+
+    def __init__(self, resource=None, rm=None):
+        self.rm = rm
+        self.resource = resource
+        self.address = getattr(resource, "resource_name", None)
+        self.state = DG535State()
+        self._batch = None
+        # mnemonic -> number of writes not sent because the device already held the value
+        self.skipped_writes = Counter()
+        self.health = ConnectionHealth()
+        self.metrics = BusMetrics()
+        # a CommandJournal (dg535_journal.py) to keep every command and reply, None not to keep them
+        self.journal = None
+        # a StateHistory (dg535_history.py) to keep every setting observed, None not to keep them
+        self.history = None
+
+    @property
+    def connected(self):
+        return self.resource is not None
+
+    def connect(self, address=None):
+        """
+        Open the VISA session. Without an address the first GPIB device found is used,
+        in case there is more than one device connected please specify the right one.
+        """
+        if self.rm is None:
+            self.rm = resource_manager()
+        if address is None:
+            gpib_devices = find_gpib_devices(self.rm)
+            if not gpib_devices:
+                raise DG535Error("There are no GPIB devices connected!")
+            address = gpib_devices[0]
+        self.resource = self.rm.open_resource(address)
+        self.address = address
+        self.health.reset()
+        return self
+
+    def reconnect(self):
+        """Enumerate the bus again and reopen the session, on the same address if it is still there."""
+        self.close()
+        gpib_devices = find_gpib_devices(self.rm) if self.rm is not None else []
+        self.connect(self.address if self.address in gpib_devices else None)
+        return self.refresh()
+
+    def close(self):
+        if self.resource is not None:
+            try:
+                self.resource.close()
+            except Exception:
+                pass  # the session is dropped anyway, e.g. when the cable has been pulled
+        self.resource = None
+
+    # Raw access to the bus
+
+    def _observed(self, source):
+        """The cached state has been confirmed by the device ("poll", "read") or written to it ("write")."""
+        if self.history is not None:
+            self.history.append(self.state, source)
+
+    def _written(self):
+        """A setter changed the cached state, a batch records it once sent."""
+        if self._batch is None:
+            self._observed("write")
+
+    def _check_connected(self):
+        if self.resource is None:
+            raise DG535Error("The DG535 is not connected")
+
+    def _transaction(self, kind, message, operation, *args):
+        """
+        Run one bus operation ("write", "read" or "query"): its duration and outcome are recorded
+        in the metrics and the journal, and tell the health monitor whether the link is alive.
+        """
+        self._check_connected()
+        start = time.perf_counter()
+        try:
+            result = operation(*args)
+        except Exception as e:
+            duration = time.perf_counter() - start
+            self.metrics.record(kind, message, duration, error=e)
+            if self.journal is not None:
+                self.journal.record(kind, message, duration, error=e)
+            self.health.failure(e)
+            raise
+        duration = time.perf_counter() - start
+        reply = result if kind != "write" else None
+        self.metrics.record(kind, message, duration, reply)
+        if self.journal is not None:
+            self.journal.record(kind, message, duration, reply)
+        self.health.success()
+        return result
+
+    def send_message(self, message):
+        """Write one message (possibly several commands separated by ";") on the bus."""
+        self._transaction("write", message, self.resource.write, message)
+
+    def read_replies(self, count):
+        """Read the replies to count queries, whether they come on separate lines or joined by ";"."""
+        replies = []
+        while len(replies) < count:
+            reply = self._transaction("read", None, self.resource.read)
+            replies.extend(reply.strip() for reply in reply.strip().split(COMMAND_SEPARATOR))
+        return replies
+
+    def write(self, command):
+        """Write a command, or queue it if a batch is open."""
+        if self._batch is not None:
+            self._batch.write(command)
+            return
+        self.send_message(command)
+
+    def query(self, command):
+        if self._batch is not None:
+            raise DG535Error("Queries inside a batch must be queued with batch.query()")
+        return self._transaction("query", command, self.resource.query, command).strip()
+
+    def check_connection(self, idle_timeout=None):
+        """
+        True if the DG535 is reachable. Recent successful traffic is enough proof, a probe
+        (the trigger mode query, which also refreshes the cached mode) is only sent when
+        the link has been idle for longer than idle_timeout or the last transaction failed.
+        No bus enumeration is done here, see reconnect().
+        """
+        if self.resource is None:
+            return False
+        if not self.health.needs_probe(idle_timeout):
+            return True
+        self.health.probes += 1
+        try:
+            self.state.trigger_mode = parse_reply("TM", self.query("TM")).value
+        except Exception:
+            return False
+        self._observed("poll")
+        return True
+
+    @contextmanager
+    def batch(self):
+        """
+        Queue every write done inside the with block and send them together at the end:
+
+            with dg535.batch() as batch:
+                dg535.set_delay(2, 0.0)
+                dg535.set_trigger_mode(0)
+                batch.query("TM")
+            batch.replies  # -> [RegisterReply('TM', 0)]
+
+        A batch opened inside another one joins the outer batch.
+        """
+        if self._batch is not None:
+            yield self._batch
+            return
+        saved_state = self.state.copy()
+        batch = self._batch = CommandBatch(self)
+        try:
+            yield batch
+        except BaseException:
+            # nothing has been sent, the cached state goes back to what the device holds
+            self.state = saved_state
+            raise
+        finally:
+            self._batch = None
+        sent = len(batch)
+        writes = any(not is_query for _, is_query, _ in batch.commands)
+        try:
+            batch.send()
+        except Exception:
+            if writes:
+                # we do not know which commands got through: the cached state must be read again
+                self.state = DG535State()
+            raise
+        if sent:
+            self._observed("read" if batch.replies else "write")
+
+    # Reading the settings
+
+    def refresh(self):
+        """Read every setting from the device, in a single message, and update the cached state."""
+        with self.batch() as batch:
+            batch.query("TR 0", lambda reply: setattr(self.state, "trigger_rate", reply.rate))
+            batch.query("TM", lambda reply: setattr(self.state, "trigger_mode", reply.value))
+            batch.query("TS", lambda reply: setattr(self.state, "trigger_slope", reply.value))
+            for channel in DELAY_CHANNELS:
+                batch.query(f"DT {channel}", lambda reply: self.state.delays.__setitem__(reply.channel, reply.value))
+        return self.state
+
+    def snapshot(self):
+        """Copy of the cached state, read from the device only the first time."""
+        if not self.state.complete:
+            self.refresh()
+        return self.state.copy()
+
+    # Changing the settings
+    # Every setter compares the requested value with the cached state and does not write
+    # when nothing would change (unless force=True). They return True if a write was sent.
+
+    def _skip(self, mnemonic):
+        self.skipped_writes[mnemonic] += 1
+        return False
+
+    def set_delay(self, channel, t, reference=1, force=False):
+        """
+        @params channel : the channel which is being delayed (2=A, 3=B, 5=C, 6=D)
+        @params t : the delay, to be specified in seconds
+        @params reference : the channel the delay is referred to, T0 by default
+        """
+        if channel not in DELAY_CHANNELS:
+            raise DG535Error(f"Channel {channel} has no programmable delay")
+        if reference == channel or reference not in REFERENCE_CHANNELS:
+            raise DG535Error(f"Channel {channel} cannot be referred to channel {reference}")
+        t = float(t)
+        current = self.state.delays[channel]
+        if not force and current is not None and current[0] == reference and same_delay(current[1], t):
+            return self._skip("DT")
+        self.write(f"DT {channel},{reference},{t}")
+        self.state.delays[channel] = (reference, t)
+        self._written()
+        return True
+
+    def set_trigger_rate(self, rate, force=False):
+        """@params rate : the internal trigger frequency in Hz"""
+        rate = float(rate)
+        current = self.state.trigger_rate
+        if not force and current is not None and same_rate(current, rate):
+            return self._skip("TR")
+        self.write(f"TR 0,{rate}")
+        self.state.trigger_rate = rate
+        self._written()
+        return True
+
+    def set_trigger_mode(self, mode, force=False):
+        """@params mode : INT=0, EXT=1, SS=2, BURST=3"""
+        mode = int(mode)
+        if mode not in TRIGGER_MODES:
+            raise DG535Error(f"Invalid trigger mode: {mode}")
+        if not force and self.state.trigger_mode == mode:
+            return self._skip("TM")
+        self.write(f"TM {mode}")
+        self.state.trigger_mode = mode
+        self._written()
+        return True
+
+    def set_trigger_slope(self, slope, force=False):
+        """@params slope : NEGATIVE=0, POSITIVE=1"""
+        slope = int(slope)
+        if slope not in TRIGGER_SLOPES:
+            raise DG535Error(f"Invalid trigger slope: {slope}")
+        if not force and self.state.trigger_slope == slope:
+            return self._skip("TS")
+        self.write(f"TS {slope}")
+        self.state.trigger_slope = slope
+        self._written()
+        return True
+
+    def single_shot(self):
+        """Fire a single shot trigger."""
+        self.write("SS")
+
+    def store(self, slot):
+        """Store the current settings in one of the nine memory slots of the device."""
+        self.write(f"ST {slot}")
+
+    def recall(self, slot):
+        """Recall the settings from a memory slot, the cached state is read again in the same message."""
+        with self.batch():
+            self.write(f"RC {slot}")
+            self.refresh()
+        return self.state
@@ -0,0 +1,41 @@
+"""
+Lock held by the single writer of a file shared between processes (the journal, the history).
+
+flock() on POSIX; on Windows, where the locks are mandatory, msvcrt locks one byte far
+beyond the data, so that the readers are never refused. Elsewhere nothing is locked.
+The lock is released when the file is closed.
+"""
+import os
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+
+# Byte locked on Windows, beyond the end of any file of the interfaces
+WINDOWS_LOCK_OFFSET = 2 ** 31 - 2
+
+
+def lock(fd):
+    """Lock the open file fd for this process without waiting, False if another process holds it."""
+    if fcntl is not None:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        return True
+    if msvcrt is not None:
+        position = os.lseek(fd, 0, os.SEEK_CUR)
+        os.lseek(fd, WINDOWS_LOCK_OFFSET, os.SEEK_SET)
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        finally:
+            os.lseek(fd, position, os.SEEK_SET)
+    return True
@@ -0,0 +1,79 @@
+"""
+Health of the connection to the DG535.
+
+The liveness of the link is judged from the outcome of the real traffic: every write
+or read that succeeds proves the device is there, every one that fails marks the
+link as down. A probe is only needed when the link has been idle for longer than
+idle_timeout, and the bus is enumerated only on an explicit reconnect.
+"""
+import time
+
+
+# Seconds without traffic after which the link has to be probed again
+IDLE_TIMEOUT = 5.0
+
+
+class ConnectionHealth:
+    """
+    @params idle_timeout : seconds without traffic after which needs_probe() becomes True
+    @params clock : monotonic clock in seconds, replaceable for the simulations
+    """
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, clock=time.monotonic):
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self.last_success = None
+        self.last_failure = None
+        self.last_error = None
+        self.consecutive_failures = 0
+        self.probes = 0
+        # last success of a transaction of the host, the polls of dg535_poller.py left out
+        self.last_host_success = None
+        # set by poll_settings() while it polls
+        self.polling = False
+
+    def success(self):
+        """Record a transaction that went through."""
+        self.last_success = self.clock()
+        self.consecutive_failures = 0
+        if not self.polling:
+            self.last_host_success = self.last_success
+
+    def failure(self, error):
+        """Record a transaction that failed (timeout, bus error...)."""
+        self.last_failure = self.clock()
+        self.last_error = error
+        self.consecutive_failures += 1
+
+    def reset(self):
+        """Forget the history, used when a new session is opened."""
+        self.last_success = None
+        self.last_failure = None
+        self.last_error = None
+        self.consecutive_failures = 0
+        self.last_host_success = None
+
+    @property
+    def alive(self):
+        """True if the last transaction succeeded."""
+        return self.last_success is not None and self.consecutive_failures == 0
+
+    def idle_time(self):
+        """Seconds since the last successful transaction, None if there was none."""
+        if self.last_success is None:
+            return None
+        return self.clock() - self.last_success
+
+    def host_idle_time(self):
+        """Seconds since the last successful transaction of the host (not a poll), None if there was none."""
+        if self.last_host_success is None:
+            return None
+        return self.clock() - self.last_host_success
+
+    def needs_probe(self, idle_timeout=None):
+        """True if the recent traffic is not enough to tell the link is alive."""
+        if not self.alive:
+            return True
+        if idle_timeout is None:
+            idle_timeout = self.idle_timeout
+        return self.idle_time() > idle_timeout
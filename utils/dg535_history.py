@@ -0,0 +1,228 @@
+"""
+History of the DG535 settings, kept on disk for the whole run.
+
+Every setting observed by the driver (a probe of the link, a read-back, a write that
+went through) is appended when it differs from the last one, so the history is the
+list of the change points: the settings in force at time t are those of the last
+row at or before t.
+
+The store is columnar: one file per column (time, source, trigger mode, rate and
+slope, reference and delay of A, B, C and D) mapped in memory as a NumPy array, and
+a file with the number of rows. The files grow by CHUNK_ROWS rows at a time. A query
+only touches the pages it needs: the times are searched by bisection and the other
+columns are read at the rows found, so days of history are never loaded in RAM.
+Another process can open the same directory read-only while the interface writes it.
+A directory has a single writer, it holds the lock file: a second interface started
+meanwhile only reads the history, its appends are ignored.
+
+    history = StateHistory(readonly=True)
+    history.state_at(time.time() - 3600)           # DG535State an hour ago
+    values = history.states_at(daq_timestamps)     # {"A": array, "trigger_rate": array, ...}
+    changes = history.between(start, end)          # the rows in force from start to end
+
+NumPy is imported on first use, the interfaces start without it.
+"""
+import os
+import time
+
+from dg535_driver import CHANNEL_NAMES, DELAY_CHANNELS, DG535State
+from dg535_filelock import lock
+
+
+# The rows the files grow by (a bit less than 4 MB for all the columns)
+CHUNK_ROWS = 65536
+SOURCES = ("poll", "read", "write")
+UNKNOWN = -1
+
+COLUMNS = [("time", "<f8"), ("source", "u1"),
+           ("trigger_mode", "i1"), ("trigger_rate", "<f8"), ("trigger_slope", "i1")]
+for _channel in DELAY_CHANNELS:
+    COLUMNS += [(f"{CHANNEL_NAMES[_channel]}_reference", "i1"), (CHANNEL_NAMES[_channel], "<f8")]
+
+
+def default_directory():
+    return os.environ.get("DG535_HISTORY_DIR") or os.path.join(os.path.expanduser("~"), ".dg535", "history")
+
+
+def _key(state):
+    return state.trigger_mode, state.trigger_rate, state.trigger_slope, tuple(state.delays[channel] for channel in DELAY_CHANNELS)
+
+
+def _missing(dtype):
+    """Value of a column for a setting not known: NaN for the floats, UNKNOWN for the integers."""
+    return float("nan") if dtype.startswith("<f") else UNKNOWN
+
+
+class StateHistory:
+    """
+    @params directory : the directory of the column files, default_directory() if not given
+    @params readonly : open an existing history without writing it (another process may be)
+    @params chunk : number of rows the files grow by
+    """
+
+    def __init__(self, directory=None, readonly=False, chunk=CHUNK_ROWS):
+        self.directory = directory or default_directory()
+        self.readonly = readonly
+        self.chunk = chunk
+        # column name -> numpy.memmap, opened on first use
+        self.columns = None
+        self._count = None
+        self._last_key = None
+        self._lock_fd = None
+
+    def _path(self, name):
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def _open(self, capacity=None):
+        import numpy as np
+        if self._count is None:
+            if not self.readonly:
+                # becomes a reader if another process writes the directory
+                self._locked()
+            exists = os.path.exists(self._path("count"))
+            if not exists and self.readonly:
+                raise FileNotFoundError(f"There is no DG535 history in {self.directory}")
+            if not exists:
+                os.makedirs(self.directory, exist_ok=True)
+            self._count = np.memmap(self._path("count"), dtype="<u8", mode="r" if self.readonly else ("r+" if exists else "w+"), shape=(1,))
+        count = int(self._count[0])
+        if self.readonly:
+            capacity = count
+        elif capacity is None:
+            capacity = max(self.chunk, -(-count // self.chunk) * self.chunk)
+        # r+ extends the files to the capacity, the new rows are zeros
+        self.columns = {name: np.memmap(self._path(name), dtype=dtype, mode="r" if self.readonly else ("r+" if os.path.exists(self._path(name)) else "w+"),
+                                        shape=(capacity,)) if capacity else np.zeros(0, dtype=dtype)
+                        for name, dtype in COLUMNS}
+        if count and self._last_key is None and not self.readonly:
+            self._last_key = _key(self._state(count - 1))
+
+    def _locked(self):
+        """Hold the lock file of the directory, False (and the history is read-only) if another process does."""
+        if self._lock_fd is None and not self.readonly:
+            os.makedirs(self.directory, exist_ok=True)
+            fd = os.open(self._path("lock"), os.O_RDWR | os.O_CREAT, 0o644)
+            if lock(fd):
+                self._lock_fd = fd
+            else:
+                os.close(fd)
+                self.readonly = True
+        return self._lock_fd is not None
+
+    def _ready(self):
+        """Open the files, or reopen them read-only when the writer added rows beyond the mapping."""
+        if self.columns is None or (self.readonly and int(self._count[0]) > len(self.columns["time"])):
+            self._open()
+
+    def __len__(self):
+        self._ready()
+        return int(self._count[0])
+
+    def column(self, name):
+        """The values of one column for every row, a view on the file."""
+        return self.columns[name][:len(self)]
+
+    # Writing
+
+    def append(self, state, source="read", when=None):
+        """
+        Add the settings of state (a DG535State) observed at when (epoch seconds, now by default)
+        if they differ from the last row. Returns True if a row was added, never when the
+        history is read-only (another process writes it).
+        """
+        if not self._locked():
+            return False
+        count = len(self)
+        key = _key(state)
+        if key == self._last_key:
+            return False
+        if count == len(self.columns["time"]):
+            self.flush()
+            self._open(count + self.chunk)
+        when = time.time() if when is None else when
+        if count:
+            # the times stay sorted for the bisection, even if the wall clock steps back
+            when = max(when, float(self.columns["time"][count - 1]))
+        values = {"time": when, "source": SOURCES.index(source),
+                  "trigger_mode": state.trigger_mode, "trigger_rate": state.trigger_rate, "trigger_slope": state.trigger_slope}
+        for channel in DELAY_CHANNELS:
+            reference, delay = state.delays[channel] or (None, None)
+            values[f"{CHANNEL_NAMES[channel]}_reference"] = reference
+            values[CHANNEL_NAMES[channel]] = delay
+        for name, dtype in COLUMNS:
+            value = values[name]
+            self.columns[name][count] = _missing(dtype) if value is None else value
+        # the count last: a reader never sees a row half written
+        self._count[0] = count + 1
+        self._last_key = key
+        return True
+
+    def flush(self):
+        if self.columns is None or self.readonly:
+            return
+        for values in self.columns.values():
+            if hasattr(values, "flush"):
+                values.flush()
+        self._count.flush()
+
+    def close(self):
+        self.flush()
+        self.columns = None
+        self._count = None
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
+
+    # Queries
+
+    def index_at(self, t):
+        """Row of the settings in force at time t, -1 if t is before the first row."""
+        import numpy as np
+        return int(np.searchsorted(self.column("time"), t, side="right")) - 1
+
+    def _state(self, row):
+        state = DG535State()
+        columns = self.columns
+        mode, slope = int(columns["trigger_mode"][row]), int(columns["trigger_slope"][row])
+        rate = float(columns["trigger_rate"][row])
+        state.trigger_mode = None if mode == UNKNOWN else mode
+        state.trigger_slope = None if slope == UNKNOWN else slope
+        state.trigger_rate = None if rate != rate else rate
+        for channel in DELAY_CHANNELS:
+            name = CHANNEL_NAMES[channel]
+            reference = int(columns[f"{name}_reference"][row])
+            if reference != UNKNOWN:
+                state.delays[channel] = (reference, float(columns[name][row]))
+        return state
+
+    def state_at(self, t):
+        """The DG535State in force at time t (epoch seconds), None before the first row."""
+        row = self.index_at(t)
+        return self._state(row) if row >= 0 else None
+
+    def states_at(self, times, columns=None):
+        """
+        The settings in force at every time of times (an array of epoch seconds, e.g. the
+        timestamps of DAQ events), as {column: array}; NaN or UNKNOWN before the first row.
+        """
+        import numpy as np
+        rows = np.searchsorted(self.column("time"), np.asarray(times, dtype="<f8"), side="right") - 1
+        known = rows >= 0
+        result = {}
+        for name, dtype in COLUMNS:
+            if columns is not None and name not in columns:
+                continue
+            values = self.column(name)
+            result[name] = np.where(known, values[np.maximum(rows, 0)] if len(values) else _missing(dtype), _missing(dtype))
+        return result
+
+    def between(self, start, end, columns=None):
+        """
+        The rows in force from start to end: the one in force at start, then every change
+        before end. Returns {column: array}, views on the files.
+        """
+        import numpy as np
+        times = self.column("time")
+        first = max(self.index_at(start), 0)
+        last = int(np.searchsorted(times, end, side="left"))
+        return {name: self.column(name)[first:last] for name, _ in COLUMNS if columns is None or name in columns}
@@ -0,0 +1,288 @@
+"""
+Journal of every command sent to the DG535 and of every reply.
+
+Each write, read and query of the driver is one fixed-size record: sequence number,
+monotonic timestamp, wall-clock time, duration, kind, outcome, the UI action it came
+from, the message and the reply (or the error). The records go into a ring file
+allocated once (JOURNAL_CAPACITY records, the oldest ones are overwritten), so the
+journal never grows however long the run.
+
+The driver only puts a tuple in a queue: a background thread packs the records,
+writes them and syncs the file every sync_interval seconds, the bus never waits for
+the disk. The records are written before the header that counts them, and every one
+carries its sequence number, so a crash loses at most the records not written yet.
+A journal has a single writer, it locks the file: a second interface started
+meanwhile does not journal its commands (they are only counted in dropped).
+
+    journal = CommandJournal()
+    dg535.journal = journal
+    with journal_action("Set delay"):
+        dg535.set_delay(2, 250e-6)
+
+The reader gives a NumPy structured array, exported as CSV or .npy, and the times
+at which every delay was changed:
+
+    python dg535_journal.py ~/.dg535/journal.bin --csv run12.csv
+    python dg535_journal.py ~/.dg535/journal.bin --delays
+"""
+import argparse
+import atexit
+import os
+import queue
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from dg535_filelock import lock
+
+
+MAGIC = b"DG535JNL"
+# Records kept in the ring file before the oldest are overwritten (32 MB)
+JOURNAL_CAPACITY = 65536
+KINDS = ("write", "read", "query")
+
+# sequence, monotonic ns, wall-clock time, duration, kind, error, action, message, reply:
+# the message field holds the longest message of the driver (MAX_MESSAGE_LENGTH)
+RECORD = struct.Struct("<QqddBB32s256s190s")
+# magic, record size, capacity, next sequence number; the header takes one record slot
+HEADER = struct.Struct("<8sIQQ")
+
+_local = threading.local()
+
+
+def default_path():
+    return os.environ.get("DG535_JOURNAL_FILE") or os.path.join(os.path.expanduser("~"), ".dg535", "journal.bin")
+
+
+def current_action():
+    """The UI action the commands sent by this thread come from, "" if none."""
+    return getattr(_local, "action", "")
+
+
+@contextmanager
+def journal_action(name):
+    """Attribute the commands sent by this thread inside the block to the UI action name."""
+    previous = current_action()
+    _local.action = name
+    try:
+        yield
+    finally:
+        _local.action = previous
+
+
+def _pread(fd, size, offset):
+    if hasattr(os, "pread"):
+        return os.pread(fd, size, offset)
+    # Windows: only the writer thread moves the file position once the journal is open
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.read(fd, size)
+
+
+def _pwrite(fd, data, offset):
+    if hasattr(os, "pwrite"):
+        return os.pwrite(fd, data, offset)
+    os.lseek(fd, offset, os.SEEK_SET)
+    return os.write(fd, data)
+
+
+def _text(value, size):
+    return str(value).encode("ascii", "replace")[:size]
+
+
+class CommandJournal:
+    """
+    @params path : the ring file, default_path() if not given; an existing journal with
+        the same capacity is continued, otherwise the file is created. ValueError if the
+        file exists and is not a journal. When another process writes the file, this journal
+        writes nothing (writing is False)
+    @params capacity : number of records of the ring
+    @params sync_interval : seconds between two syncs of the file to the disk
+    """
+
+    def __init__(self, path=None, capacity=JOURNAL_CAPACITY, sync_interval=1.0):
+        self.path = path or default_path()
+        self.capacity = capacity
+        self.sync_interval = sync_interval
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.dropped = 0
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644)
+        if not lock(self.fd):
+            # another process writes this journal, this one leaves it alone
+            os.close(self.fd)
+            self.fd = None
+            self._closed = True
+            return
+        try:
+            self.next_sequence = self._continue() or 1
+        except ValueError:
+            os.close(self.fd)
+            raise
+        size = RECORD.size * (capacity + 1)
+        if os.fstat(self.fd).st_size < size:
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(self.fd, 0, size)
+            else:
+                os.ftruncate(self.fd, size)
+            self._write_header()
+        # monotonic -> wall-clock time of the records
+        self.epoch = time.time() - time.monotonic_ns() * 1e-9
+        self.queue = queue.SimpleQueue()
+        self._closed = False
+        self.thread = threading.Thread(target=self._run, name="dg535-journal", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    @property
+    def writing(self):
+        return self.fd is not None
+
+    def _continue(self):
+        """
+        Next sequence number of an existing journal with the same layout, None otherwise (the
+        file is then reset). ValueError if the file is not a journal, it is left untouched.
+        """
+        header = _pread(self.fd, HEADER.size, 0)
+        if not header:
+            return None
+        if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{self.path} is not a DG535 journal")
+        magic, record_size, capacity, next_sequence = HEADER.unpack(header)
+        if record_size != RECORD.size or capacity != self.capacity:
+            os.ftruncate(self.fd, 0)
+            return None
+        return next_sequence
+
+    def _write_header(self):
+        _pwrite(self.fd, HEADER.pack(MAGIC, RECORD.size, self.capacity, self.next_sequence), 0)
+
+    def record(self, kind, message, duration, reply=None, error=None):
+        """Journal one bus operation, same arguments as BusMetrics.record(); returns at once."""
+        if self._closed:
+            self.dropped += 1
+            return
+        self.queue.put((time.monotonic_ns(), kind, message, duration, reply, error, current_action()))
+
+    # Writer thread
+
+    def _run(self):
+        last_sync = time.monotonic()
+        while True:
+            try:
+                entries = [self.queue.get(timeout=self.sync_interval)]
+            except queue.Empty:
+                entries = []
+            while True:
+                try:
+                    entries.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in entries
+            self._write([entry for entry in entries if entry is not None])
+            if stop or time.monotonic() - last_sync >= self.sync_interval:
+                os.fsync(self.fd)
+                last_sync = time.monotonic()
+            if stop:
+                return
+
+    def _write(self, entries):
+        if not entries:
+            return
+        for end, kind, message, duration, reply, error, action in entries:
+            start = end - int(duration * 1e9)
+            record = RECORD.pack(self.next_sequence, start, self.epoch + start * 1e-9, duration,
+                                 KINDS.index(kind), error is not None, _text(action, 32),
+                                 _text(message or "", 256), _text(error if error is not None else reply or "", 190))
+            slot = (self.next_sequence - 1) % self.capacity + 1
+            _pwrite(self.fd, record, slot * RECORD.size)
+            self.next_sequence += 1
+        # the header last: it never counts a record that is not on the file
+        self._write_header()
+
+    def close(self):
+        """Write what is queued, sync and close the file."""
+        if self._closed:
+            return
+        self._closed = True
+        self.queue.put(None)
+        self.thread.join()
+        # closing the file releases the lock
+        os.close(self.fd)
+
+
+# Reader
+
+def record_dtype():
+    import numpy as np
+    return np.dtype([("sequence", "<u8"), ("monotonic_ns", "<i8"), ("time", "<f8"), ("duration", "<f8"),
+                     ("kind", "u1"), ("error", "u1"), ("action", "S32"), ("message", "S256"), ("reply", "S190")])
+
+
+def read_journal(path=None):
+    """The records of a journal, oldest first, as a NumPy structured array of record_dtype()."""
+    import numpy as np
+    path = path or default_path()
+    with open(path, "rb") as file:
+        magic, record_size, capacity, _ = HEADER.unpack(file.read(HEADER.size))
+        if magic != MAGIC or record_size != RECORD.size:
+            raise ValueError(f"{path} is not a DG535 journal")
+        records = np.fromfile(file, dtype=record_dtype(), count=capacity, offset=RECORD.size - HEADER.size)
+    # the slots never written have sequence 0, the ring is put back in order by sequence
+    records = records[records["sequence"] > 0]
+    return records[np.argsort(records["sequence"], kind="stable")]
+
+
+def save_csv(records, path):
+    """Save records as CSV, with the kinds and the texts decoded."""
+    import csv
+    with open(path, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(["sequence", "monotonic_ns", "time", "duration", "kind", "error", "action", "message", "reply"])
+        for record in records:
+            writer.writerow([record["sequence"], record["monotonic_ns"], f"{record['time']:.6f}", f"{record['duration']:.6f}",
+                             KINDS[record["kind"]], record["error"], record["action"].decode(),
+                             record["message"].decode(), record["reply"].decode()])
+
+
+def delay_changes(records):
+    """
+    Every delay sent to the DG535 by a successful write, in order:
+    a list of (time, monotonic ns, channel, reference, delay, action).
+    """
+    changes = []
+    for record in records[(records["kind"] == KINDS.index("write")) & (records["error"] == 0)]:
+        for command in record["message"].decode().split(";"):
+            mnemonic, _, arguments = command.strip().partition(" ")
+            arguments = arguments.split(",")
+            if mnemonic.upper() == "DT" and len(arguments) == 3:
+                changes.append((float(record["time"]), int(record["monotonic_ns"]), int(arguments[0]),
+                                int(arguments[1]), float(arguments[2]), record["action"].decode()))
+    return changes
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read the journal of the commands sent to the DG535")
+    parser.add_argument("path", nargs="?", help="the journal file (default: the one of the interfaces)")
+    parser.add_argument("--csv", help="save the records as CSV")
+    parser.add_argument("--npy", help="save the records as a NumPy .npy file")
+    parser.add_argument("--delays", action="store_true", help="print when every delay was changed")
+    args = parser.parse_args(argv)
+
+    records = read_journal(args.path)
+    if args.csv:
+        save_csv(records, args.csv)
+    if args.npy:
+        import numpy as np
+        np.save(args.npy, records)
+    if args.delays:
+        for moment, _, channel, reference, delay, action in delay_changes(records):
+            stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(moment)) + f".{int(moment % 1 * 1e6):06d}"
+            print(f"{stamp}  DT {channel},{reference},{delay:.12g}  {action}")
+    if not (args.csv or args.npy or args.delays):
+        print(f"{len(records)} records")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+In-memory instrumentation of the traffic with the DG535.
+
+Every write, read and query done by the driver is recorded in a BusMetrics object
+with its duration, the bytes transferred and its outcome. The statistics are kept
+per command mnemonic (DT, TR, ...; "batch" for a message with several commands,
+"read" for the reads of the batched replies) with a latency histogram each.
+Sections of host work (parsing, plotting...) can be timed with the same object,
+so that one can tell where the time goes:
+
+    with dg535.metrics.timed("plot"):
+        update_graph()
+    print(dg535.metrics.report())
+"""
+import json
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+# Upper bounds of the latency histogram buckets, in seconds (the last one takes the rest)
+LATENCY_BUCKETS = (1e-4, 3e-4, 1e-3, 3e-3, 1e-2, 3e-2, 0.1, 0.3, 1.0, 3.0, float("inf"))
+
+# VISA status code of a timeout (pyvisa.constants.StatusCode.error_timeout)
+VI_ERROR_TMO = -1073807339
+
+
+def is_timeout(error):
+    return getattr(error, "error_code", None) == VI_ERROR_TMO or isinstance(error, TimeoutError)
+
+
+def command_mnemonic(message):
+    """Mnemonic the transaction is recorded under."""
+    commands = [command for command in message.split(";") if command.strip()]
+    if len(commands) > 1:
+        return "batch"
+    return commands[0].strip()[:2].upper() if commands else "?"
+
+
+class LatencyStats:
+    """Count, time, bytes, errors and latency histogram of one kind of transaction."""
+
+    __slots__ = ("count", "total_time", "max_time", "bytes_out", "bytes_in", "errors", "timeouts", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.bytes_out = 0
+        self.bytes_in = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.histogram = [0] * len(LATENCY_BUCKETS)
+
+    def add(self, duration, bytes_out=0, bytes_in=0, error=None):
+        self.count += 1
+        self.total_time += duration
+        if duration > self.max_time:
+            self.max_time = duration
+        self.bytes_out += bytes_out
+        self.bytes_in += bytes_in
+        if error is not None:
+            self.errors += 1
+            if is_timeout(error):
+                self.timeouts += 1
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if duration <= bound:
+                self.histogram[i] += 1
+                break
+
+    @property
+    def mean_time(self):
+        return self.total_time / self.count if self.count else 0.0
+
+    def as_dict(self):
+        return {
+            "count": self.count,
+            "total_time": self.total_time,
+            "mean_time": self.mean_time,
+            "max_time": self.max_time,
+            "bytes_out": self.bytes_out,
+            "bytes_in": self.bytes_in,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "histogram": dict(zip((str(bound) for bound in LATENCY_BUCKETS), self.histogram)),
+        }
+
+
+class BusMetrics:
+    """Statistics of the bus transactions and of the timed host sections."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.time()
+        # mnemonic -> LatencyStats of the transactions
+        self.transactions = {}
+        # mnemonic -> number of commands sent (a batch counts each of its commands)
+        self.commands = Counter()
+        # section name -> LatencyStats of the host work
+        self.sections = {}
+
+    def record(self, kind, message, duration, reply=None, error=None):
+        """
+        Record one bus operation.
+        @params kind : "write", "read" or "query"
+        @params message : what was written (None for a read)
+        @params reply : what was read, if any
+        """
+        if kind == "read":
+            mnemonic = "read"
+        else:
+            mnemonic = command_mnemonic(message)
+            for command in message.split(";"):
+                if command.strip():
+                    self.commands[command.strip()[:2].upper()] += 1
+        stats = self.transactions.get(mnemonic)
+        if stats is None:
+            stats = self.transactions[mnemonic] = LatencyStats()
+        stats.add(duration, len(message) if message else 0, len(reply) if reply else 0, error)
+
+    @contextmanager
+    def timed(self, section):
+        """Time a section of host work (parsing, plotting...)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats = self.sections.get(section)
+            if stats is None:
+                stats = self.sections[section] = LatencyStats()
+            stats.add(time.perf_counter() - start)
+
+    def totals(self):
+        """Totals over every transaction."""
+        total = LatencyStats()
+        for stats in self.transactions.values():
+            total.count += stats.count
+            total.total_time += stats.total_time
+            total.max_time = max(total.max_time, stats.max_time)
+            total.bytes_out += stats.bytes_out
+            total.bytes_in += stats.bytes_in
+            total.errors += stats.errors
+            total.timeouts += stats.timeouts
+            total.histogram = [a + b for a, b in zip(total.histogram, stats.histogram)]
+        return total
+
+    def as_dict(self):
+        return {
+            "since": self.started,
+            "totals": self.totals().as_dict(),
+            "transactions": {mnemonic: stats.as_dict() for mnemonic, stats in sorted(self.transactions.items())},
+            "commands": dict(sorted(self.commands.items())),
+            "sections": {name: stats.as_dict() for name, stats in sorted(self.sections.items())},
+        }
+
+    def report(self):
+        """Human readable summary."""
+        lines = [f"{'':<10}{'count':>8}{'mean [ms]':>11}{'max [ms]':>10}{'total [s]':>11}{'bytes':>9}{'errors':>8}{'timeouts':>10}"]
+        rows = [*sorted(self.transactions.items()), ("TOTAL", self.totals()),
+                *((f"[{name}]", stats) for name, stats in sorted(self.sections.items()))]
+        for name, stats in rows:
+            lines.append(f"{name:<10}{stats.count:>8}{stats.mean_time * 1e3:>11.2f}{stats.max_time * 1e3:>10.2f}"
+                         f"{stats.total_time:>11.3f}{stats.bytes_out + stats.bytes_in:>9}{stats.errors:>8}{stats.timeouts:>10}")
+        return "\n".join(lines)
+
+    def dump(self, path=None):
+        """Write the statistics as JSON to path, or return them as a JSON string."""
+        text = json.dumps(self.as_dict(), indent=2)
+        if path is None:
+            return text
+        with open(path, "w") as file:
+            file.write(text)
+        return text
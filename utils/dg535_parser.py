@@ -0,0 +1,140 @@
+"""
+Decoding of the replies of the DG535.
+
+Every query gets a compact typed record (with __slots__, no per-instance dict):
+
+    DT i    DelayReply(channel, reference, delay)   "1,+0.000250000000" or "1,+2.5E-04"
+    TR i    RateReply(which, rate)                  "10000.000" or "1.0E+04"
+    TM, TS, ES, IS
+            RegisterReply(mnemonic, value)          "0"
+
+The channel (or the trigger/burst rate) comes from the query, the query form
+with "?" ("DT? 2") is understood too. The replies of a batch, joined by ";" on
+one line or on separate lines, are decoded in one pass by parse_replies().
+A reply that cannot be decoded raises ReplyError.
+"""
+COMMAND_SEPARATOR = ";"
+
+
+class ReplyError(ValueError):
+    """The DG535 sent something that is not a reply to the query."""
+
+
+class DelayReply:
+    __slots__ = ("channel", "reference", "delay")
+
+    def __init__(self, channel, reference, delay):
+        self.channel = channel
+        self.reference = reference
+        self.delay = delay
+
+    @property
+    def value(self):
+        """(reference, delay), as kept in DG535State.delays."""
+        return self.reference, self.delay
+
+    def __eq__(self, other):
+        return type(other) is DelayReply and (self.channel, self.reference, self.delay) == (other.channel, other.reference, other.delay)
+
+    def __repr__(self):
+        return f"DelayReply(channel={self.channel}, reference={self.reference}, delay={self.delay!r})"
+
+
+class RateReply:
+    __slots__ = ("which", "rate")
+
+    def __init__(self, which, rate):
+        self.which = which
+        self.rate = rate
+
+    @property
+    def value(self):
+        return self.rate
+
+    def __eq__(self, other):
+        return type(other) is RateReply and (self.which, self.rate) == (other.which, other.rate)
+
+    def __repr__(self):
+        return f"RateReply(which={self.which}, rate={self.rate!r})"
+
+
+class RegisterReply:
+    """Integer setting or status register: TM, TS, ES, IS."""
+
+    __slots__ = ("mnemonic", "value")
+
+    def __init__(self, mnemonic, value):
+        self.mnemonic = mnemonic
+        self.value = value
+
+    def bit(self, mask):
+        return bool(self.value & mask)
+
+    def __eq__(self, other):
+        return type(other) is RegisterReply and (self.mnemonic, self.value) == (other.mnemonic, other.value)
+
+    def __repr__(self):
+        return f"RegisterReply({self.mnemonic!r}, {self.value})"
+
+
+def _argument(command, default):
+    """The integer argument of a query such as "DT 2" or "DT? 2"."""
+    rest = command[2:].lstrip(" ?")
+    return int(rest) if rest else default
+
+
+def _delay(command, reply):
+    reference, separator, delay = reply.partition(",")
+    if not separator:
+        raise ValueError
+    return DelayReply(_argument(command, None), int(reference), float(delay))
+
+
+def _rate(command, reply):
+    return RateReply(_argument(command, 0), float(reply))
+
+
+def _register(command, reply):
+    return RegisterReply(command[:2].upper(), int(reply))
+
+
+PARSERS = {
+    "DT": _delay,
+    "TR": _rate,
+    "TM": _register,
+    "TS": _register,
+    "ES": _register,
+    "IS": _register,
+}
+
+
+def parse_reply(command, reply):
+    """Decode the reply to one query, the raw (stripped) text for a query without a record type."""
+    parser = PARSERS.get(command[:2].upper())
+    reply = reply.strip()
+    if parser is None:
+        return reply
+    try:
+        return parser(command, reply)
+    except ValueError:
+        raise ReplyError(f"Unexpected reply to {command}: {reply!r}") from None
+
+
+def parse_replies(commands, replies):
+    """
+    Decode the replies to a sequence of queries in one pass.
+    @params replies : the raw text, ";" and line separated, or a list of them
+    """
+    if isinstance(replies, str):
+        replies = [replies]
+    parsed = []
+    commands = iter(commands)
+    for line in replies:
+        for reply in line.strip().split(COMMAND_SEPARATOR):
+            command = next(commands, None)
+            if command is None:
+                raise ReplyError(f"More replies than queries: {reply!r}")
+            parsed.append(parse_reply(command, reply))
+    if next(commands, None) is not None:
+        raise ReplyError("Fewer replies than queries")
+    return parsed
@@ -0,0 +1,167 @@
+"""
+Timing diagram of the DG535 channels, embedded in a Tk frame.
+
+The figure, the canvas and the artists (the scatter of the channel starting points and
+the bars of the AB and CD pulses) are created once; every update only changes their data.
+When the axes limits and scale do not change the artists are blitted over the cached
+background, otherwise the canvas is redrawn, still without rebuilding anything, so the
+memory stays flat however many updates happen.
+
+The picture only depends on the five times and the scale: the last rendered pictures
+are kept as rasters (RENDER_CACHE_SIZE of them, the least recently shown is dropped)
+and showing one of them again is a copy to the canvas, matplotlib draws nothing.
+An update with the picture already shown returns at once.
+"""
+import tkinter as tk
+from collections import OrderedDict
+
+from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
+from matplotlib.figure import Figure
+from matplotlib.ticker import NullFormatter, ScalarFormatter
+
+
+CHANNEL_LABELS = ['T0 time reference', 'Channel A', 'Channel B', 'Channel C', 'Channel D']
+PULSE_LABELS = ['Channel AB', 'Channel CD']
+BACKGROUND = "#cccccc"
+# about 0.7 MB each at the default size
+RENDER_CACHE_SIZE = 16
+
+
+def axis_limits(times, scale_type):
+    """x limits showing every time with a margin, only the positive times count on a log axis."""
+    if scale_type == "log":
+        positive = [t for t in times if t > 0]
+        if not positive:
+            return 1e-9, 1e-3
+        return min(positive) / 2, max(positive) * 2
+    low, high = min(times), max(times)
+    margin = (high - low) * 0.05 or 1e-6
+    return low - margin, high + margin
+
+
+def render_key(delays, scale_type):
+    """Key of the picture in the render cache, the DG535 resolution is 5 ps: closer times draw the same."""
+    return tuple(round(t, 12) for t in delays), scale_type
+
+
+class TimingDiagram:
+    """
+    @params master : the Tk frame the canvas is packed in
+    @params cache_size : number of rendered pictures kept, 0 not to keep any
+    """
+
+    def __init__(self, master, scale_type="linear", cache_size=RENDER_CACHE_SIZE):
+        self.figure = Figure(figsize=(6, 3), layout="constrained")
+        self.figure.patch.set_facecolor(BACKGROUND)
+        self.channels_axes, self.pulses_axes = self.figure.subplots(2, 1, sharex=True)
+        self.scale_type = None
+        self.limits = None
+        self.background = None
+        # render_key -> raster of the whole figure, the most recently shown last
+        self.renders = OrderedDict()
+        self.cache_size = cache_size
+        self.shown = None
+        self.render_size = None
+
+        ax = self.channels_axes
+        # s is the size of points
+        self.points = ax.scatter([0] * len(CHANNEL_LABELS), CHANNEL_LABELS, color=['red', 'blue', 'green', 'orange', 'purple'],
+                                 edgecolor='black', s=100, animated=True)
+        ax.set_title('Channels\' starting point')
+        ax.set_xlabel('Time [s]', fontsize=10)
+        ax.set_facecolor(BACKGROUND)
+        ax.grid(True, which='both', linestyle='--', linewidth=0.5)
+
+        ax = self.pulses_axes
+        # Horizontal bars, one for each pulse
+        self.bars = ax.barh(PULSE_LABELS, [0, 0], color=['cyan', 'purple'], edgecolor='black', left=[0, 0])
+        for bar in self.bars:
+            bar.set_animated(True)
+        ax.set_xlabel('Time (s)')
+        ax.set_ylabel('Channels')
+        ax.set_facecolor(BACKGROUND)
+        ax.set_title('Channel AB and CD pulses duration')
+        ax.grid(True, which='both', linestyle='--', linewidth=0.5)
+
+        self.canvas = FigureCanvasTkAgg(self.figure, master=master)
+        self.canvas.get_tk_widget().pack(fill=tk.BOTH, expand=False)
+        # every full redraw (also the ones caused by a resize) refreshes the cached background
+        self.canvas.mpl_connect("draw_event", self._on_draw)
+        self._set_scale(scale_type)
+
+    def _set_scale(self, scale_type):
+        if scale_type == self.scale_type:
+            return
+        # fixed limits valid on both scales, update() sets the real ones
+        self.channels_axes.set_xlim(*axis_limits([0], "log"))
+        for ax in (self.channels_axes, self.pulses_axes):
+            ax.set_xscale(scale_type)
+        self.channels_axes.xaxis.set_major_formatter(ScalarFormatter())
+        self.channels_axes.xaxis.set_minor_formatter(NullFormatter())
+        self.scale_type = scale_type
+        self.limits = None
+
+    def update(self, delays, scale_type=None):
+        """
+        @params delays : times of T0, A, B, C and D in seconds
+        @params scale_type : "linear" or "log", None keeps the current one
+        """
+        key = render_key(delays, scale_type or self.scale_type)
+        if key == self.shown:
+            return
+        t0, t_a, t_b, t_c, t_d = delays
+        # the artists and the axes always follow the data, a resize redraws them
+        self.points.set_offsets([[t, i] for i, t in enumerate(delays)])
+        for bar, start, end in zip(self.bars, (t_a, t_c), (t_b, t_d)):
+            bar.set_x(start)
+            bar.set_width(end - start)
+
+        self._set_scale(scale_type or self.scale_type)
+        limits = axis_limits([t0, t_a, t_b, t_c, t_d], self.scale_type)
+        raster = self.renders.get(key)
+        if raster is not None:
+            self.renders.move_to_end(key)
+            if limits != self.limits:
+                self.limits = limits
+                self.channels_axes.set_xlim(*limits)
+                # the background is that of other limits now
+                self.background = None
+            self.canvas.restore_region(raster)
+            self.canvas.blit(self.figure.bbox)
+            self.shown = key
+            return
+        if limits != self.limits or self.background is None:
+            self.limits = limits
+            self.channels_axes.set_xlim(*limits)
+            # full redraw, the draw_event handler blits the artists on top
+            self.canvas.draw()
+        else:
+            self._blit()
+        self.shown = key
+        self._keep(key)
+
+    def _keep(self, key):
+        if self.cache_size <= 0:
+            return
+        self.renders[key] = self.canvas.copy_from_bbox(self.figure.bbox)
+        while len(self.renders) > self.cache_size:
+            self.renders.popitem(last=False)
+
+    def _on_draw(self, event):
+        size = tuple(self.figure.bbox.size)
+        if size != self.render_size:
+            # the window was resized, the rasters do not fit any more
+            self.renders.clear()
+            self.render_size = size
+        self.background = self.canvas.copy_from_bbox(self.figure.bbox)
+        self._draw_artists()
+
+    def _draw_artists(self):
+        self.channels_axes.draw_artist(self.points)
+        for bar in self.bars:
+            self.pulses_axes.draw_artist(bar)
+        self.canvas.blit(self.figure.bbox)
+
+    def _blit(self):
+        self.canvas.restore_region(self.background)
+        self._draw_artists()
@@ -0,0 +1,166 @@
+"""
+Adaptive polling of the DG535 settings.
+
+The interfaces write through the driver, so the cached state is right as long as
+nobody turns a knob on the front panel: the polls are only there to catch such
+changes, and to notice that the link went down. Each setting has its own interval:
+
+  - right after it changed (written by the host or found different by a poll) it is
+    polled every `fast` seconds, then the interval doubles at every poll that finds
+    nothing new, up to `slow`;
+  - while the link is down only the trigger mode is polled, every `fast` seconds,
+    as the probe of the link; once it answers again every setting is polled at once;
+  - no poll is sent while the host is using the bus (traffic in the last BUSY_TIME
+    seconds), that traffic already proves the link is alive.
+
+The due settings are read in a single message, so an idle DG535 sees one short
+query every few tens of seconds instead of a full read every few seconds.
+
+    poller = PollScheduler(dg535.health)
+    names = poller.due(dg535.state)              # on the Tk thread, every POLL_TICK ms
+    worker.submit(poll_settings, names, on_done=lambda changed: ...)
+"""
+import time
+
+from dg535_driver import CHANNEL_NAMES, DELAY_CHANNELS
+
+
+# Tick of the scheduler in the interfaces, in ms: nothing is sent unless a setting is due
+POLL_TICK = 500
+# Seconds after a transaction of the host during which no poll is sent
+BUSY_TIME = 2.0
+
+# setting -> (query, (fast, slow) intervals in seconds)
+POLLED = {
+    "trigger_mode": ("TM", (1.0, 30.0)),
+    "trigger_rate": ("TR 0", (2.0, 60.0)),
+    "trigger_slope": ("TS", (5.0, 120.0)),
+}
+POLLED.update({CHANNEL_NAMES[channel]: (f"DT {channel}", (2.0, 60.0)) for channel in DELAY_CHANNELS})
+# the trigger mode query is also the probe of the link (see DG535.check_connection)
+PROBE = "trigger_mode"
+
+
+def setting(state, name):
+    """Value of one polled setting in a DG535State."""
+    if name in ("trigger_mode", "trigger_rate", "trigger_slope"):
+        return getattr(state, name)
+    return state.delays[_channel(name)]
+
+
+def _channel(name):
+    return next(channel for channel in DELAY_CHANNELS if CHANNEL_NAMES[channel] == name)
+
+
+def _store(state, name, reply):
+    if name in ("trigger_mode", "trigger_rate", "trigger_slope"):
+        setattr(state, name, reply.value)
+    else:
+        state.delays[reply.channel] = reply.value
+
+
+def poll_settings(dg535, names):
+    """
+    Read the given settings in one message (on the I/O worker), the cached state is updated.
+    Returns the settings whose value changed.
+    """
+    before = {name: setting(dg535.state, name) for name in names}
+    # the polls are not host traffic, they must not hold back the next ones (see BUSY_TIME)
+    dg535.health.polling = True
+    try:
+        with dg535.batch() as batch:
+            for name in names:
+                batch.query(POLLED[name][0], lambda reply, name=name: _store(dg535.state, name, reply))
+    finally:
+        dg535.health.polling = False
+    return [name for name in names if setting(dg535.state, name) != before[name]]
+
+
+class _Polled:
+    __slots__ = ("fast", "slow", "interval", "next_poll", "value")
+
+    def __init__(self, fast, slow):
+        self.fast = fast
+        self.slow = slow
+        self.interval = fast
+        self.next_poll = 0.0
+        self.value = None
+
+
+class PollScheduler:
+    """
+    @params health : the ConnectionHealth of the driver
+    @params intervals : {setting: (fast, slow)} replacing the intervals of POLLED
+    @params clock : monotonic clock in seconds, replaceable for the simulations
+    """
+
+    def __init__(self, health, intervals=None, clock=time.monotonic):
+        self.health = health
+        self.clock = clock
+        intervals = {name: values for name, (_, values) in POLLED.items()} | (intervals or {})
+        self.settings = {name: _Polled(*intervals[name]) for name in POLLED}
+        self.was_alive = True
+        self.polls = 0
+        self.skipped = 0
+
+    def _speed_up(self, name, now):
+        polled = self.settings[name]
+        polled.interval = polled.fast
+        polled.next_poll = now + polled.fast
+
+    def due(self, state):
+        """
+        Settings to poll now, given the cached state (the changes written by the host since
+        the last call speed up the polling of the settings concerned).
+        """
+        now = self.clock()
+        for name, polled in self.settings.items():
+            value = setting(state, name)
+            if value != polled.value:
+                polled.value = value
+                self._speed_up(name, now)
+        if self.health.consecutive_failures:
+            # the link is down: probe it, nothing else
+            probe = self.settings[PROBE]
+            if self.was_alive:
+                self.was_alive = False
+                probe.next_poll = now
+            if now < probe.next_poll:
+                return []
+            probe.next_poll = now + probe.fast
+            return [PROBE]
+        if not self.was_alive:
+            # back again, the settings may have changed meanwhile (power cycle, front panel)
+            self.was_alive = True
+            for polled in self.settings.values():
+                polled.next_poll = now
+        if all(now < polled.next_poll for polled in self.settings.values()):
+            return []
+        idle = self.health.host_idle_time()
+        if idle is not None and idle < BUSY_TIME:
+            self.skipped += 1
+            return []
+        # the settings due in the next half interval go in the same message
+        names = [name for name, polled in self.settings.items() if now >= polled.next_poll - polled.interval / 2]
+        for name in names:
+            polled = self.settings[name]
+            # the interval grows back with polled(); a poll lost on the way is sent again after it
+            polled.next_poll = now + polled.interval
+        return names
+
+    def polled(self, names, state):
+        """Record the outcome of poll_settings(): the settings that changed are polled fast again, the others slower."""
+        now = self.clock()
+        self.polls += 1
+        if self.health.consecutive_failures:
+            # the poll failed, due() probes the link
+            return
+        for name in names:
+            polled = self.settings[name]
+            value = setting(state, name)
+            if value != polled.value:
+                polled.value = value
+                self._speed_up(name, now)
+            else:
+                polled.interval = min(polled.interval * 2, polled.slow)
+                polled.next_poll = now + polled.interval
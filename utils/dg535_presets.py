@@ -0,0 +1,139 @@
+"""
+Library of presets kept on the host: any number of named, complete DG535 settings.
+
+Unlike the nine ST/RC memory slots of the instrument, the presets are stored in a
+file that can be read and shared, ~/.dg535/presets.json unless the environment
+variable DG535_PRESETS_FILE is set.
+
+Applying a preset sends only what differs from the state cached by the driver, in one
+message, and in an order that keeps every intermediate setting valid: no reference
+loop between the delay channels (the DG535 would reject the command) and, whenever
+possible, the delays ordered A <= B <= C <= D. A trigger mode change that stops the
+pulses is sent before the delays, one that starts the internal trigger after them.
+
+    library = PresetLibrary()
+    library.save("run-12", dg535.state)
+    apply_preset(dg535, library.get("run-12"))
+"""
+import json
+import os
+import time
+
+from dg535_constraints import DelayGraph
+from dg535_driver import CHANNEL_NAMES, DELAY_CHANNELS, DG535Error, DG535State, same_delay
+
+
+INTERNAL_TRIGGER = 0
+
+
+def default_path():
+    return os.environ.get("DG535_PRESETS_FILE") or os.path.join(os.path.expanduser("~"), ".dg535", "presets.json")
+
+
+class PresetLibrary:
+    """
+    @params path : the file, default_path() if not given; it is read at once if it exists
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_path()
+        # name -> {"saved_at": epoch, "state": DG535State.as_dict()}
+        self.presets = {}
+        if os.path.exists(self.path):
+            with open(self.path) as file:
+                self.presets = json.load(file)
+
+    @property
+    def names(self):
+        return sorted(self.presets)
+
+    def get(self, name):
+        if name not in self.presets:
+            raise DG535Error(f"There is no preset named {name}")
+        return DG535State.from_dict(self.presets[name]["state"])
+
+    def save(self, name, state):
+        """Add or replace a preset, the state must be complete."""
+        if not state.complete:
+            raise DG535Error("Read the settings of the DG535 before saving them as a preset")
+        self.presets[name] = {"saved_at": time.time(), "state": state.as_dict()}
+        self._write()
+
+    def delete(self, name):
+        if self.presets.pop(name, None) is not None:
+            self._write()
+
+    def _write(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(self.presets, file, indent=2, sort_keys=True)
+        os.replace(temporary, self.path)
+
+
+def _delay_changed(current, target):
+    return current is None or current[0] != target[0] or not same_delay(current[1], target[1])
+
+
+def order_delays(current, target):
+    """
+    Order in which to write the delays of target that differ from current (two DG535State),
+    so that no intermediate setting has a reference loop and, when it can be done, none
+    breaks the constraints of dg535_constraints.py. Returns a list of (channel, reference, delay).
+    """
+    pending = [channel for channel in DELAY_CHANNELS if _delay_changed(current.delays[channel], target.delays[channel])]
+    # unknown settings: nothing to keep valid, the loops are avoided from T0 outwards
+    graph = DelayGraph({channel: delay or (1, 0.0) for channel, delay in current.delays.items()}, current.trigger_rate)
+    writes = []
+    while pending:
+        candidates = {}
+        for channel in pending:
+            trial, problems = graph.what_if({channel: target.delays[channel]})
+            if trial is not None:
+                candidates[channel] = (bool(problems), trial)
+        if not candidates:
+            names = ", ".join(CHANNEL_NAMES[channel] for channel in pending)
+            raise DG535Error(f"The delays of channels {names} cannot be set without a reference loop")
+        # the first write that breaks no constraint, otherwise the first without a loop
+        channel = min(candidates, key=lambda channel: (candidates[channel][0], channel))
+        graph = candidates[channel][1]
+        writes.append((channel, *target.delays[channel]))
+        pending.remove(channel)
+    return writes
+
+
+def apply_state(dg535, target):
+    """
+    Bring the DG535 to the settings of target (a complete DG535State) with the fewest commands,
+    sent in one message. Returns {setting: True if it was written, False if the device already
+    held it}, the settings being "trigger_mode", "trigger_rate", "trigger_slope" and "A" to "D".
+    """
+    if not target.complete:
+        raise DG535Error("The preset is not a complete setting of the DG535")
+    # raises DG535Error if the preset has a reference loop
+    DelayGraph(target.delays)
+    # the setters below skip what is already set
+    delays = order_delays(dg535.state, target)
+    starts_pulses = target.trigger_mode == INTERNAL_TRIGGER and dg535.state.trigger_mode != INTERNAL_TRIGGER
+    written = {CHANNEL_NAMES[channel]: False for channel in DELAY_CHANNELS}
+    with dg535.batch():
+        # the internal trigger is stopped first or started last, no pulses on half a setting
+        if not starts_pulses:
+            written["trigger_mode"] = dg535.set_trigger_mode(target.trigger_mode)
+        for channel, reference, delay in delays:
+            written[CHANNEL_NAMES[channel]] = dg535.set_delay(channel, delay, reference)
+        written["trigger_rate"] = dg535.set_trigger_rate(target.trigger_rate)
+        written["trigger_slope"] = dg535.set_trigger_slope(target.trigger_slope)
+        if starts_pulses:
+            written["trigger_mode"] = dg535.set_trigger_mode(target.trigger_mode)
+    return written
+
+
+def apply_preset(dg535, target):
+    """
+    Bring the DG535 to the settings of target (a complete DG535State), see apply_state().
+    Returns the number of commands written.
+    """
+    return sum(apply_state(dg535, target).values())
@@ -0,0 +1,76 @@
+"""
+Background I/O worker for the Qt interface, the counterpart of dg535_worker.py.
+
+The DG535 is owned by a QThread: the window submits requests, they are sent to the
+thread by a queued signal and run one after the other, and the results come back to
+the window by another signal, on the GUI thread. Nothing the window does waits for
+the bus, so it keeps drawing while a refresh is slow or times out.
+
+    worker = DG535QtWorker(snapshot=StateSnapshot())
+    worker.connect(on_done=lambda result: ..., on_error=show_error)
+    worker.submit(dg535_actions.full_refresh, on_done=lambda state: show(state))
+
+busy tells whether requests are still in flight, a timer uses it so that its
+requests never pile up behind a slow one.
+"""
+from PyQt6.QtCore import QObject, QThread, pyqtSignal, pyqtSlot
+
+from dg535_worker import WorkerBase
+
+
+class _Runner(QObject):
+    """Lives in the I/O thread, runs the requests in the order they were submitted."""
+
+    finished = pyqtSignal(object, object)
+
+    def __init__(self, worker):
+        super().__init__()
+        self.worker = worker
+
+    @pyqtSlot(object)
+    def run(self, request):
+        self.finished.emit(*self.worker._execute(request))
+
+
+class DG535QtWorker(WorkerBase, QObject):
+    """
+    @params dg535 : an already connected driver (optional, connect() can be submitted later)
+    @params rm : the VISA resource manager (optional, created by the worker when needed)
+    @params snapshot : a StateSnapshot (dg535_snapshot.py), saved after every request that changed the settings
+    @params journal : a CommandJournal (dg535_journal.py) given to every driver the worker connects
+    @params history : a StateHistory (dg535_history.py) given to every driver the worker connects
+    """
+
+    requested = pyqtSignal(object)
+
+    def __init__(self, dg535=None, rm=None, snapshot=None, journal=None, history=None):
+        super().__init__()
+        self._setup(dg535, rm, snapshot, journal, history)
+        self.thread = QThread()
+        self.thread.setObjectName("dg535-worker")
+        self.runner = _Runner(self)
+        self.runner.moveToThread(self.thread)
+        # both connections are queued: the runner lives in the I/O thread, this object in the GUI thread
+        self.requested.connect(self.runner.run)
+        self.runner.finished.connect(self._deliver)
+        self.thread.start()
+
+    def submit(self, function, *args, on_done=None, on_error=None, action=None):
+        """
+        Queue function(dg535, *args) for the I/O thread.
+        on_done(result) or on_error(exception) are then called on the GUI thread.
+        action names the request in the journal, the name of function by default.
+        """
+        self.in_flight += 1
+        self.requested.emit(self._request(function, args, on_done, on_error, action))
+
+    @pyqtSlot(object, object)
+    def _deliver(self, callback, result):
+        self.in_flight -= 1
+        if callback is not None:
+            callback(result)
+
+    def stop(self):
+        """Stop the I/O thread once the request being run is over, the queued ones are dropped."""
+        self.thread.quit()
+        self.thread.wait()
@@ -0,0 +1,125 @@
+"""
+Registry of the DG535 units of the setup, addressed by name or by GPIB address.
+
+Every unit has its own worker thread (a single-thread executor): the commands sent
+to one unit stay serialized in the order they were submitted, while different units
+are driven in parallel. A refresh of the whole rack takes about as long as one unit.
+
+    registry = DG535Registry({"laser": "GPIB0::15::INSTR", "gate": "GPIB1::15::INSTR"})
+    registry.submit("gate", DG535.set_delay, 5, 250e-6).result()
+    states = registry.fleet_snapshot()
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from dg535_driver import DG535, DG535Error, find_gpib_devices, resource_manager
+
+
+def _refresh(dg535):
+    return dg535.refresh().copy()
+
+
+class DG535Registry:
+    """
+    @params names : {name: GPIB address} of the known units, discover() adds the others
+    @params rm : the VISA resource manager shared by the units (created when needed)
+    @params timeout : default timeout of the fleet calls in seconds, None to wait forever
+    """
+
+    def __init__(self, names=None, rm=None, timeout=None):
+        self.rm = rm
+        self.timeout = timeout
+        # name -> address, several names can point to the same unit
+        self.addresses = {}
+        # address -> (driver, executor), created on first use
+        self._units = {}
+        self._lock = threading.Lock()
+        for name, address in (names or {}).items():
+            self.add(name, address)
+
+    def _resource_manager(self):
+        if self.rm is None:
+            self.rm = resource_manager()
+        return self.rm
+
+    @property
+    def names(self):
+        return list(self.addresses)
+
+    def add(self, name, address):
+        """Register the unit at address under name."""
+        if self.addresses.get(name, address) != address:
+            raise DG535Error(f"{name} is already the DG535 at {self.addresses[name]}")
+        self.addresses[name] = address
+
+    def discover(self):
+        """Enumerate the bus once and register the GPIB devices not known yet, named by their address."""
+        for address in find_gpib_devices(self._resource_manager()):
+            if address not in self.addresses.values():
+                self.add(address, address)
+        return self.names
+
+    def address(self, unit):
+        """GPIB address of a unit given by name or address."""
+        if unit in self.addresses:
+            return self.addresses[unit]
+        if unit in self.addresses.values():
+            return unit
+        raise DG535Error(f"Unknown DG535: {unit}")
+
+    def _unit(self, address):
+        with self._lock:
+            if address not in self._units:
+                executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"dg535-{address}")
+                self._units[address] = (DG535(rm=self._resource_manager()), executor)
+            return self._units[address]
+
+    def dg535(self, unit):
+        """The driver of a unit, to be used only from functions given to submit()."""
+        return self._unit(self.address(unit))[0]
+
+    def submit(self, unit, function, *args, **kwargs):
+        """
+        Queue function(dg535, *args, **kwargs) on the worker of the unit, which is connected first if needed.
+        Returns a concurrent.futures.Future.
+        """
+        address = self.address(unit)
+        dg535, executor = self._unit(address)
+        return executor.submit(self._call, dg535, address, function, args, kwargs)
+
+    @staticmethod
+    def _call(dg535, address, function, args, kwargs):
+        if not dg535.connected:
+            dg535.connect(address)
+        return function(dg535, *args, **kwargs)
+
+    def run_all(self, function, *args, units=None, timeout=None, **kwargs):
+        """
+        Run function(dg535, *args, **kwargs) on every unit (or the given ones) in parallel.
+        Returns {name: result}, with the exception as result for the units that failed or timed out.
+        """
+        futures = {name: self.submit(name, function, *args, **kwargs) for name in (units or self.names)}
+        done, not_done = wait(futures.values(), timeout if timeout is not None else self.timeout)
+        results = {}
+        for name, future in futures.items():
+            if future in not_done:
+                # not sent yet: dropped, already on the bus: left to complete
+                future.cancel()
+                results[name] = TimeoutError(f"{name} did not answer in time")
+            elif future.exception() is not None:
+                results[name] = future.exception()
+            else:
+                results[name] = future.result()
+        return results
+
+    def fleet_snapshot(self, units=None, timeout=None):
+        """Read the settings of every unit in parallel: {name: DG535State}, or the exception of a unit that failed."""
+        return self.run_all(_refresh, units=units, timeout=timeout)
+
+    def close(self):
+        """Close every session and stop the workers."""
+        with self._lock:
+            units, self._units = self._units, {}
+        for dg535, executor in units.values():
+            executor.submit(dg535.close)
+            executor.shutdown(wait=True)
@@ -0,0 +1,71 @@
+"""
+One DG535 session shared by the interfaces hosted in the same process by the hub
+(Main_interface_dg535.py).
+
+The hub creates the Session with its Tk root: the I/O worker, which owns the only
+VISA session to the instrument, is started once and every view submits its requests
+to it, so the views never fight over the bus and all read the same cached settings.
+The views register a listener to learn when the instrument is (re)connected.
+
+    session = dg535_session.start(root)
+    session.listeners.append(lambda dg535: update_status(dg535))
+    session.connect()
+"""
+from dg535_history import StateHistory
+from dg535_journal import CommandJournal
+from dg535_snapshot import StateSnapshot
+from dg535_worker import DG535Worker
+
+
+_session = None
+
+
+def current():
+    """The session of the hub, None when an interface runs on its own."""
+    return _session
+
+
+def start(root):
+    """Create the shared session, its worker delivers the results on the Tk thread of root."""
+    global _session
+    _session = Session(root)
+    return _session
+
+
+class Session:
+    """
+    @params root : the Tk root of the hub, the views are Toplevel windows of it
+    """
+
+    def __init__(self, root):
+        self.root = root
+        # the settings are saved after every change, for the warm start of the next run,
+        # every command sent is kept in the journal and every setting observed in the history
+        self.worker = DG535Worker(snapshot=StateSnapshot(), journal=CommandJournal(), history=StateHistory())
+        self.worker.start()
+        self.worker.poll(root)
+        # called with the driver (None if the connection failed) after every connect()
+        self.listeners = []
+
+    @property
+    def dg535(self):
+        """The connected driver, None until connect() succeeded."""
+        return self.worker.dg535
+
+    def connect(self, address=None, on_done=None, on_error=None):
+        """Connect (or reconnect) on the worker, then tell every view."""
+        def connected(result):
+            self._notify()
+            if on_done:
+                on_done(result)
+
+        def failed(e):
+            self._notify()
+            if on_error:
+                on_error(e)
+
+        self.worker.connect(address, on_done=connected, on_error=failed)
+
+    def _notify(self):
+        for listener in self.listeners:
+            listener(self.dg535)
@@ -0,0 +1,335 @@
+"""
+Software DG535 for hardware-free runs and benchmarks.
+
+SimulatedResourceManager replaces pyvisa.ResourceManager(): it lists simulated GPIB
+instruments and open_resource() returns a SimulatedDG535, which understands the
+commands used by the interfaces (DT, TR, TM, TS, ST, RC, SS, CL, ES, IS, also in the
+"TR?" / "DT? 2" form), keeps the instrument state and models the error status register.
+
+Each transaction costs a latency given by a LatencyModel. By default the time is only
+accounted for in SimulatedDG535.elapsed (fast runs in CI), with realtime=True the
+simulator really sleeps, so the timings seen by the interfaces are those of the bus.
+
+    rm = SimulatedResourceManager(latency=GPIB_TIMINGS, realtime=True)
+    dg535 = DG535(rm=rm).connect()
+"""
+import random
+import time
+
+import pyvisa
+
+from dg535_driver import DELAY_CHANNELS, MAX_DELAY, MIN_RATE, REFERENCE_CHANNELS
+
+
+DEFAULT_ADDRESS = "GPIB0::15::INSTR"
+
+# Bits of the error status register (ES)
+ERROR_UNRECOGNIZED_COMMAND = 1
+ERROR_WRONG_PARAMETER_COUNT = 2
+ERROR_VALUE_OUT_OF_RANGE = 4
+ERROR_WRONG_MODE = 8
+ERROR_DELAY_LINKAGE = 16
+ERROR_DELAY_RANGE = 32
+ERROR_RECALLED_DATA_CORRUPT = 64
+
+# Bits of the instrument status register (IS)
+STATUS_COMMAND_ERROR = 1
+
+# Highest internal trigger rate of the hardware, above the limit of the interfaces (MAX_RATE)
+INSTRUMENT_MAX_RATE = 1e6
+MEMORY_SLOTS = range(1, 10)
+
+
+class LatencyModel:
+    """
+    Time taken by one bus transaction: a fixed cost, a cost per byte transferred and,
+    for the reads, the time the DG535 takes to prepare the reply. The jitter is gaussian.
+    scan is the time of a bus enumeration (list_resources). All times in seconds.
+    """
+
+    def __init__(self, write=0.0, read=0.0, per_byte=0.0, jitter=0.0, scan=0.0, seed=None):
+        self.write = write
+        self.read = read
+        self.per_byte = per_byte
+        self.jitter = jitter
+        self.scan = scan
+        self.random = random.Random(seed)
+
+    def _jitter(self):
+        if not self.jitter:
+            return 0.0
+        return self.random.gauss(0.0, self.jitter)
+
+    def write_time(self, nbytes):
+        return max(0.0, self.write + self.per_byte * nbytes + self._jitter())
+
+    def read_time(self, nbytes):
+        return max(0.0, self.read + self.per_byte * nbytes + self._jitter())
+
+    def scan_time(self):
+        return max(0.0, self.scan + self._jitter())
+
+
+# No latency at all, for the logic tests
+NO_LATENCY = LatencyModel()
+# Typical timings of a DG535 on a GPIB-USB adapter: a few ms of addressing per transaction,
+# slow byte handshake of the instrument, ~10 ms to build a reply and a bus enumeration
+# that polls the 30 primary addresses
+GPIB_TIMINGS = LatencyModel(write=4e-3, read=12e-3, per_byte=0.2e-3, jitter=1e-3, scan=0.3)
+
+
+def _timeout_error():
+    return pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_timeout)
+
+
+class SimulatedDG535:
+    """
+    A simulated DG535 with the interface of a pyvisa message based resource
+    (write, read, query, close, timeout, resource_name).
+    """
+
+    def __init__(self, resource_name=DEFAULT_ADDRESS, latency=NO_LATENCY, realtime=False):
+        self.resource_name = resource_name
+        self.latency = latency
+        self.realtime = realtime
+        self.timeout = 3000  # ms, like pyvisa
+        self.read_termination = "\r\n"
+        self.closed = False
+        # statistics of the traffic
+        self.transactions = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.elapsed = 0.0
+        self.triggers = 0
+        self._output = []
+        self.reset()
+        self.memory = {slot: None for slot in MEMORY_SLOTS}
+
+    def reset(self):
+        """Default settings of the instrument, also what RC 0 would give."""
+        self.trigger_mode = 0
+        self.trigger_rate = 10000.0
+        self.burst_rate = 10000.0
+        self.trigger_slope = 1
+        self.delays = {channel: (1, 0.0) for channel in DELAY_CHANNELS}
+        self.error_status = 0
+        self._output = []
+
+    def reset_statistics(self):
+        self.transactions = 0
+        self.bytes_written = 0
+        self.bytes_read = 0
+        self.elapsed = 0.0
+
+    # pyvisa resource interface
+
+    def _spend(self, seconds):
+        self.elapsed += seconds
+        if self.realtime and seconds:
+            time.sleep(seconds)
+
+    def write(self, message):
+        if self.closed:
+            raise pyvisa.errors.InvalidSession()
+        message = message.strip()
+        self.transactions += 1
+        self.bytes_written += len(message) + 2
+        self._spend(self.latency.write_time(len(message) + 2))
+        for command in message.split(";"):
+            if command.strip():
+                self.execute(command.strip())
+        return len(message)
+
+    def read(self):
+        if self.closed:
+            raise pyvisa.errors.InvalidSession()
+        if not self._output:
+            # nothing to send back: the controller waits for the whole VISA timeout
+            self._spend(self.timeout / 1000)
+            raise _timeout_error()
+        reply = self._output.pop(0) + self.read_termination
+        self.transactions += 1
+        self.bytes_read += len(reply)
+        self._spend(self.latency.read_time(len(reply)))
+        return reply
+
+    def query(self, message):
+        self.write(message)
+        return self.read()
+
+    def close(self):
+        self.closed = True
+
+    # Command interpreter
+
+    def _error(self, bit):
+        self.error_status |= bit
+
+    def _reply(self, text):
+        self._output.append(text)
+
+    def execute(self, command):
+        """Execute one command (no ";" inside)."""
+        mnemonic = command[:2].upper()
+        rest = command[2:].strip()
+        is_query_form = rest.startswith("?")
+        if is_query_form:
+            rest = rest[1:].strip()
+        args = [arg.strip() for arg in rest.split(",")] if rest else []
+        handler = getattr(self, f"_command_{mnemonic}", None)
+        if handler is None:
+            self._error(ERROR_UNRECOGNIZED_COMMAND)
+            return
+        try:
+            handler(args)
+        except (ValueError, IndexError):
+            self._error(ERROR_WRONG_PARAMETER_COUNT)
+
+    def _command_DT(self, args):
+        if not args or len(args) not in (1, 3):
+            self._error(ERROR_WRONG_PARAMETER_COUNT)
+            return
+        channel = int(args[0])
+        if channel not in DELAY_CHANNELS:
+            self._error(ERROR_VALUE_OUT_OF_RANGE)
+            return
+        if len(args) == 1:
+            reference, delay = self.delays[channel]
+            self._reply(f"{reference},{delay:+.12f}")
+            return
+        reference, delay = int(args[1]), float(args[2])
+        if reference not in REFERENCE_CHANNELS or reference == channel:
+            self._error(ERROR_VALUE_OUT_OF_RANGE)
+            return
+        if self._creates_loop(channel, reference):
+            self._error(ERROR_DELAY_LINKAGE)
+            return
+        if not -MAX_DELAY <= delay <= MAX_DELAY:
+            self._error(ERROR_DELAY_RANGE)
+            return
+        # the instrument rounds to its 5 ps resolution
+        self.delays[channel] = (reference, round(round(delay / 5e-12) * 5e-12, 12))
+
+    def _creates_loop(self, channel, reference):
+        while reference != 1:
+            if reference == channel:
+                return True
+            reference = self.delays[reference][0]
+        return False
+
+    def _command_TR(self, args):
+        which = int(args[0]) if args else 0
+        if which not in (0, 1) or len(args) > 2:
+            self._error(ERROR_VALUE_OUT_OF_RANGE)
+            return
+        if len(args) < 2:
+            self._reply(f"{self.trigger_rate if which == 0 else self.burst_rate:.3f}")
+            return
+        rate = float(args[1])
+        if not MIN_RATE <= rate <= INSTRUMENT_MAX_RATE:
+            self._error(ERROR_VALUE_OUT_OF_RANGE)
+            return
+        if which == 0:
+            self.trigger_rate = rate
+        else:
+            self.burst_rate = rate
+
+    def _command_TM(self, args):
+        if not args:
+            self._reply(f"{self.trigger_mode}")
+            return
+        mode = int(args[0])
+        if mode not in (0, 1, 2, 3):
+            self._error(ERROR_VALUE_OUT_OF_RANGE)
+            return
+        self.trigger_mode = mode
+
+    def _command_TS(self, args):
+        if not args:
+            self._reply(f"{self.trigger_slope}")
+            return
+        slope = int(args[0])
+        if slope not in (0, 1):
+            self._error(ERROR_VALUE_OUT_OF_RANGE)
+            return
+        self.trigger_slope = slope
+
+    def _command_SS(self, args):
+        if self.trigger_mode != 2:
+            self._error(ERROR_WRONG_MODE)
+            return
+        self.triggers += 1
+
+    def _settings(self):
+        return (self.trigger_mode, self.trigger_rate, self.burst_rate, self.trigger_slope, dict(self.delays))
+
+    def _command_ST(self, args):
+        slot = int(args[0])
+        if slot not in MEMORY_SLOTS:
+            self._error(ERROR_VALUE_OUT_OF_RANGE)
+            return
+        self.memory[slot] = self._settings()
+
+    def _command_RC(self, args):
+        slot = int(args[0])
+        if slot == 0:
+            errors = self.error_status
+            self.reset()
+            self.error_status = errors
+            return
+        if slot not in MEMORY_SLOTS:
+            self._error(ERROR_VALUE_OUT_OF_RANGE)
+            return
+        if self.memory[slot] is None:
+            self._error(ERROR_RECALLED_DATA_CORRUPT)
+            return
+        self.trigger_mode, self.trigger_rate, self.burst_rate, self.trigger_slope, delays = self.memory[slot]
+        self.delays = dict(delays)
+
+    def _command_CL(self, args):
+        self.error_status = 0
+        self._output = []
+
+    def _command_ES(self, args):
+        # reading the error status clears it
+        self._reply(f"{self.error_status}")
+        self.error_status = 0
+
+    def _command_IS(self, args):
+        self._reply(f"{STATUS_COMMAND_ERROR if self.error_status else 0}")
+
+
+class SimulatedResourceManager:
+    """
+    Stand-in for pyvisa.ResourceManager() with one or more simulated DG535.
+
+    @params addresses : GPIB addresses of the simulated instruments
+    @params latency, realtime : passed to every SimulatedDG535
+    """
+
+    def __init__(self, addresses=(DEFAULT_ADDRESS,), latency=NO_LATENCY, realtime=False):
+        self.latency = latency
+        self.realtime = realtime
+        self.instruments = {address: SimulatedDG535(address, latency, realtime) for address in addresses}
+        # bus enumerations done, and the time they took
+        self.scans = 0
+        self.elapsed = 0.0
+
+    def list_resources(self):
+        self.scans += 1
+        seconds = self.latency.scan_time()
+        self.elapsed += seconds
+        if self.realtime and seconds:
+            time.sleep(seconds)
+        return tuple(self.instruments)
+
+    def open_resource(self, address):
+        if address not in self.instruments:
+            raise pyvisa.errors.VisaIOError(pyvisa.constants.StatusCode.error_resource_not_found)
+        instrument = self.instruments[address]
+        instrument.closed = False
+        return instrument
+
+    def close(self):
+        for instrument in self.instruments.values():
+            instrument.close()
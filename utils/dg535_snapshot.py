@@ -0,0 +1,96 @@
+"""
+Last known settings of the DG535, kept on disk between runs.
+
+The interfaces save the cached state after every change and load it at startup,
+so the window shows the settings straight away. The instrument is read in the
+background afterwards and the settings that differ from the saved ones are reported.
+
+The file is JSON, written atomically:
+    {"saved_at": 1727700000.0, "address": "GPIB0::15::INSTR", "state": {...}}
+It is ~/.dg535/last_state.json unless the environment variable DG535_STATE_FILE is set.
+"""
+import json
+import operator
+import os
+import time
+
+from dg535_driver import CHANNEL_NAMES, DELAY_CHANNELS, DG535State, same_delay, same_rate
+
+
+def default_path():
+    return os.environ.get("DG535_STATE_FILE") or os.path.join(os.path.expanduser("~"), ".dg535", "last_state.json")
+
+
+def _changed(old, new, same):
+    if old is None or new is None:
+        return old != new
+    return not same(old, new)
+
+
+def _same_channel_delay(old, new):
+    return old[0] == new[0] and same_delay(old[1], new[1])
+
+
+def differences(expected, actual):
+    """
+    Settings of actual that differ from expected (two DG535State), as a list of
+    (setting, expected value, actual value). The delays are compared as (reference, delay).
+    """
+    settings = [("trigger mode", expected.trigger_mode, actual.trigger_mode, operator.eq),
+                ("trigger rate", expected.trigger_rate, actual.trigger_rate, same_rate),
+                ("trigger slope", expected.trigger_slope, actual.trigger_slope, operator.eq)]
+    settings += [(f"delay {CHANNEL_NAMES[channel]}", expected.delays[channel], actual.delays[channel], _same_channel_delay)
+                 for channel in DELAY_CHANNELS]
+    return [(name, old, new) for name, old, new, same in settings if _changed(old, new, same)]
+
+
+class StateSnapshot:
+    """
+    @params path : the file, default_path() if not given
+    After load(), state, address and saved_at are those of the file (None if there is none).
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_path()
+        self.state = None
+        self.address = None
+        self.saved_at = None
+        self._saved = None
+
+    def load(self):
+        """Read the file, returns the saved DG535State or None if there is none (or it is unreadable)."""
+        try:
+            with open(self.path) as file:
+                values = json.load(file)
+            self.state = DG535State.from_dict(values["state"])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        self.address = values.get("address")
+        self.saved_at = values.get("saved_at")
+        self._saved = values["state"]
+        return self.state
+
+    def update(self, dg535):
+        """Save the state cached by the driver if it changed since the last save, True if it was written."""
+        if not dg535.state.complete:
+            return False
+        values = dg535.state.as_dict()
+        if values == self._saved:
+            return False
+        self.save(dg535.state, dg535.address)
+        return True
+
+    def save(self, state, address=None):
+        values = state.as_dict()
+        saved_at = time.time()
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f"{self.path}.tmp"
+        with open(temporary, "w") as file:
+            json.dump({"saved_at": saved_at, "address": address, "state": values}, file, indent=2)
+        # the previous snapshot stays whole until the new one is complete
+        os.replace(temporary, self.path)
+        self._saved = values
+        self.saved_at = saved_at
+        self.address = address
@@ -0,0 +1,46 @@
+"""
+Startup timing of the interfaces.
+
+The heavy modules (matplotlib for the timing diagram, pyvisa for the bus) are not
+imported at startup but on first use, through timed_import(), which records how long
+each import took. The interfaces log these times with the moments their window
+appeared, so that a slow cold start can be traced to its module:
+
+    python utils/Interfacedg535.py
+    python -X importtime utils/Interfacedg535.py    # full import tree of the interpreter
+"""
+import importlib
+import sys
+import time
+
+
+# Taken when the interface imports this module, i.e. right at its start
+STARTED = time.perf_counter()
+
+# module name -> seconds spent importing it through timed_import
+IMPORT_TIMES = {}
+# event -> seconds since STARTED
+MILESTONES = {}
+
+
+def timed_import(name):
+    """Import the module name, the time is recorded if it was not loaded yet."""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    start = time.perf_counter()
+    module = importlib.import_module(name)
+    IMPORT_TIMES[name] = time.perf_counter() - start
+    return module
+
+
+def milestone(event):
+    """Record the first time event happens, returns the seconds since the start."""
+    return MILESTONES.setdefault(event, time.perf_counter() - STARTED)
+
+
+def report():
+    """Human readable import times and milestones."""
+    lines = [f"import {name:<20}{seconds * 1e3:>9.1f} ms" for name, seconds in IMPORT_TIMES.items()]
+    lines += [f"{event:<27}{seconds * 1e3:>9.1f} ms after start" for event, seconds in MILESTONES.items()]
+    return "\n".join(lines)
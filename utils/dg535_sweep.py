@@ -0,0 +1,146 @@
+"""
+Sweeps of the channel delays and of the internal trigger rate.
+
+A sweep plan is a grid of steps: for each swept parameter (a delay channel or the
+trigger rate) a NumPy array with one value per step, scalars being held constant.
+The whole plan is validated before anything is written, then every step is sent as
+a single message through the driver, which leaves out the parameters that did not
+change since the previous step. The steps are paced on absolute deadlines, so the
+dwell time does not drift with the bus time, and the moment each step was applied
+is logged.
+
+    plan = SweepPlan(delays={5: np.linspace(200e-6, 210e-6, 51), 6: 251e-6})
+    log = run_sweep(dg535, plan, dwell=0.05)
+    save_log(log, "sweep.csv")
+"""
+import time
+
+import numpy as np
+
+from dg535_constraints import T0, DelayGraph
+from dg535_driver import CHANNELS, CHANNEL_NAMES, DELAY_CHANNELS, MAX_DELAY, MAX_RATE, MIN_RATE, DG535Error
+
+
+# One row per step: when it was applied (epoch and seconds since the sweep start),
+# how long the write took and how many commands it sent
+LOG_DTYPE = np.dtype([("step", "i4"), ("timestamp", "f8"), ("elapsed", "f8"),
+                      ("write_time", "f8"), ("commands", "i2")])
+
+
+def _channel(channel):
+    """Delay channel given by number (2, 3, 5, 6) or name (A, B, C, D)."""
+    number = CHANNELS.get(channel, channel) if isinstance(channel, str) else channel
+    if number not in DELAY_CHANNELS:
+        raise DG535Error(f"Channel {channel} has no programmable delay")
+    return number
+
+
+class SweepPlan:
+    """
+    @params delays : {channel: values in seconds}, referred to T0
+    @params rates : internal trigger frequencies in Hz
+    Arrays must all have the same length (the number of steps), scalars are broadcast.
+    """
+
+    def __init__(self, delays=None, rates=None):
+        columns = {_channel(channel): np.asarray(values, dtype=float) for channel, values in (delays or {}).items()}
+        if rates is not None:
+            columns["rate"] = np.asarray(rates, dtype=float)
+        if not columns:
+            raise DG535Error("The sweep has nothing to change")
+        try:
+            arrays = np.broadcast_arrays(*(np.atleast_1d(values) for values in columns.values()))
+        except ValueError:
+            raise DG535Error("The swept values must have the same number of steps") from None
+        if arrays[0].ndim != 1:
+            raise DG535Error("The swept values must be one-dimensional")
+        self.columns = dict(zip(columns, arrays))
+
+    @classmethod
+    def grid(cls, delays=None, rates=None):
+        """Every combination of the given values, the last parameter changing fastest."""
+        axes = {_channel(channel): np.atleast_1d(np.asarray(values, dtype=float)) for channel, values in (delays or {}).items()}
+        if rates is not None:
+            axes["rate"] = np.atleast_1d(np.asarray(rates, dtype=float))
+        mesh = np.meshgrid(*axes.values(), indexing="ij")
+        columns = {key: values.ravel() for key, values in zip(axes, mesh)}
+        rates = columns.pop("rate", None)
+        return cls(delays=columns, rates=rates)
+
+    @property
+    def steps(self):
+        return len(next(iter(self.columns.values())))
+
+    @property
+    def delays(self):
+        return {key: values for key, values in self.columns.items() if key != "rate"}
+
+    @property
+    def rates(self):
+        return self.columns.get("rate")
+
+    def validate(self, state, ordered=True):
+        """
+        Check the whole plan before anything is written, raise DG535Error naming the first bad step.
+        Every step is checked on the reference graph of state (dg535_constraints.py): the channels
+        referred to a swept one move with it.
+        @params state : the cached DG535State, for the channels that are not swept
+        @params ordered : the delays must stay ordered A <= B <= C <= D, as the interfaces require
+        """
+        for key, values in self.columns.items():
+            name = "rate" if key == "rate" else f"channel {CHANNEL_NAMES[key]} delay"
+            low, high = (MIN_RATE, MAX_RATE) if key == "rate" else (0.0, MAX_DELAY)
+            bad = ~np.isfinite(values) | (values < low) | (values > high)
+            if bad.any():
+                step = int(np.argmax(bad))
+                raise DG535Error(f"Step {step}: {name} {values[step]} is out of [{low}, {high}]")
+        if any(state.delays[channel] is None for channel in DELAY_CHANNELS):
+            raise DG535Error("Read the settings of the DG535 before sweeping")
+        graph = DelayGraph.from_state(state)
+        delays = self.delays
+        rates = self.rates
+        for step in range(self.steps):
+            # run_sweep() refers the swept delays to T0
+            changes = {channel: (T0, float(values[step])) for channel, values in delays.items()}
+            rate = float(rates[step]) if rates is not None else None
+            _, problems = graph.what_if(changes, rate, ordered)
+            if problems:
+                raise DG535Error(f"Step {step}: {problems[0]}")
+
+
+def run_sweep(dg535, plan, dwell, stop=None, on_step=None, ordered=True):
+    """
+    Apply the plan step by step, one message per step, and wait dwell seconds on each.
+    @params stop : a threading.Event, the sweep ends after the current step when it is set
+    @params on_step : called as on_step(step, log_row) after each step is applied
+    Returns the log, a NumPy structured array of LOG_DTYPE with one row per applied step.
+    """
+    plan.validate(dg535.state, ordered)
+    delays = list(plan.delays.items())
+    rates = plan.rates
+    log = np.zeros(plan.steps, dtype=LOG_DTYPE)
+    start = time.monotonic()
+    for step in range(plan.steps):
+        if stop is not None and stop.is_set():
+            return log[:step]
+        before = time.perf_counter()
+        with dg535.batch():
+            # unchanged values are skipped by the setters
+            written = sum(dg535.set_delay(channel, values[step]) for channel, values in delays)
+            if rates is not None:
+                written += dg535.set_trigger_rate(rates[step])
+        now = time.monotonic()
+        log[step] = (step, time.time(), now - start, time.perf_counter() - before, written)
+        if on_step is not None:
+            on_step(step, log[step])
+        # wait on absolute deadlines, the time spent on the bus is not added to the dwell
+        remaining = start + (step + 1) * dwell - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+    return log
+
+
+def save_log(log, path):
+    """Save the log of a sweep as CSV."""
+    np.savetxt(path, log, delimiter=",", header=",".join(LOG_DTYPE.names), comments="",
+               fmt=["%d", "%.6f", "%.6f", "%.6f", "%d"])
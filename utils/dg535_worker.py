@@ -0,0 +1,154 @@
+"""
+Background I/O worker for the Tk interfaces.
+
+The worker thread owns the DG535: the interface submits requests to its queue and
+never touches the bus itself, the results come back through a second queue that
+is emptied on the Tk main thread by poll(), rescheduled with window.after().
+This way the window stays responsive while a transaction is slow or times out.
+WorkerBase holds what it shares with the Qt worker (dg535_qt_worker.py).
+
+    worker = DG535Worker()
+    worker.start()
+    worker.poll(window)
+    worker.submit(lambda dg535: dg535.set_delay(5, 250e-6), on_done=update_values)
+"""
+import queue
+import threading
+
+from dg535_driver import DG535, resource_manager
+from dg535_journal import journal_action
+
+
+class WorkerBase:
+    """
+    What the Tk and Qt workers share: the driver they own, given the journal, the history
+    and the snapshot, and the running of a request on their I/O thread. A worker calls
+    _setup() from its __init__ and implements submit() with _request().
+    """
+
+    def _setup(self, dg535, rm, snapshot, journal, history):
+        self.dg535 = dg535
+        self.rm = rm
+        self.snapshot = snapshot
+        self.journal = journal
+        self.history = history
+        if dg535 is not None:
+            self._attach(dg535)
+        # requests submitted and not delivered yet, only used on the interface thread
+        self.in_flight = 0
+
+    @property
+    def busy(self):
+        """True while a request is queued or running."""
+        return self.in_flight > 0
+
+    def _attach(self, dg535):
+        if self.journal is not None:
+            dg535.journal = self.journal
+        if self.history is not None:
+            dg535.history = self.history
+
+    def _save_snapshot(self):
+        if self.snapshot is None or self.dg535 is None:
+            return
+        try:
+            self.snapshot.update(self.dg535)
+        except OSError:
+            pass  # a read-only or full disk must not stop the worker, the next change tries again
+
+    @staticmethod
+    def _request(function, args, on_done, on_error, action):
+        """The request queued by submit(): action names it in the journal, the name of function by default."""
+        return function, args, action or getattr(function, "__name__", ""), on_done, on_error
+
+    def _execute(self, request):
+        """Run a request on the I/O thread, returns (callback, result) to deliver to the interface."""
+        function, args, action, on_done, on_error = request
+        try:
+            # the commands are journaled with the UI action that asked for them
+            with journal_action(action):
+                result = function(self.dg535, *args)
+        except Exception as e:
+            delivery = on_error, e
+        else:
+            delivery = on_done, result
+        self._save_snapshot()
+        return delivery
+
+    def _connect(self, dg535, address=None):
+        """Open the DG535 and read its settings. Returns (available devices, connected driver)."""
+        if self.dg535 is not None:
+            # the old session is closed, not left open on the bus until it is collected
+            self.dg535.close()
+            self.dg535 = None
+        if self.rm is None:
+            self.rm = resource_manager()
+        devices = self.rm.list_resources()
+        # without an address the driver takes the first GPIB device (find_gpib_devices)
+        dg535 = DG535(rm=self.rm).connect(address)
+        self._attach(dg535)
+        try:
+            dg535.refresh()
+        except Exception:
+            # a session whose settings could not be read is not handed to the interfaces
+            dg535.close()
+            raise
+        self.dg535 = dg535
+        return devices, dg535
+
+    def connect(self, address=None, on_done=None, on_error=None):
+        """Connect (or reconnect) on the I/O thread, the following requests use the new session."""
+        self.submit(self._connect, address, on_done=on_done, on_error=on_error, action="connect")
+
+
+class DG535Worker(WorkerBase, threading.Thread):
+    """
+    @params dg535 : an already connected driver (optional, connect() can be submitted later)
+    @params rm : the VISA resource manager (optional, created by the worker when needed)
+    @params snapshot : a StateSnapshot (dg535_snapshot.py), saved after every request that changed the settings
+    @params journal : a CommandJournal (dg535_journal.py) given to every driver the worker connects
+    @params history : a StateHistory (dg535_history.py) given to every driver the worker connects
+    """
+
+    def __init__(self, dg535=None, rm=None, snapshot=None, journal=None, history=None):
+        super().__init__(name="dg535-worker", daemon=True)
+        self._setup(dg535, rm, snapshot, journal, history)
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                break
+            self.results.put(self._execute(request))
+
+    def submit(self, function, *args, on_done=None, on_error=None, action=None):
+        """
+        Queue function(dg535, *args) for the worker thread.
+        on_done(result) or on_error(exception) are then called on the Tk thread by poll().
+        action names the request in the journal, the name of function by default.
+        """
+        self.in_flight += 1
+        self.requests.put(self._request(function, args, on_done, on_error, action))
+
+    def stop(self):
+        """Let the worker finish the queued requests and exit."""
+        self.requests.put(None)
+
+    @property
+    def pending(self):
+        """Number of requests still waiting for the worker."""
+        return self.requests.qsize()
+
+    def poll(self, window, interval=50):
+        """Deliver the results to their callbacks, every interval ms, on the Tk thread."""
+        while True:
+            try:
+                callback, result = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.in_flight -= 1
+            if callback is not None:
+                callback(result)
+        window.after(interval, self.poll, window, interval)